@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.baseline import compare_results, create_baseline, get_environment, get_environment_differences, load_baseline, save_baseline
+from benchmarks.suite import clean_workspace, create_cases, create_workspace, run_cases
+
+
+def parse_args() -> argparse.Namespace:
+    program = argparse.ArgumentParser(prog='python -m benchmarks', formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=100))
+    program.add_argument('--workspace', help='directory for stand-in models and synthetic media', dest='workspace', default=os.path.join(tempfile.gettempdir(), 'roop-benchmarks'))
+    program.add_argument('--filter', help='only run cases whose name contains one of these', dest='filter', nargs='+')
+    program.add_argument('--repeat', help='measured iterations per case', dest='repeat', type=int, default=10)
+    program.add_argument('--warmup', help='unmeasured iterations per case', dest='warmup', type=int, default=2)
+    program.add_argument('--width', help='width of the synthetic media', dest='width', type=int, default=1280)
+    program.add_argument('--height', help='height of the synthetic media', dest='height', type=int, default=720)
+    program.add_argument('--fps', help='fps of the synthetic video', dest='fps', type=int, default=30)
+    program.add_argument('--frames', help='frames of the synthetic video', dest='frame_total', type=int, default=60)
+    program.add_argument('--faces', help='faces per synthetic frame', dest='face_total', type=int, default=2)
+    program.add_argument('--temp-frame-format', help='image format used for frame extraction', dest='temp_frame_format', default='png', choices=['jpg', 'png'])
+    program.add_argument('--output', help='write results as a baseline json to this file', dest='output_path')
+    program.add_argument('--compare', help='compare results against this baseline and fail on regressions', dest='baseline_path')
+    program.add_argument('--threshold', help='relative change counted as a regression', dest='threshold', type=float, default=0.1)
+    program.add_argument('--noise-factor', help='robust deviations a change must exceed to count', dest='noise_factor', type=float, default=3.0)
+    return program.parse_args()
+
+
+def report(result: Dict[str, Any]) -> None:
+    print(f"[ROOP.BENCHMARK] {result['name']:<28} median {result['median'] * 1000:9.2f}ms  p95 {result['p95'] * 1000:9.2f}ms  {result['items_per_second']:9.2f} items/s")
+
+
+def report_comparison(comparison: Dict[str, Any]) -> None:
+    verdict = 'REGRESSED' if comparison['regressed'] else 'improved' if comparison['improved'] else 'ok'
+    print(f"[ROOP.BENCHMARK] {comparison['name']:<28} {comparison['metric']:<16} {comparison['baseline']:12.4g} -> {comparison['current']:12.4g} ({comparison['change']:+.1%}) {verdict}")
+
+
+def run() -> List[Dict[str, Any]]:
+    args = parse_args()
+    baseline = load_baseline(args.baseline_path) if args.baseline_path else None
+    workspace = create_workspace(args.workspace, args.width, args.height, args.fps, args.frame_total, args.face_total, args.temp_frame_format)
+    cases = [case for case in create_cases(workspace) if not args.filter or any(name in case.name for name in args.filter)]
+    try:
+        results = run_cases(cases, args.repeat, args.warmup, report)
+    finally:
+        clean_workspace(workspace)
+    settings = {key: value for key, value in vars(args).items() if key not in ('output_path', 'baseline_path', 'workspace', 'filter', 'threshold', 'noise_factor')}
+    if args.output_path:
+        save_baseline(args.output_path, create_baseline(settings, results))
+    if baseline:
+        for difference in get_environment_differences(baseline['environment'], get_environment()):
+            print(f'[ROOP.BENCHMARK] Environment differs from baseline in {difference}')
+        if baseline['settings'] != settings:
+            print('[ROOP.BENCHMARK] Settings differ from baseline, comparison may not be meaningful')
+        comparisons = compare_results(baseline, results, args.threshold, args.noise_factor)
+        for comparison in comparisons:
+            report_comparison(comparison)
+        if any(comparison['regressed'] for comparison in comparisons):
+            sys.exit(1)
+    return results
+
+
+if __name__ == '__main__':
+    run()
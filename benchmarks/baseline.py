@@ -0,0 +1,135 @@
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import roop.globals
+import roop.metadata
+
+BASELINE_VERSION = 1
+LIBRARIES = ('numpy', 'cv2', 'onnx', 'onnxruntime', 'insightface', 'tensorflow', 'torch', 'gfpgan')
+METRIC_DIRECTIONS = {
+    'items_per_second': 1,
+    'startup': -1,
+    'peak_rss': -1
+}
+MAD_SCALE = 1.4826
+
+
+def get_cpu_model() -> str:
+    try:
+        with open('/proc/cpuinfo') as cpuinfo_file:
+            for line in cpuinfo_file:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def get_library_versions() -> Dict[str, Optional[str]]:
+    versions: Dict[str, Optional[str]] = {}
+    for library in LIBRARIES:
+        try:
+            versions[library] = getattr(importlib.import_module(library), '__version__', 'unknown')
+        except ImportError:
+            versions[library] = None
+    return versions
+
+
+def get_ffmpeg_version() -> Optional[str]:
+    try:
+        return subprocess.check_output(['ffmpeg', '-version']).decode().splitlines()[0]
+    except (OSError, subprocess.CalledProcessError, IndexError):
+        return None
+
+
+def get_environment() -> Dict[str, Any]:
+    try:
+        import onnxruntime
+        available_providers = onnxruntime.get_available_providers()
+    except ImportError:
+        available_providers = []
+    return {
+        'cpu_model': get_cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'roop': roop.metadata.version,
+        'available_providers': available_providers,
+        'execution_providers': roop.globals.execution_providers,
+        'execution_threads': roop.globals.execution_threads,
+        'libraries': get_library_versions(),
+        'ffmpeg': get_ffmpeg_version()
+    }
+
+
+def create_baseline(settings: Dict[str, Any], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'version': BASELINE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': get_environment(),
+        'settings': settings,
+        'results': results
+    }
+
+
+def save_baseline(baseline_path: str, baseline: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+    with open(baseline_path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+
+def load_baseline(baseline_path: str) -> Dict[str, Any]:
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Baseline {baseline_path} has version {baseline.get('version')}, expected {BASELINE_VERSION}")
+    return baseline
+
+
+def get_environment_differences(baseline_environment: Dict[str, Any], environment: Dict[str, Any]) -> List[str]:
+    return [key for key in sorted(set(baseline_environment) | set(environment)) if baseline_environment.get(key) != environment.get(key)]
+
+
+def get_robust_spread(samples: List[float]) -> float:
+    if len(samples) < 2:
+        return 0.0
+    median = statistics.median(samples)
+    return MAD_SCALE * statistics.median([abs(sample - median) for sample in samples])
+
+
+def compare_metric(baseline_samples: List[float], samples: List[float], direction: int, threshold: float, noise_factor: float) -> Dict[str, Any]:
+    baseline_median = statistics.median(baseline_samples)
+    median = statistics.median(samples)
+    change = (median - baseline_median) / baseline_median if baseline_median else 0.0
+    noise = noise_factor * max(get_robust_spread(baseline_samples), get_robust_spread(samples))
+    significant = abs(median - baseline_median) > noise
+    return {
+        'baseline': baseline_median,
+        'current': median,
+        'change': change,
+        'noise': noise,
+        'regressed': significant and change * direction < -threshold,
+        'improved': significant and change * direction > threshold
+    }
+
+
+def compare_results(baseline: Dict[str, Any], results: List[Dict[str, Any]], threshold: float = 0.1, noise_factor: float = 3.0) -> List[Dict[str, Any]]:
+    baseline_results = {result['name']: result for result in baseline['results']}
+    comparisons = []
+    for result in results:
+        baseline_result = baseline_results.get(result['name'])
+        if not baseline_result:
+            continue
+        for metric, direction in METRIC_DIRECTIONS.items():
+            baseline_samples = baseline_result.get('samples', {}).get(metric)
+            samples = result.get('samples', {}).get(metric)
+            if baseline_samples and samples:
+                comparisons.append({'name': result['name'], 'metric': metric, **compare_metric(baseline_samples, samples, direction, threshold, noise_factor)})
+    return comparisons
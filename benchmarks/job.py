@@ -0,0 +1,31 @@
+import argparse
+import json
+import resource
+import sys
+import time
+
+
+def run() -> None:
+    started_at = time.perf_counter()
+    program = argparse.ArgumentParser(prog='python -m benchmarks.job')
+    program.add_argument('--workspace', dest='workspace', required=True)
+    program.add_argument('--frame-processor', dest='frame_processor', default=['face_swapper'], nargs='+')
+    args = program.parse_args()
+
+    import roop.core
+    import roop.globals
+    from benchmarks.suite import load_workspace
+    workspace = load_workspace(args.workspace)
+    roop.globals.frame_processors = args.frame_processor
+    roop.core.get_frame_processors_modules(roop.globals.frame_processors)
+    startup = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    roop.core.start()
+    duration = time.perf_counter() - started_at
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    print(json.dumps({'startup': startup, 'duration': duration, 'frame_total': workspace['frame_total'], 'peak_rss': peak_rss}))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,55 @@
+import os
+import subprocess
+from typing import List, Tuple
+
+import cv2
+import numpy
+
+from benchmarks.standins import DETECTOR_FIRING_STRIDE, FACE_SIZE
+from roop.typing import Frame
+
+DETECTOR_SIZE = 640
+
+
+def get_face_positions(width: int, height: int, face_total: int) -> List[Tuple[int, int, int]]:
+    scale = max(width, height) / DETECTOR_SIZE
+    cell_size = int(DETECTOR_FIRING_STRIDE * scale)
+    face_size = int(FACE_SIZE * scale)
+    spacing = face_size * 4
+    columns = max(1, (width - face_size) // spacing)
+    positions = []
+    for index in range(face_total):
+        column, row = index % columns, index // columns
+        start_x = (cell_size * 2 + column * spacing) // cell_size * cell_size
+        start_y = (cell_size * 2 + row * spacing) // cell_size * cell_size
+        if start_x + face_size <= width and start_y + face_size <= height:
+            positions.append((start_x, start_y, face_size))
+    return positions
+
+
+def create_frame(width: int, height: int, face_total: int, seed: int = 0) -> Frame:
+    random = numpy.random.default_rng(seed)
+    frame = random.integers(0, 60, (height, width, 3), dtype=numpy.uint8)
+    for start_x, start_y, face_size in get_face_positions(width, height, face_total):
+        frame[start_y:start_y + face_size, start_x:start_x + face_size] = 255
+    return frame
+
+
+def create_image(image_path: str, width: int, height: int, face_total: int) -> str:
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    cv2.imwrite(image_path, create_frame(width, height, face_total))
+    return image_path
+
+
+def create_video(video_path: str, width: int, height: int, fps: int, frame_total: int, face_total: int) -> str:
+    os.makedirs(os.path.dirname(video_path), exist_ok=True)
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={frame_total / fps}', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', '-y', video_path]
+    process = subprocess.Popen(commands, stdin=subprocess.PIPE)
+    for frame_number in range(frame_total):
+        frame = create_frame(width, height, face_total, frame_number % 8)
+        process.stdin.write(frame.tobytes())
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f'Could not create synthetic video {video_path}')
+    return video_path
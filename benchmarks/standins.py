@@ -0,0 +1,180 @@
+import os
+from types import SimpleNamespace
+from typing import Any, List, Tuple
+
+import cv2
+import numpy
+import onnx
+import onnxruntime
+from onnx import TensorProto, helper, numpy_helper
+
+import roop.globals
+import roop.face_analyser
+import roop.processors.frame.face_enhancer as face_enhancer
+import roop.processors.frame.face_swapper as face_swapper
+from roop.typing import Frame
+
+STANDIN_NAME = 'standin'
+DETECTOR_STRIDES = (8, 16, 32)
+DETECTOR_FIRING_STRIDE = 16
+DETECTOR_ANCHORS = 2
+DETECTOR_BOX_DISTANCE = 6.0
+DETECTOR_KEYPOINTS = ((-1.0, -1.0), (1.0, -1.0), (0.0, 0.0), (-0.8, 1.0), (0.8, 1.0))
+FACE_SIZE = 48
+OPSET_VERSION = 13
+IR_VERSION = 8
+
+
+def get_standin_directory(root_directory: str) -> str:
+    return os.path.join(root_directory, 'models', STANDIN_NAME)
+
+
+def get_inswapper_path(root_directory: str) -> str:
+    return os.path.join(root_directory, 'inswapper_128.onnx')
+
+
+def get_enhancer_path(root_directory: str) -> str:
+    return os.path.join(root_directory, 'gfpgan_512.onnx')
+
+
+def save_model(graph: Any, model_path: str) -> None:
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', OPSET_VERSION)])
+    model.ir_version = IR_VERSION
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    onnx.save(model, model_path)
+
+
+def create_detector(model_path: str) -> None:
+    nodes: List[Any] = []
+    initializers: List[Any] = []
+    outputs: List[Any] = []
+    branches: List[Tuple[str, int, Any, Any]] = []
+    for stride in DETECTOR_STRIDES:
+        patch_mean = numpy.full((DETECTOR_ANCHORS, 3, stride, stride), 20.0 / (3 * stride * stride), dtype=numpy.float32)
+        score_bias = numpy.full(DETECTOR_ANCHORS, -18.0 if stride == DETECTOR_FIRING_STRIDE else -100.0, dtype=numpy.float32)
+        box_bias = numpy.full(DETECTOR_ANCHORS * 4, DETECTOR_BOX_DISTANCE, dtype=numpy.float32)
+        keypoint_bias = numpy.array([value for _ in range(DETECTOR_ANCHORS) for point in DETECTOR_KEYPOINTS for value in point], dtype=numpy.float32)
+        branches.append(('score', 1, patch_mean, score_bias))
+        branches.append(('box', 4, numpy.zeros((DETECTOR_ANCHORS * 4, 3, stride, stride), dtype=numpy.float32), box_bias))
+        branches.append(('kps', 10, numpy.zeros((DETECTOR_ANCHORS * 10, 3, stride, stride), dtype=numpy.float32), keypoint_bias))
+    ordered_branches = [branch for kind in ('score', 'box', 'kps') for branch in branches if branch[0] == kind]
+    for index, (kind, width, weight, bias) in enumerate(ordered_branches):
+        stride = weight.shape[2]
+        prefix = f'{kind}_{stride}'
+        initializers.append(numpy_helper.from_array(weight, prefix + '_weight'))
+        initializers.append(numpy_helper.from_array(bias, prefix + '_bias'))
+        initializers.append(numpy_helper.from_array(numpy.array([-1, width], dtype=numpy.int64), prefix + '_shape'))
+        nodes.append(helper.make_node('Conv', ['input.1', prefix + '_weight', prefix + '_bias'], [prefix + '_conv'], strides=[stride, stride]))
+        nodes.append(helper.make_node('Transpose', [prefix + '_conv'], [prefix + '_transpose'], perm=[0, 2, 3, 1]))
+        output_name = prefix + ('_reshape' if kind == 'score' else '')
+        nodes.append(helper.make_node('Reshape', [prefix + '_transpose', prefix + '_shape'], [output_name]))
+        if kind == 'score':
+            nodes.append(helper.make_node('Sigmoid', [output_name], [prefix]))
+        outputs.append(helper.make_tensor_value_info(prefix, TensorProto.FLOAT, ['anchors', width]))
+    inputs = [helper.make_tensor_value_info('input.1', TensorProto.FLOAT, [1, 3, 'height', 'width'])]
+    save_model(helper.make_graph(nodes, 'standin_detector', inputs, outputs, initializers), model_path)
+
+
+def create_recognizer(model_path: str) -> None:
+    random = numpy.random.default_rng(0)
+    initializers = [
+        numpy_helper.from_array(random.normal(0, 0.05, (16, 3, 8, 8)).astype(numpy.float32), 'conv_weight'),
+        numpy_helper.from_array(numpy.zeros(16, dtype=numpy.float32), 'conv_bias'),
+        numpy_helper.from_array(random.normal(0, 0.05, (16 * 14 * 14, 512)).astype(numpy.float32), 'fc_weight'),
+        numpy_helper.from_array(numpy.zeros(512, dtype=numpy.float32), 'fc_bias')
+    ]
+    nodes = [
+        helper.make_node('Conv', ['input.1', 'conv_weight', 'conv_bias'], ['conv'], strides=[8, 8]),
+        helper.make_node('Relu', ['conv'], ['relu']),
+        helper.make_node('Flatten', ['relu'], ['flatten']),
+        helper.make_node('Gemm', ['flatten', 'fc_weight', 'fc_bias'], ['683'])
+    ]
+    inputs = [helper.make_tensor_value_info('input.1', TensorProto.FLOAT, [1, 3, 112, 112])]
+    outputs = [helper.make_tensor_value_info('683', TensorProto.FLOAT, [1, 512])]
+    save_model(helper.make_graph(nodes, 'standin_recognizer', inputs, outputs, initializers), model_path)
+
+
+def create_inswapper(model_path: str) -> None:
+    random = numpy.random.default_rng(1)
+    initializers = [
+        numpy_helper.from_array(random.normal(0, 0.1, (3, 3, 3, 3)).astype(numpy.float32), 'conv_weight'),
+        numpy_helper.from_array(numpy.zeros(3, dtype=numpy.float32), 'conv_bias'),
+        numpy_helper.from_array(random.normal(0, 0.05, (512, 3)).astype(numpy.float32), 'latent_weight'),
+        numpy_helper.from_array(numpy.array([1, 3, 1, 1], dtype=numpy.int64), 'latent_shape'),
+        numpy_helper.from_array(random.normal(0, 0.05, (512, 512)).astype(numpy.float32), 'emap')
+    ]
+    nodes = [
+        helper.make_node('Conv', ['target', 'conv_weight', 'conv_bias'], ['conv'], pads=[1, 1, 1, 1]),
+        helper.make_node('MatMul', ['source', 'latent_weight'], ['latent']),
+        helper.make_node('Reshape', ['latent', 'latent_shape'], ['latent_reshape']),
+        helper.make_node('Add', ['conv', 'latent_reshape'], ['add']),
+        helper.make_node('Sigmoid', ['add'], ['output'])
+    ]
+    inputs = [
+        helper.make_tensor_value_info('target', TensorProto.FLOAT, [1, 3, 128, 128]),
+        helper.make_tensor_value_info('source', TensorProto.FLOAT, [1, 512])
+    ]
+    outputs = [helper.make_tensor_value_info('output', TensorProto.FLOAT, [1, 3, 128, 128])]
+    save_model(helper.make_graph(nodes, 'standin_inswapper', inputs, outputs, initializers), model_path)
+
+
+def create_enhancer(model_path: str) -> None:
+    random = numpy.random.default_rng(2)
+    initializers = [
+        numpy_helper.from_array(random.normal(0, 0.1, (3, 3, 3, 3)).astype(numpy.float32), 'conv_weight'),
+        numpy_helper.from_array(numpy.zeros(3, dtype=numpy.float32), 'conv_bias')
+    ]
+    nodes = [
+        helper.make_node('Conv', ['input', 'conv_weight', 'conv_bias'], ['conv'], pads=[1, 1, 1, 1]),
+        helper.make_node('Tanh', ['conv'], ['output'])
+    ]
+    inputs = [helper.make_tensor_value_info('input', TensorProto.FLOAT, [1, 3, 512, 512])]
+    outputs = [helper.make_tensor_value_info('output', TensorProto.FLOAT, [1, 3, 512, 512])]
+    save_model(helper.make_graph(nodes, 'standin_gfpgan', inputs, outputs, initializers), model_path)
+
+
+def create_standins(root_directory: str) -> None:
+    standin_directory = get_standin_directory(root_directory)
+    if not os.path.isfile(os.path.join(standin_directory, 'det_10g.onnx')):
+        create_detector(os.path.join(standin_directory, 'det_10g.onnx'))
+    if not os.path.isfile(os.path.join(standin_directory, 'w600k_r50.onnx')):
+        create_recognizer(os.path.join(standin_directory, 'w600k_r50.onnx'))
+    if not os.path.isfile(get_inswapper_path(root_directory)):
+        create_inswapper(get_inswapper_path(root_directory))
+    if not os.path.isfile(get_enhancer_path(root_directory)):
+        create_enhancer(get_enhancer_path(root_directory))
+
+
+def create_standin_enhancer(model_path: str) -> SimpleNamespace:
+    session = onnxruntime.InferenceSession(model_path, providers=roop.globals.execution_providers)
+
+    def enhance(temp_face: Frame, has_aligned: bool = False, only_center_face: bool = False, paste_back: bool = True, weight: float = 0.5) -> Tuple[List[Frame], List[Frame], Frame]:
+        height, width = temp_face.shape[:2]
+        blob = cv2.dnn.blobFromImage(temp_face, 1.0 / 127.5, (512, 512), (127.5, 127.5, 127.5), swapRB=True)
+        output = session.run(None, {'input': blob})[0][0].transpose(1, 2, 0)
+        restored_face = numpy.clip((output + 1) * 127.5, 0, 255).astype(numpy.uint8)[:, :, ::-1]
+        return [], [], cv2.resize(restored_face, (width, height))
+
+    return SimpleNamespace(enhance=enhance)
+
+
+def install_standins(root_directory: str) -> None:
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo import get_model
+
+    create_standins(root_directory)
+    if not roop.globals.execution_providers:
+        roop.globals.execution_providers = ['CPUExecutionProvider']
+    face_analyser = FaceAnalysis(name=STANDIN_NAME, root=root_directory, providers=roop.globals.execution_providers)
+    face_analyser.prepare(ctx_id=0, det_size=(640, 640))
+    roop.face_analyser.FACE_ANALYSER = face_analyser
+    face_swapper.FACE_SWAPPER = get_model(get_inswapper_path(root_directory), providers=roop.globals.execution_providers)
+    face_enhancer.GFPGAN_AVAILABLE = True
+    face_enhancer.FACE_ENHANCER = create_standin_enhancer(get_enhancer_path(root_directory))
+
+
+def uninstall_standins() -> None:
+    roop.face_analyser.clear_face_analyser()
+    face_swapper.clear_face_swapper()
+    face_enhancer.clear_face_enhancer()
@@ -0,0 +1,231 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import cv2
+
+import roop.globals
+import roop.probe
+from benchmarks import media, standins
+from roop.face_analyser import get_many_faces, get_one_face
+from roop.processors.frame import face_enhancer, face_swapper
+from roop.processors.frame.face_enhancer import enhance_face
+from roop.processors.frame.face_swapper import swap_face
+from roop.utilities import clean_temp, create_temp, create_video, detect_fps, extract_frames, get_temp_directory_path, get_temp_frame_paths, get_temp_output_path, restore_audio
+
+Samples = Dict[str, List[float]]
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    items: int = 1
+    prepare: Optional[Callable[[], Any]] = None
+    measure: Optional[Callable[[int, int], Samples]] = None
+
+
+def configure_globals(workspace: Dict[str, Any]) -> None:
+    roop.globals.source_path = workspace['source_path']
+    roop.globals.target_path = workspace['target_path']
+    roop.globals.output_path = os.path.join(workspace['directory'], 'output.mp4')
+    roop.globals.headless = True
+    roop.globals.keep_fps = True
+    roop.globals.keep_frames = False
+    roop.globals.skip_audio = False
+    roop.globals.many_faces = False
+    roop.globals.reference_face_position = 0
+    roop.globals.reference_frame_number = 0
+    roop.globals.similar_face_distance = 0.85
+    roop.globals.temp_frame_format = workspace['temp_frame_format']
+    roop.globals.temp_frame_quality = 0
+    roop.globals.output_video_encoder = 'libx264'
+    roop.globals.output_video_quality = 35
+    if not roop.globals.execution_providers:
+        roop.globals.execution_providers = ['CPUExecutionProvider']
+    if not roop.globals.execution_threads:
+        roop.globals.execution_threads = 1
+
+
+def create_workspace(directory: str, width: int, height: int, fps: int, frame_total: int, face_total: int, temp_frame_format: str) -> Dict[str, Any]:
+    os.makedirs(directory, exist_ok=True)
+    roop.probe.PROBE_CACHE_DIRECTORY = os.path.join(directory, 'probe')
+    standins.install_standins(os.path.join(directory, 'standins'))
+    settings = {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'frame_total': frame_total,
+        'face_total': face_total,
+        'temp_frame_format': temp_frame_format
+    }
+    settings_path = os.path.join(directory, 'settings.json')
+    target_path = os.path.join(directory, 'target.mp4')
+    if not os.path.isfile(target_path) or load_settings(directory) != settings:
+        media.create_video(target_path, width, height, fps, frame_total, face_total)
+        with open(settings_path, 'w') as settings_file:
+            json.dump(settings, settings_file)
+    workspace = {
+        **settings,
+        'directory': directory,
+        'source_path': media.create_image(os.path.join(directory, 'source.png'), width, height, 1),
+        'target_path': target_path,
+        'frame': media.create_frame(width, height, face_total)
+    }
+    configure_globals(workspace)
+    workspace['source_face'] = get_one_face(cv2.imread(workspace['source_path']))
+    workspace['target_faces'] = get_many_faces(workspace['frame']) or []
+    return workspace
+
+
+def load_settings(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, 'settings.json')) as settings_file:
+            return json.load(settings_file)
+    except (OSError, ValueError):
+        return None
+
+
+def load_workspace(directory: str) -> Dict[str, Any]:
+    settings = load_settings(directory)
+    if settings is None:
+        raise FileNotFoundError(f'No benchmark workspace in {directory}')
+    return create_workspace(directory, **settings)
+
+
+def create_cases(workspace: Dict[str, Any]) -> List[Case]:
+    frame = workspace['frame']
+    source_face = workspace['source_face']
+    target_faces = workspace['target_faces']
+    target_path = workspace['target_path']
+    output_path = roop.globals.output_path
+    fps = workspace['fps']
+    frame_total = workspace['frame_total']
+    frame_directory = os.path.join(workspace['directory'], 'frames')
+    pristine_directory = os.path.join(workspace['directory'], 'pristine')
+    os.makedirs(frame_directory, exist_ok=True)
+    png_path = os.path.join(frame_directory, 'frame.png')
+    jpg_path = os.path.join(frame_directory, 'frame.jpg')
+    cv2.imwrite(png_path, frame)
+    cv2.imwrite(jpg_path, frame)
+
+    def swap_faces() -> None:
+        temp_frame = frame.copy()
+        for target_face in target_faces:
+            temp_frame = swap_face(source_face, target_face, temp_frame)
+
+    def enhance_faces() -> None:
+        temp_frame = frame.copy()
+        for target_face in target_faces:
+            temp_frame = enhance_face(target_face, temp_frame)
+
+    def prepare_extract_frames() -> None:
+        shutil.rmtree(get_temp_directory_path(target_path), ignore_errors=True)
+        create_temp(target_path)
+
+    def prepare_frames() -> None:
+        if not os.path.isdir(pristine_directory):
+            prepare_extract_frames()
+            extract_frames(target_path, fps)
+            shutil.copytree(get_temp_directory_path(target_path), pristine_directory)
+        shutil.rmtree(get_temp_directory_path(target_path), ignore_errors=True)
+        shutil.copytree(pristine_directory, get_temp_directory_path(target_path))
+
+    def prepare_temp_video() -> None:
+        if not os.path.isfile(get_temp_output_path(target_path)):
+            prepare_frames()
+            create_video(target_path, fps)
+
+    def prepare_detect_fps() -> None:
+        roop.probe.clear_probe_cache()
+        shutil.rmtree(roop.probe.PROBE_CACHE_DIRECTORY, ignore_errors=True)
+
+    def process_video(frame_processor: Any) -> Callable[[], None]:
+        def run() -> None:
+            frame_processor.process_video(roop.globals.source_path, get_temp_frame_paths(target_path))
+        return run
+
+    return [
+        Case('get_many_faces', lambda: get_many_faces(frame)),
+        Case('swap_face', swap_faces, max(len(target_faces), 1)),
+        Case('enhance_face', enhance_faces, max(len(target_faces), 1)),
+        Case('temp_frame_write_png', lambda: cv2.imwrite(png_path, frame)),
+        Case('temp_frame_read_png', lambda: cv2.imread(png_path)),
+        Case('temp_frame_write_jpg', lambda: cv2.imwrite(jpg_path, frame)),
+        Case('temp_frame_read_jpg', lambda: cv2.imread(jpg_path)),
+        Case('detect_fps', lambda: detect_fps(target_path), 1, prepare_detect_fps),
+        Case('extract_frames', lambda: extract_frames(target_path, fps), frame_total, prepare_extract_frames),
+        Case('create_video', lambda: create_video(target_path, fps), frame_total, prepare_frames),
+        Case('restore_audio', lambda: restore_audio(target_path, output_path), frame_total, prepare_temp_video),
+        Case('process_video_face_swapper', process_video(face_swapper), frame_total, prepare_frames),
+        Case('process_video_face_enhancer', process_video(face_enhancer), frame_total, prepare_frames),
+        Case('core_start', lambda: None, frame_total, None, lambda repeat, warmup: measure_job(workspace, ['face_swapper'], repeat, warmup)),
+        Case('core_start_enhanced', lambda: None, frame_total, None, lambda repeat, warmup: measure_job(workspace, ['face_swapper', 'face_enhancer'], repeat, warmup))
+    ]
+
+
+def measure_case(case: Case, repeat: int, warmup: int) -> Samples:
+    if case.measure:
+        return case.measure(repeat, warmup)
+    timings = []
+    for iteration in range(warmup + repeat):
+        if case.prepare:
+            case.prepare()
+        start_time = time.perf_counter()
+        case.run()
+        elapsed = time.perf_counter() - start_time
+        if iteration >= warmup:
+            timings.append(elapsed)
+    return {'seconds': timings}
+
+
+def measure_job(workspace: Dict[str, Any], frame_processors: List[str], repeat: int, warmup: int) -> Samples:
+    samples: Samples = {'seconds': [], 'startup': [], 'peak_rss': []}
+    commands = [sys.executable, '-m', 'benchmarks.job', '--workspace', workspace['directory'], '--frame-processor', *frame_processors]
+    for iteration in range(warmup + repeat):
+        shutil.rmtree(get_temp_directory_path(workspace['target_path']), ignore_errors=True)
+        output = subprocess.check_output(commands, stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        job = json.loads(output.decode().strip().splitlines()[-1])
+        if iteration >= warmup:
+            samples['seconds'].append(job['duration'])
+            samples['startup'].append(job['startup'])
+            samples['peak_rss'].append(job['peak_rss'])
+    return samples
+
+
+def summarize_case(case: Case, samples: Samples) -> Dict[str, Any]:
+    timings = sorted(samples['seconds'])
+    median = statistics.median(timings)
+    samples = {**samples, 'items_per_second': [case.items / timing for timing in samples['seconds'] if timing]}
+    return {
+        'name': case.name,
+        'iterations': len(timings),
+        'items': case.items,
+        'min': timings[0],
+        'median': median,
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'p95': timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        'items_per_second': case.items / median if median else 0.0,
+        'samples': samples
+    }
+
+
+def run_cases(cases: List[Case], repeat: int, warmup: int, report: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    results = []
+    for case in cases:
+        result = summarize_case(case, measure_case(case, repeat, warmup))
+        results.append(result)
+        if report:
+            report(result)
+    return results
+
+
+def clean_workspace(workspace: Dict[str, Any]) -> None:
+    clean_temp(workspace['target_path'])
+    if os.path.isfile(roop.globals.output_path):
+        os.remove(roop.globals.output_path)
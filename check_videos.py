@@ -1,110 +1,215 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
+import sys
 import json
+import argparse
+import subprocess
+import tempfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from roop.probe import probe_media
+
+VERDICTS_FILENAME = ".video_verdicts.json"
+DECODE_MODES = ["none", "keyframes", "full"]
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv']
 
 def check_video_validity(video_path):
     """Check if a video is valid for processing"""
-    try:
-        # Use ffprobe to get video information
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', video_path
-        ]
+    probe = probe_media(video_path)
+    if probe is None:
+        return False, "FFprobe error: unreadable media"
 
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
+    if not probe['is_video']:
+        return False, "No video stream found"
 
-        # Extract video information
-        format_info = data.get('format', {})
-        video_streams = [s for s in data.get('streams', []) if s.get('codec_type') == 'video']
+    duration = probe['duration']
+    size = probe['size']
+    width = probe['width']
+    height = probe['height']
+    frame_count = probe['frame_total']
 
-        if not video_streams:
-            return False, "No video stream found"
+    # Validation criteria
+    if size < 100000:  # Less than 100KB
+        return False, f"File too small: {size} bytes"
 
-        video_stream = video_streams[0]
+    if duration < 0.5:  # Less than 0.5 seconds
+        return False, f"Duration too short: {duration:.2f}s"
 
-        duration = float(format_info.get('duration', 0))
-        size = int(format_info.get('size', 0))
-        width = int(video_stream.get('width', 0))
-        height = int(video_stream.get('height', 0))
-        frame_count = video_stream.get('nb_frames')
+    if width < 100 or height < 100:
+        return False, f"Resolution too low: {width}x{height}"
 
-        # Validation criteria
-        if size < 100000:  # Less than 100KB
-            return False, f"File too small: {size} bytes"
+    if frame_count and frame_count < 10:
+        return False, f"Too few frames: {frame_count}"
 
-        if duration < 0.5:  # Less than 0.5 seconds
-            return False, f"Duration too short: {duration:.2f}s"
+    return True, f"Valid: {duration:.1f}s, {width}x{height}, {probe['fps']:.2f}fps, {size//1024}KB"
 
-        if width < 100 or height < 100:
-            return False, f"Resolution too low: {width}x{height}"
+def check_video_decoding(video_path, decode_mode):
+    """Decode the video stream and report the first decoder error"""
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-v', 'error']
+    if decode_mode == "keyframes":
+        # Only decode keyframes: catches broken containers and GOP starts at a fraction of the cost
+        cmd.extend(['-skip_frame', 'nokey'])
+    cmd.extend(['-i', video_path, '-map', '0:v:0', '-f', 'null', '-'])
 
-        if frame_count and int(frame_count) < 10:
-            return False, f"Too few frames: {frame_count}"
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        return False, f"FFmpeg error: {e}"
+
+    errors = result.stderr.strip().splitlines()
+    if result.returncode != 0 or errors:
+        first_error = errors[0] if errors else f"exit code {result.returncode}"
+        return False, f"Decode error ({decode_mode}): {first_error[:120]}"
+    return True, f"Decode OK ({decode_mode})"
+
+def get_verdicts_path(input_folder):
+    return os.path.join(input_folder, VERDICTS_FILENAME)
 
-        return True, f"Valid: {duration:.1f}s, {width}x{height}, {size//1024}KB"
+def load_verdicts(input_folder):
+    """Load the verdict cache written by a previous scan"""
+    try:
+        with open(get_verdicts_path(input_folder)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_verdicts(input_folder, verdicts):
+    """Write the verdict cache atomically so concurrent readers never see a partial file"""
+    fd, temp_path = tempfile.mkstemp(dir=input_folder, suffix=".tmp")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(verdicts, f, indent=2, sort_keys=True)
+    os.replace(temp_path, get_verdicts_path(input_folder))
+
+def is_verdict_current(verdict, video_path, decode_mode):
+    """A verdict is reusable if the file is unchanged and it was decoded at least as deeply"""
+    if not verdict:
+        return False
+    stat = os.stat(video_path)
+    if verdict.get("size") != stat.st_size or verdict.get("mtime_ns") != stat.st_mtime_ns:
+        return False
+    if not verdict.get("valid"):
+        return True
+    return DECODE_MODES.index(verdict.get("decode_mode", "none")) >= DECODE_MODES.index(decode_mode)
+
+def scan_video(video_path, decode_mode):
+    """Probe and optionally decode-test one video, returning its verdict"""
+    stat = os.stat(video_path)
+    is_valid, reason = check_video_validity(video_path)
+    if is_valid and decode_mode != "none":
+        is_valid, decode_reason = check_video_decoding(video_path, decode_mode)
+        if not is_valid:
+            reason = decode_reason
+    return {
+        "valid": is_valid,
+        "reason": reason,
+        "decode_mode": decode_mode,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns
+    }
+
+def scan_videos(video_paths, input_folder, decode_mode="none", workers=None, on_verdict=None):
+    """Scan videos across a worker pool, reusing cached verdicts for unchanged files"""
+    verdicts = load_verdicts(input_folder)
+    pending = []
+
+    for video_path in video_paths:
+        name = Path(video_path).name
+        if is_verdict_current(verdicts.get(name), video_path, decode_mode):
+            if on_verdict:
+                on_verdict(video_path, verdicts[name], True)
+        else:
+            pending.append(video_path)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {executor.submit(scan_video, video_path, decode_mode): video_path for video_path in pending}
+        for future in as_completed(futures):
+            video_path = futures[future]
+            verdicts[Path(video_path).name] = future.result()
+            if on_verdict:
+                on_verdict(video_path, verdicts[Path(video_path).name], False)
+
+    existing = {Path(video_path).name for video_path in video_paths}
+    verdicts = {name: verdict for name, verdict in verdicts.items() if name in existing}
+    save_verdicts(input_folder, verdicts)
+    return verdicts
+
+def get_rejected_videos(input_folder):
+    """Names of videos whose current verdict is invalid, for batch runners to skip"""
+    rejected = set()
+    for name, verdict in load_verdicts(input_folder).items():
+        video_path = os.path.join(input_folder, name)
+        if os.path.isfile(video_path) and not verdict.get("valid") and is_verdict_current(verdict, video_path, "none"):
+            rejected.add(name)
+    return rejected
+
+def find_videos(input_folder):
+    video_files = []
+    for ext in VIDEO_EXTENSIONS:
+        video_files.extend(Path(input_folder).glob(f"*{ext}"))
+        video_files.extend(Path(input_folder).glob(f"*{ext.upper()}"))
+    return sorted(set(str(video_file) for video_file in video_files))
 
-    except subprocess.CalledProcessError as e:
-        return False, f"FFprobe error: {e}"
-    except json.JSONDecodeError:
-        return False, "Invalid JSON from ffprobe"
-    except Exception as e:
-        return False, f"Unknown error: {e}"
+def print_verdict(video_path, verdict, cached):
+    file_size = verdict["size"]
+    print(f"\n📹 {Path(video_path).name}" + (" (caché)" if cached else ""))
+    print(f"   📊 Tamaño: {file_size:,} bytes ({file_size/1024/1024:.1f} MB)")
+    if verdict["valid"]:
+        print(f"   ✅ {verdict['reason']}")
+    else:
+        print(f"   ❌ {verdict['reason']}")
 
 def main():
-    print("🎬 VERIFICADOR DE VIDEOS")
-    print("=" * 50)
+    parser = argparse.ArgumentParser(description="Verifica videos de entrada en paralelo")
+    parser.add_argument("input_folder", nargs="?", default="inputVideos")
+    parser.add_argument("--decode", choices=DECODE_MODES, default="none",
+                        help="decodificar para detectar streams corruptos (keyframes es rápido)")
+    parser.add_argument("--workers", type=int, default=None, help="número de verificaciones simultáneas")
+    parser.add_argument("--json", action="store_true", help="imprimir veredictos en JSON")
+    args = parser.parse_args()
+
+    input_folder = args.input_folder
+    if not args.json:
+        print("🎬 VERIFICADOR DE VIDEOS")
+        print("=" * 50)
 
-    input_folder = "inputVideos"
     if not os.path.exists(input_folder):
         print(f"❌ Carpeta {input_folder} no existe")
         return
 
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv']
-    video_files = []
-
-    for ext in video_extensions:
-        video_files.extend(Path(input_folder).glob(f"*{ext}"))
-        video_files.extend(Path(input_folder).glob(f"*{ext.upper()}"))
+    video_files = find_videos(input_folder)
 
     if not video_files:
         print(f"❌ No se encontraron videos en {input_folder}")
         return
 
-    valid_videos = []
-    invalid_videos = []
-
-    for video_file in sorted(video_files):
-        file_size = video_file.stat().st_size
-        is_valid, reason = check_video_validity(str(video_file))
+    verdicts = scan_videos(video_files, input_folder, args.decode, args.workers,
+                           None if args.json else print_verdict)
 
-        print(f"\n📹 {video_file.name}")
-        print(f"   📊 Tamaño: {file_size:,} bytes ({file_size/1024/1024:.1f} MB)")
+    if args.json:
+        json.dump(verdicts, sys.stdout, indent=2, sort_keys=True)
+        print()
+        return
 
-        if is_valid:
-            print(f"   ✅ {reason}")
-            valid_videos.append(video_file)
-        else:
-            print(f"   ❌ {reason}")
-            invalid_videos.append(video_file)
+    valid_videos = [name for name, verdict in sorted(verdicts.items()) if verdict["valid"]]
+    invalid_videos = [name for name, verdict in sorted(verdicts.items()) if not verdict["valid"]]
 
     print("\n" + "=" * 50)
     print("📊 RESUMEN:")
     print(f"✅ Videos válidos: {len(valid_videos)}")
     print(f"❌ Videos inválidos: {len(invalid_videos)}")
+    print(f"📝 Veredictos guardados en: {get_verdicts_path(input_folder)}")
 
     if valid_videos:
         print(f"\n🎯 VIDEOS LISTOS PARA PROCESAR:")
         for video in valid_videos:
-            print(f"   ✅ {video.name}")
+            print(f"   ✅ {video}")
 
     if invalid_videos:
         print(f"\n⚠️ VIDEOS QUE NECESITAN REVISIÓN:")
         for video in invalid_videos:
-            print(f"   ❌ {video.name}")
+            print(f"   ❌ {video}")
 
         print(f"\n💡 SUGERENCIAS:")
         print(f"   • Verifica que los videos no estén corruptos")
@@ -113,4 +218,4 @@ def main():
         print(f"   • Re-sube los videos problemáticos")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
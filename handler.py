@@ -7,80 +7,305 @@ Handles face swapping requests from Runpod API
 import os
 import sys
 import json
+import time
+import heapq
+import asyncio
+import contextvars
+import itertools
 import tempfile
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.parse import urlparse
 import runpod
 
 # Add roop to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from roop import core, globals
-
-
-def download_file(url: str, output_path: str) -> bool:
-    """Download a file from URL to output path"""
-    try:
-        response = requests.get(url, stream=True, timeout=300)
+import job_cache
+from roop import autotune_profile, core, globals
+from roop.face_reference import clear_face_reference
+from roop.processors.frame import face_swapper
+from roop.segments import get_playlist_path, get_segment_directory_path
+from roop.utilities import has_image_extension
+
+WARM_MODELS = os.environ.get("ROOP_WARM_MODELS", "1") != "0"
+DEFAULT_FRAME_PROCESSORS = ["face_swapper", "face_enhancer"]
+CONCURRENT_JOBS = int(os.environ.get("ROOP_CONCURRENT_JOBS", "2"))
+VIDEO_JOB_DELAY = float(os.environ.get("ROOP_VIDEO_JOB_DELAY", "30"))
+TEMP_DIRECTORY = os.environ.get("ROOP_TEMP_DIRECTORY")
+INFERENCE_URL = os.environ.get("ROOP_INFERENCE_URL")
+SCHEDULER_CONDITION = threading.Condition()
+SCHEDULER_QUEUE = []
+SCHEDULER_SEQUENCE = itertools.count()
+SCHEDULER_STATE = {"running": 0}
+JOB_CACHE_IGNORED_ARGUMENTS = ["--execution-provider", "--execution-threads", "--execution-batch-size", "--max-memory", "--segment-duration", "--temp-directory", "--inference-url"]
+DOWNLOAD_TIMEOUT = 300
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_PARTS = int(os.environ.get("ROOP_DOWNLOAD_PARTS", "4"))
+DOWNLOAD_PART_MIN_SIZE = 8 * 1024 * 1024
+DOWNLOAD_SESSION = requests.Session()
+DOWNLOAD_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_PARTS * 2))
+DOWNLOAD_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_PARTS * 2))
+
+
+def get_range_size(response: requests.Response) -> int:
+    """Return the full size announced by a ranged response, or 0 if the range was ignored"""
+    content_range = response.headers.get("Content-Range", "")
+    if response.status_code == 206 and content_range.rsplit("/", 1)[-1].isdigit():
+        return int(content_range.rsplit("/", 1)[-1])
+    return 0
+
+
+def write_response(response: requests.Response, output_path: str) -> None:
+    """Write a streamed response body to output path with large buffers"""
+    with open(output_path, "wb", buffering=DOWNLOAD_CHUNK_SIZE) as f:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+
+
+def download_range(url: str, output_path: str, start: int, end: int) -> None:
+    """Download the inclusive byte range start-end of a URL into its place in output path"""
+    with DOWNLOAD_SESSION.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
         response.raise_for_status()
-
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        if response.status_code != 206:
+            raise IOError(f"Server ignored range {start}-{end}")
+        with open(output_path, "r+b") as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+            if f.tell() != end + 1:
+                raise IOError(f"Incomplete range {start}-{end}")
+
+
+def download_file(url: str, output_path: str, parts: int = DOWNLOAD_PARTS) -> bool:
+    """Download a file from URL to output path, in parallel ranges when the server allows it"""
+    try:
+        with DOWNLOAD_SESSION.get(url, headers={"Range": "bytes=0-0"} if parts > 1 else {}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            size = get_range_size(response)
+            if not size:
+                write_response(response, output_path)
+                return True
+        if size < DOWNLOAD_PART_MIN_SIZE:
+            with DOWNLOAD_SESSION.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                write_response(response, output_path)
+            return True
+        with open(output_path, "wb") as f:
+            f.truncate(size)
+        part_size = -(-size // parts)
+        with ThreadPoolExecutor(max_workers=parts) as executor:
+            futures = [executor.submit(download_range, url, output_path, start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+            for future in futures:
+                future.result()
         return True
     except Exception as e:
         print(f"Error downloading {url}: {str(e)}")
         return False
 
 
-def handler(job):
-    """
-    Handler function for Runpod Serverless
-
-    Expected input:
-    {
-        "source_image_url": "https://...",  # or "source_image_path"
-        "target_video_url": "https://...",  # or "target_video_path"
-        "output_filename": "output.mp4",
-        "frame_processors": ["face_swapper", "face_enhancer"],
-        "keep_fps": true,
-        "many_faces": false,
-        "output_video_quality": 95,
-        "execution_provider": "cuda"
+def get_url_validator(url: str) -> str:
+    """Return the ETag or Last-Modified and size of a URL, or None when the server sends neither"""
+    try:
+        with DOWNLOAD_SESSION.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            size = get_range_size(response) or response.headers.get("Content-Length", "")
+            return f"{validator}:{size}" if validator else None
+    except requests.RequestException:
+        return None
+
+
+def fetch_input(job_input: dict, name: str, temp_dir: str, default_filename: str) -> tuple:
+    """Download or locate a job input, returning its path and an error message"""
+    label = name.replace("_", " ")
+    if f"{name}_url" in job_input:
+        url = job_input[f"{name}_url"]
+        extension = os.path.splitext(urlparse(url).path)[1]
+        path = os.path.join(temp_dir, Path(default_filename).stem + extension if extension else default_filename)
+        validator = get_url_validator(url) if job_cache.is_cache_enabled() else None
+        cached_path = job_cache.lookup_url(url, validator) if validator else None
+        if cached_path:
+            print(f"Reusing cached {label}")
+            job_cache.link_file(cached_path, path)
+        elif not download_file(url, path):
+            return None, f"Failed to download {label}"
+        elif validator:
+            job_cache.store_url(url, validator, path)
+    elif f"{name}_path" in job_input:
+        path = job_input[f"{name}_path"]
+    else:
+        return None, f"{name}_url or {name}_path required"
+    if not os.path.exists(path):
+        return None, f"{label.capitalize()} not found"
+    return path, None
+
+
+def get_execution_providers(execution_providers) -> list:
+    """Keep the requested execution providers this worker supports, falling back to cpu"""
+    if isinstance(execution_providers, str):
+        execution_providers = [execution_providers]
+    available_providers = core.suggest_execution_providers()
+    return [provider for provider in execution_providers if provider in available_providers] or ["cpu"]
+
+
+def get_frame_processors(job_input: dict) -> list:
+    """Read the requested frame processors from a job input"""
+    frame_processors = job_input.get("frame_processors", DEFAULT_FRAME_PROCESSORS)
+    if isinstance(frame_processors, str):
+        frame_processors = frame_processors.split()
+    return frame_processors
+
+
+def build_arguments(job_input: dict, source_path: str = None, target_path: str = None, output_path: str = None) -> list:
+    """Translate a job input into core command line arguments"""
+    arguments = ["--frame-processor", *get_frame_processors(job_input)]
+    if source_path and target_path and output_path:
+        arguments += ["-s", source_path, "-t", target_path, "-o", output_path]
+    for key, flag in (("keep_fps", "--keep-fps"), ("keep_frames", "--keep-frames"), ("skip_audio", "--skip-audio"), ("many_faces", "--many-faces"), ("smart_render", "--smart-render")):
+        if job_input.get(key, key == "keep_fps"):
+            arguments.append(flag)
+    arguments += [
+        "--output-video-quality", str(job_input.get("output_video_quality", 95)),
+        "--temp-frame-quality", str(job_input.get("temp_frame_quality", 100)),
+        "--temp-frame-format", job_input.get("temp_frame_format", "jpg"),
+        "--output-video-encoder", job_input.get("output_video_encoder", "libx264"),
+        "--reference-face-position", str(job_input.get("reference_face_position", 0)),
+        "--reference-frame-number", str(job_input.get("reference_frame_number", 0)),
+        "--similar-face-distance", str(job_input.get("similar_face_distance", 0.85))
+    ]
+    # An autotune profile for this machine fills in whatever the job leaves out, unless the job asks for another provider
+    has_autotune_profile = autotune_profile.load_profile() is not None
+    if "execution_provider" in job_input or not has_autotune_profile:
+        arguments += ["--execution-provider", *get_execution_providers(job_input.get("execution_provider", ["cuda"]))]
+    if job_input.get("execution_threads"):
+        arguments += ["--execution-threads", str(job_input["execution_threads"])]
+    if job_input.get("execution_batch_size"):
+        arguments += ["--execution-batch-size", str(job_input["execution_batch_size"])]
+    if job_input.get("max_memory"):
+        arguments += ["--max-memory", str(job_input["max_memory"])]
+    if job_input.get("segment_duration"):
+        arguments += ["--segment-duration", str(job_input["segment_duration"])]
+    for key, flag in (("start", "--start"), ("end", "--end")):
+        if job_input.get(key) is not None:
+            arguments += [flag, str(job_input[key])]
+    if TEMP_DIRECTORY:
+        arguments += ["--temp-directory", TEMP_DIRECTORY]
+    if INFERENCE_URL:
+        arguments += ["--inference-url", INFERENCE_URL]
+    return arguments
+
+
+@contextmanager
+def processing_slot(is_image_job: bool):
+    """Hold one of CONCURRENT_JOBS processing slots, letting image jobs overtake videos queued up to VIDEO_JOB_DELAY seconds earlier"""
+    with SCHEDULER_CONDITION:
+        ticket = (time.monotonic() + (0 if is_image_job else VIDEO_JOB_DELAY), next(SCHEDULER_SEQUENCE))
+        heapq.heappush(SCHEDULER_QUEUE, ticket)
+        SCHEDULER_CONDITION.wait_for(lambda: SCHEDULER_QUEUE[0] == ticket and SCHEDULER_STATE["running"] < CONCURRENT_JOBS)
+        heapq.heappop(SCHEDULER_QUEUE)
+        SCHEDULER_STATE["running"] += 1
+        SCHEDULER_CONDITION.notify_all()
+    try:
+        yield
+    finally:
+        with SCHEDULER_CONDITION:
+            SCHEDULER_STATE["running"] -= 1
+            SCHEDULER_CONDITION.notify_all()
+
+
+def get_job_key(job_input: dict, source_path: str, target_path: str) -> str:
+    """Key a job by its input contents and every argument that changes the output"""
+    config = []
+    skipping = False
+    for argument in build_arguments(job_input):
+        if argument.startswith("--"):
+            skipping = argument in JOB_CACHE_IGNORED_ARGUMENTS
+        if not skipping:
+            config.append(argument)
+    return job_cache.get_job_key(job_cache.hash_file(source_path), job_cache.hash_file(target_path), config)
+
+
+def create_success_result(output_path: str, cached: bool = False) -> dict:
+    """Describe a finished output"""
+    file_size = os.path.getsize(output_path)
+    result = {
+        "status": "success",
+        "output_path": output_path,
+        "file_size": file_size,
+        "cached": cached,
+        "message": f"Face swap completed successfully. Output size: {file_size / (1024*1024):.2f} MB"
     }
-    """
+    playlist_path = get_playlist_path(get_segment_directory_path(output_path))
+    if globals.get_job_globals().segment_duration and os.path.exists(playlist_path):
+        result["playlist_path"] = playlist_path
+    return result
+
+
+def warm_up_worker() -> None:
+    """Load and warm the models once so jobs never pay for model loading"""
+    globals.keep_models = WARM_MODELS or CONCURRENT_JOBS > 1
+    globals.concurrent_jobs = CONCURRENT_JOBS
+    core.parse_args(build_arguments({}))
+    core.limit_resources()
+    if globals.keep_models:
+        print(f"Warming up models: {globals.frame_processors}")
+        if not core.warm_up():
+            print("Warm up failed, models will be loaded by the first job")
+
+
+def process_files(job_input: dict, source_image: str, target_video: str, output_path: str) -> dict:
+    """Configure and run the core on downloaded inputs"""
+    # Build isolated per-job configuration
+    try:
+        core.parse_args(build_arguments(job_input, source_image, target_video, output_path))
+    except SystemExit:
+        return {"status": "error", "message": "Invalid job input"}
+
+    # Run the face swapping
+    print(f"Starting face swap: {source_image} -> {target_video}")
+    print(f"Output: {output_path}")
+    print(f"Frame processors: {globals.get_job_globals().frame_processors}")
+
+    try:
+        clear_face_reference()
+        if not core.warm_up():
+            return {"status": "error", "message": "Frame processors could not be prepared"}
+        core.start()
+
+        # Verify output was created
+        if os.path.exists(output_path):
+            return create_success_result(output_path)
+        else:
+            return {"status": "error", "message": "Output file was not created"}
+
+    except Exception as e:
+        print(f"Error during face swap: {str(e)}")
+        return {"status": "error", "message": f"Face swap failed: {str(e)}"}
 
+
+def process_job(job):
+    """Download the inputs of a job and process them"""
     try:
         job_input = job["input"]
 
         # Create temporary directory for processing
         with tempfile.TemporaryDirectory() as temp_dir:
-            # Download or copy source image
-            if "source_image_url" in job_input:
-                source_image = os.path.join(temp_dir, "source.jpg")
-                if not download_file(job_input["source_image_url"], source_image):
-                    return {"status": "error", "message": "Failed to download source image"}
-            elif "source_image_path" in job_input:
-                source_image = job_input["source_image_path"]
-            else:
-                return {"status": "error", "message": "source_image_url or source_image_path required"}
-
-            if not os.path.exists(source_image):
-                return {"status": "error", "message": "Source image not found"}
-
-            # Download or copy target video
-            if "target_video_url" in job_input:
-                target_video = os.path.join(temp_dir, "target.mp4")
-                if not download_file(job_input["target_video_url"], target_video):
-                    return {"status": "error", "message": "Failed to download target video"}
-            elif "target_video_path" in job_input:
-                target_video = job_input["target_video_path"]
-            else:
-                return {"status": "error", "message": "target_video_url or target_video_path required"}
-
-            if not os.path.exists(target_video):
-                return {"status": "error", "message": "Target video not found"}
+            # Download both inputs concurrently and analyse the source face as soon as it lands
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                source_future = executor.submit(fetch_input, job_input, "source_image", temp_dir, "source.jpg")
+                target_future = executor.submit(fetch_input, job_input, "target_video", temp_dir, "target.mp4")
+                source_image, error = source_future.result()
+                if error:
+                    return {"status": "error", "message": error}
+                if "face_swapper" in get_frame_processors(job_input):
+                    executor.submit(contextvars.copy_context().run, face_swapper.get_source_face, source_image)
+                target_video, error = target_future.result()
+                if error:
+                    return {"status": "error", "message": error}
 
             # Prepare output path
             output_filename = job_input.get("output_filename", "output.mp4")
@@ -92,70 +317,27 @@ def handler(job):
                 os.makedirs(output_dir, exist_ok=True)
                 output_path = os.path.join(output_dir, output_filename)
 
-            # Configure globals for headless execution
-            globals.source_path = source_image
-            globals.target_path = target_video
-            globals.output_path = output_path
-
-            # Frame processors
-            frame_processors = job_input.get("frame_processors", ["face_swapper", "face_enhancer"])
-            if isinstance(frame_processors, str):
-                frame_processors = frame_processors.split()
-            globals.frame_processors = frame_processors
-
-            # Additional options
-            globals.keep_fps = job_input.get("keep_fps", True)
-            globals.keep_frames = job_input.get("keep_frames", False)
-            globals.skip_audio = job_input.get("skip_audio", False)
-            globals.many_faces = job_input.get("many_faces", False)
-
-            # Quality settings
-            globals.output_video_quality = job_input.get("output_video_quality", 95)
-            globals.temp_frame_quality = job_input.get("temp_frame_quality", 100)
-            globals.temp_frame_format = job_input.get("temp_frame_format", "jpg")
-
-            # Video encoder
-            globals.output_video_encoder = job_input.get("output_video_encoder", "libx264")
-
-            # Execution settings
-            globals.execution_provider = job_input.get("execution_provider", ["cuda"])
-            if isinstance(globals.execution_provider, str):
-                globals.execution_provider = [globals.execution_provider]
-
-            globals.execution_threads = job_input.get("execution_threads", 1)
-            globals.max_memory = job_input.get("max_memory", 0)
-
-            # Reference face settings
-            globals.reference_face_position = job_input.get("reference_face_position", 0)
-            globals.reference_frame_number = job_input.get("reference_frame_number", 0)
-            globals.similar_face_distance = job_input.get("similar_face_distance", 0.85)
-
-            # Face analyser settings
-            globals.detectors = job_input.get("detectors", ["retinaface"])
-
-            # Run the face swapping
-            print(f"Starting face swap: {source_image} -> {target_video}")
-            print(f"Output: {output_path}")
-            print(f"Frame processors: {frame_processors}")
-
-            try:
-                core.run()
-
-                # Verify output was created
-                if os.path.exists(output_path):
-                    file_size = os.path.getsize(output_path)
-                    return {
-                        "status": "success",
-                        "output_path": output_path,
-                        "file_size": file_size,
-                        "message": f"Face swap completed successfully. Output size: {file_size / (1024*1024):.2f} MB"
-                    }
-                else:
-                    return {"status": "error", "message": "Output file was not created"}
-
-            except Exception as e:
-                print(f"Error during face swap: {str(e)}")
-                return {"status": "error", "message": f"Face swap failed: {str(e)}"}
+            # Return the output of an identical earlier job straight from the cache
+            job_key = get_job_key(job_input, source_image, target_video) if job_cache.is_cache_enabled() else None
+            output_extension = os.path.splitext(output_path)[1]
+            cached_output = job_cache.lookup_file("outputs", job_key, output_extension) if job_key else None
+            if cached_output:
+                print(f"Reusing cached output {cached_output}")
+                job_cache.link_file(cached_output, output_path)
+                return create_success_result(output_path, cached=True)
+
+            # Never write through an existing output, it may be a hard link into the cache
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+            # Wait for a processing slot, short image jobs first
+            with processing_slot(has_image_extension(target_video)):
+                result = process_files(job_input, source_image, target_video, output_path)
+            if job_key and result["status"] == "success":
+                job_cache.store_file(output_path, "outputs", job_key, output_extension)
+            if job_cache.is_cache_enabled():
+                job_cache.evict_cache()
+            return result
 
     except Exception as e:
         print(f"Handler error: {str(e)}")
@@ -164,5 +346,31 @@ def handler(job):
         return {"status": "error", "message": f"Handler error: {str(e)}"}
 
 
+def handler(job):
+    """
+    Handler function for Runpod Serverless
+
+    Expected input:
+    {
+        "source_image_url": "https://...",  # or "source_image_path"
+        "target_video_url": "https://...",  # or "target_video_path"
+        "output_filename": "output.mp4",
+        "frame_processors": ["face_swapper", "face_enhancer"],
+        "keep_fps": true,
+        "many_faces": false,
+        "output_video_quality": 95,
+        "execution_provider": "cuda"
+    }
+    """
+    with globals.job_scope():
+        return process_job(job)
+
+
+async def async_handler(job):
+    """Run a job on its own thread so one worker serves several jobs at once"""
+    return await asyncio.to_thread(handler, job)
+
+
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler})
+    warm_up_worker()
+    runpod.serverless.start({"handler": async_handler, "concurrency_modifier": lambda current_concurrency: CONCURRENT_JOBS + 1})
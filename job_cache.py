@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for the Runpod handler
+Keeps downloaded inputs by content hash, remembers which URL and validator produced them,
+and keeps finished outputs by input hashes plus processing config, evicting least recently used entries
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+from urllib.parse import urlparse
+
+CACHE_DIRECTORY = os.environ.get("ROOP_CACHE_DIRECTORY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs"))
+CACHE_SIZE = int(float(os.environ.get("ROOP_CACHE_SIZE", "20")) * 1024 ** 3)
+CACHE_VERSION = 1
+CACHE_KINDS = ["inputs", "outputs"]
+HASH_CHUNK_SIZE = 1024 * 1024
+FILE_HASHES = {}
+CACHE_LOCK = threading.Lock()
+
+
+def is_cache_enabled() -> bool:
+    """The cache is disabled with ROOP_CACHE_SIZE=0"""
+    return CACHE_SIZE > 0
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """Hash a file by content, remembering the result for its path, mtime and size"""
+    stat = os.stat(path)
+    identity = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    with CACHE_LOCK:
+        if identity in FILE_HASHES:
+            return FILE_HASHES[identity]
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    with CACHE_LOCK:
+        FILE_HASHES[identity] = file_hash.hexdigest()
+    return FILE_HASHES[identity]
+
+
+def get_entry_path(kind: str, key: str, extension: str = "") -> str:
+    return os.path.join(CACHE_DIRECTORY, kind, key[:2], key + extension)
+
+
+def get_url_key(url: str, validator: str) -> str:
+    """Key a URL by everything but its query, so re-signed links to the same object still match"""
+    parsed_url = urlparse(url)
+    return hash_text(f"{CACHE_VERSION}:{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}:{validator}")
+
+
+def get_job_key(source_hash: str, target_hash: str, config: List[str]) -> str:
+    return hash_text(json.dumps([CACHE_VERSION, source_hash, target_hash, config]))
+
+
+def link_file(source_path: str, destination_path: str) -> None:
+    """Hard link when source and destination share a filesystem, copy otherwise"""
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination_path), suffix=".tmp")
+    os.close(file_descriptor)
+    os.remove(temp_path)
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        shutil.copy2(source_path, temp_path)
+    os.replace(temp_path, destination_path)
+
+
+def lookup_file(kind: str, key: str, extension: str = "") -> Optional[str]:
+    entry_path = get_entry_path(kind, key, extension)
+    try:
+        os.utime(entry_path)
+        return entry_path
+    except OSError:
+        return None
+
+
+def store_file(path: str, kind: str, key: str, extension: str = "") -> Optional[str]:
+    entry_path = get_entry_path(kind, key, extension)
+    try:
+        if not os.path.exists(entry_path):
+            link_file(path, entry_path)
+        os.utime(entry_path)
+        return entry_path
+    except OSError as e:
+        print(f"Could not cache {path}: {str(e)}")
+        return None
+
+
+def lookup_url(url: str, validator: str) -> Optional[str]:
+    """Return the cached input a URL with this validator downloaded to, if it is still cached"""
+    try:
+        with open(get_entry_path("urls", get_url_key(url, validator), ".json")) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return lookup_file("inputs", entry["hash"], entry["extension"])
+
+
+def store_url(url: str, validator: str, path: str) -> Optional[str]:
+    extension = os.path.splitext(path)[1]
+    entry_path = store_file(path, "inputs", hash_file(path), extension)
+    if entry_path:
+        index_path = get_entry_path("urls", get_url_key(url, validator), ".json")
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+            with os.fdopen(file_descriptor, "w") as f:
+                json.dump({"hash": hash_file(path), "extension": extension}, f)
+            os.replace(temp_path, index_path)
+        except OSError:
+            pass
+    return entry_path
+
+
+def evict_cache(limit: int = None) -> int:
+    """Delete least recently used inputs and outputs until the cache fits, returning the freed bytes"""
+    limit = CACHE_SIZE if limit is None else limit
+    entries = []
+    for kind in CACHE_KINDS:
+        for directory, _, filenames in os.walk(os.path.join(CACHE_DIRECTORY, kind)):
+            for filename in filenames:
+                entry_path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, entry_path in sorted(entries):
+        if total - freed <= limit:
+            break
+        try:
+            os.remove(entry_path)
+            freed += size
+        except OSError:
+            pass
+    return freed
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Durable job queue for the batch scripts, shared by every worker that sees the same directory
+Each job keeps numbered lease files; a worker claims a job by atomically creating the next one,
+renews it while it works and releases it with the outcome, so crashed workers are taken over
+once their lease expires and failed jobs are retried with exponential backoff
+"""
+
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+QUEUE_DIRECTORY = os.environ.get("ROOP_QUEUE_DIRECTORY", os.path.join("outputVideos", ".queue"))
+LEASE_SECONDS = float(os.environ.get("ROOP_QUEUE_LEASE", "300"))
+MAX_ATTEMPTS = int(os.environ.get("ROOP_QUEUE_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.environ.get("ROOP_QUEUE_RETRY_DELAY", "60"))
+POLL_INTERVAL = 10
+LEASE_EXTENSION = ".json"
+
+
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def get_job_directory(job_id: str) -> str:
+    return os.path.join(QUEUE_DIRECTORY, re.sub(r"[^\w.-]", "_", job_id))
+
+
+def get_lease_path(job_id: str, generation: int) -> str:
+    return os.path.join(get_job_directory(job_id), f"{generation:06d}{LEASE_EXTENSION}")
+
+
+def get_generation(job_id: str) -> int:
+    """Highest lease generation of a job, 0 when it was never claimed"""
+    try:
+        filenames = os.listdir(get_job_directory(job_id))
+    except OSError:
+        return 0
+    generations = [int(filename[:-len(LEASE_EXTENSION)]) for filename in filenames if re.fullmatch(r"\d+" + re.escape(LEASE_EXTENSION), filename)]
+    return max(generations, default=0)
+
+
+def read_lease(job_id: str, generation: int) -> Optional[dict]:
+    try:
+        with open(get_lease_path(job_id, generation)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_lease(lease: dict, exclusive: bool) -> bool:
+    """Write a lease through a temp file; exclusive writes fail when its generation already exists"""
+    lease_path = get_lease_path(lease["job"], lease["generation"])
+    os.makedirs(os.path.dirname(lease_path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(lease_path), suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as f:
+        json.dump(lease, f)
+    try:
+        if exclusive:
+            # link() fails if the name exists, also on NFS, so exactly one worker wins a generation
+            os.link(temp_path, lease_path)
+        else:
+            os.replace(temp_path, lease_path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_job_state(job_id: str) -> Tuple[str, Optional[dict]]:
+    """One of ready, leased, waiting, failed or done, with the newest lease of the job"""
+    generation = get_generation(job_id)
+    if not generation:
+        return "ready", None
+    lease = read_lease(job_id, generation)
+    if lease is None:
+        # A lease that cannot be read is treated as held until it is as old as a lease lifetime
+        try:
+            expired = time.time() - os.path.getmtime(get_lease_path(job_id, generation)) > LEASE_SECONDS
+        except OSError:
+            expired = True
+        lease = {"job": job_id, "generation": generation, "attempts": 0, "expires_at": 0 if expired else float("inf")}
+    if lease.get("done"):
+        return "done", lease
+    if lease["expires_at"] > time.time():
+        return "leased", lease
+    if lease["attempts"] >= MAX_ATTEMPTS:
+        return "failed", lease
+    if lease.get("retry_at", 0) > time.time():
+        return "waiting", lease
+    return "ready", lease
+
+
+def claim_job(job_id: str, worker_id: str = None) -> Optional[dict]:
+    """Take a ready job, or a job whose worker stopped renewing its lease; None when another worker has it"""
+    state, lease = get_job_state(job_id)
+    if state != "ready":
+        return None
+    generation = lease["generation"] if lease else 0
+    claimed_lease = {
+        "job": job_id,
+        "generation": generation + 1,
+        "worker": worker_id or get_worker_id(),
+        "attempts": (lease["attempts"] if lease else 0) + 1,
+        "claimed_at": time.time(),
+        "expires_at": time.time() + LEASE_SECONDS
+    }
+    if not write_lease(claimed_lease, True):
+        return None
+    for old_generation in range(1, generation + 1):
+        try:
+            os.remove(get_lease_path(job_id, old_generation))
+        except OSError:
+            pass
+    return claimed_lease
+
+
+def reopen_job(lease: dict) -> bool:
+    """Make a done job ready again, for when its output was removed; False when another worker reopened or claimed it first"""
+    reopened_lease = {"job": lease["job"], "generation": lease["generation"] + 1, "attempts": 0, "expires_at": 0}
+    return write_lease(reopened_lease, True)
+
+
+def renew_lease(lease: dict) -> bool:
+    """Extend a lease, returning False once another worker has taken the job over"""
+    if get_generation(lease["job"]) != lease["generation"]:
+        return False
+    lease["expires_at"] = time.time() + LEASE_SECONDS
+    return write_lease(lease, False)
+
+
+def release_job(lease: dict, error: str = None) -> None:
+    """Record the outcome of a claimed job; a failure makes it ready again after a backoff"""
+    if get_generation(lease["job"]) != lease["generation"]:
+        return
+    lease["expires_at"] = 0
+    if error:
+        lease["error"] = error
+        lease["retry_at"] = time.time() + RETRY_DELAY * 2 ** (lease["attempts"] - 1)
+    else:
+        lease["done"] = True
+    write_lease(lease, False)
+
+
+@contextmanager
+def hold_lease(lease: dict):
+    """Renew a lease in the background while the job runs; lease["lost"] is set if it is taken over"""
+    stopped = threading.Event()
+
+    def renew():
+        while not stopped.wait(LEASE_SECONDS / 3):
+            if not renew_lease(lease):
+                lease["lost"] = True
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield lease
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def get_partial_directory(output_directory: str, worker_id: str = None) -> str:
+    """Worker-private folder next to the outputs, so a half-written file never has a final name"""
+    partial_directory = os.path.join(output_directory, f".partial-{worker_id or get_worker_id()}")
+    os.makedirs(partial_directory, exist_ok=True)
+    return partial_directory
+
+
+def publish_output(partial_path: str, output_path: str) -> None:
+    """Move a finished output to its final name in one rename"""
+    os.replace(partial_path, output_path)
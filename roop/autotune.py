@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import onnxruntime
+
+import roop.globals
+from roop.autotune_profile import AUTOTUNE_VERSION, get_machine_fingerprint
+from roop.capturer import get_video_frames
+from roop.face_analyser import clear_face_analyser
+from roop.face_reference import clear_face_reference
+from roop.processors.frame.core import get_frame_processors_modules
+from roop.utilities import has_image_extension
+
+AUTOTUNE_FRAME_TOTAL = 48
+AUTOTUNE_THREADS = [1, 2, 4, 8, 16]
+AUTOTUNE_BATCH_SIZES = [1, 2, 4, 8, 16]
+AUTOTUNE_SCALING_THRESHOLD = 0.95
+AUTOTUNE_IGNORED_PROVIDERS = ['AzureExecutionProvider']
+
+
+def get_provider_candidates() -> List[List[str]]:
+    available_providers = onnxruntime.get_available_providers()
+    candidates = [[provider, 'CPUExecutionProvider'] for provider in available_providers if provider not in ['CPUExecutionProvider', *AUTOTUNE_IGNORED_PROVIDERS]]
+    return candidates + [['CPUExecutionProvider']]
+
+
+def get_thread_candidates(execution_providers: List[str]) -> List[int]:
+    if execution_providers == ['CPUExecutionProvider']:
+        return [thread_total for thread_total in AUTOTUNE_THREADS if thread_total <= (os.cpu_count() or 1)]
+    return AUTOTUNE_THREADS
+
+
+def create_sample_frames(target_path: str, sample_directory_path: str) -> List[str]:
+    if has_image_extension(target_path):
+        sample_frames = [cv2.imread(target_path)] * AUTOTUNE_FRAME_TOTAL
+    else:
+        sample_frames = list(get_video_frames(target_path, 1, AUTOTUNE_FRAME_TOTAL))
+    os.makedirs(sample_directory_path, exist_ok=True)
+    sample_paths = []
+    for index, sample_frame in enumerate(sample_frames, start=1):
+        if sample_frame is not None:
+            sample_path = os.path.join(sample_directory_path, f'{index:04d}.png')
+            cv2.imwrite(sample_path, sample_frame)
+            sample_paths.append(sample_path)
+    return sample_paths
+
+
+def reset_models(frame_processors: List[str]) -> None:
+    job_globals = roop.globals.get_job_globals()
+    keep_models = job_globals.keep_models
+    job_globals.keep_models = False
+    for frame_processor in get_frame_processors_modules(frame_processors):
+        frame_processor.post_process()
+    job_globals.keep_models = keep_models
+    clear_face_analyser()
+    clear_face_reference()
+
+
+def measure_config(source_path: str, sample_paths: List[str], work_directory_path: str, frame_processors: List[str]) -> float:
+    shutil.rmtree(work_directory_path, ignore_errors=True)
+    os.makedirs(work_directory_path)
+    frame_paths = []
+    for sample_path in sample_paths:
+        frame_paths.append(shutil.copy(sample_path, work_directory_path))
+    start_time = time.perf_counter()
+    for frame_processor in get_frame_processors_modules(frame_processors):
+        frame_processor.process_video(source_path, frame_paths)
+    return len(frame_paths) / (time.perf_counter() - start_time)
+
+
+def calibrate(source_path: str, target_path: str, frame_processors: List[str], report: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+    job_globals = roop.globals.get_job_globals()
+    results: List[Dict[str, Any]] = []
+    execution_providers = job_globals.execution_providers
+    execution_threads = job_globals.execution_threads
+    execution_batch_size = job_globals.execution_batch_size
+    with tempfile.TemporaryDirectory(prefix='roop-autotune-') as directory_path:
+        sample_paths = create_sample_frames(target_path, os.path.join(directory_path, 'samples'))
+        work_directory_path = os.path.join(directory_path, 'work')
+        if not sample_paths:
+            return None
+
+        def measure(execution_providers: List[str], execution_threads: int, execution_batch_size: Optional[int]) -> Dict[str, Any]:
+            job_globals.execution_threads = execution_threads
+            job_globals.execution_batch_size = execution_batch_size
+            result = {
+                'execution_providers': execution_providers,
+                'execution_threads': execution_threads,
+                'execution_batch_size': execution_batch_size,
+                'frames_per_second': measure_config(source_path, sample_paths, work_directory_path, frame_processors)
+            }
+            results.append(result)
+            report(result)
+            return result
+
+        for candidate_providers in get_provider_candidates():
+            job_globals.execution_providers = candidate_providers
+            reset_models(frame_processors)
+            try:
+                for frame_processor in get_frame_processors_modules(frame_processors):
+                    frame_processor.pre_load()
+                job_globals.execution_threads = 1
+                job_globals.execution_batch_size = None
+                measure_config(source_path, sample_paths, work_directory_path, frame_processors)
+                best_result = None
+                for candidate_threads in get_thread_candidates(candidate_providers):
+                    result = measure(candidate_providers, candidate_threads, None)
+                    if best_result and result['frames_per_second'] < best_result['frames_per_second'] * AUTOTUNE_SCALING_THRESHOLD:
+                        break
+                    if not best_result or result['frames_per_second'] > best_result['frames_per_second']:
+                        best_result = result
+                for candidate_batch_size in AUTOTUNE_BATCH_SIZES:
+                    measure(candidate_providers, best_result['execution_threads'], candidate_batch_size)
+            except Exception as exception:
+                report({'execution_providers': candidate_providers, 'error': str(exception)})
+        reset_models(frame_processors)
+    job_globals.execution_providers = execution_providers
+    job_globals.execution_threads = execution_threads
+    job_globals.execution_batch_size = execution_batch_size
+    if not results:
+        return None
+    best_result = max(results, key=lambda result: result['frames_per_second'])
+    return {
+        'version': AUTOTUNE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'fingerprint': get_machine_fingerprint(),
+        'frame_processors': frame_processors,
+        **best_result,
+        'results': results
+    }
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+AUTOTUNE_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '../cache/autotune'))
+AUTOTUNE_VERSION = 1
+MACHINE_FINGERPRINT: Dict[str, Any] = {}
+
+
+def get_cpu_model() -> str:
+    try:
+        with open('/proc/cpuinfo') as cpuinfo_file:
+            for line in cpuinfo_file:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def get_gpu_names() -> List[str]:
+    try:
+        output = subprocess.check_output(['nvidia-smi', '--query-gpu=name', '--format=csv,noheader'], stderr=subprocess.DEVNULL, timeout=10)
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return []
+    return [line.strip() for line in output.decode().splitlines() if line.strip()]
+
+
+def get_machine_fingerprint() -> Dict[str, Any]:
+    import onnxruntime
+
+    if not MACHINE_FINGERPRINT:
+        MACHINE_FINGERPRINT.update({
+            'cpu_model': get_cpu_model(),
+            'cpu_count': os.cpu_count(),
+            'memory_total': round(psutil.virtual_memory().total / 1024 ** 3),
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'gpus': get_gpu_names(),
+            'available_providers': onnxruntime.get_available_providers()
+        })
+    return MACHINE_FINGERPRINT
+
+
+def get_profile_path() -> str:
+    fingerprint_key = hashlib.sha1(json.dumps(get_machine_fingerprint(), sort_keys=True).encode()).hexdigest()
+    return os.path.join(AUTOTUNE_DIRECTORY, fingerprint_key[:16] + '.json')
+
+
+def load_profile() -> Optional[Dict[str, Any]]:
+    try:
+        with open(get_profile_path()) as profile_file:
+            profile = json.load(profile_file)
+    except (OSError, ValueError):
+        return None
+    if profile.get('version') != AUTOTUNE_VERSION:
+        return None
+    return profile
+
+
+def save_profile(profile: Dict[str, Any]) -> str:
+    profile_path = get_profile_path()
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(profile_path), suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as profile_file:
+        json.dump(profile, profile_file, indent=2)
+    os.replace(temp_path, profile_path)
+    return profile_path
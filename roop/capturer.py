@@ -1,22 +1,131 @@
-from typing import Optional
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterator, Optional
 import cv2
 
-from roop.typing import Frame
+from roop.probe import probe_media, probe_keyframes
+from roop.typing import Frame, VideoReader
 
+VIDEO_READERS: 'OrderedDict[str, VideoReader]' = OrderedDict()
+VIDEO_READERS_MAX = 2
+VIDEO_READER_FRAMES_MAX = 16
+VIDEO_READER_GRAB_MAX = 30
+THREAD_LOCK = threading.Lock()
 
-def get_video_frame(video_path: str, frame_number: int = 0) -> Optional[Frame]:
+
+def get_video_reader(video_path: str) -> Optional[VideoReader]:
+    try:
+        stat = os.stat(video_path)
+    except (OSError, TypeError):
+        return None
+    reader_key = f'{os.path.abspath(video_path)}:{stat.st_mtime_ns}:{stat.st_size}'
+    with THREAD_LOCK:
+        if reader_key in VIDEO_READERS:
+            VIDEO_READERS.move_to_end(reader_key)
+            return VIDEO_READERS[reader_key]
     capture = cv2.VideoCapture(video_path)
-    frame_total = capture.get(cv2.CAP_PROP_FRAME_COUNT)
-    capture.set(cv2.CAP_PROP_POS_FRAMES, min(frame_total, frame_number - 1))
-    has_frame, frame = capture.read()
-    capture.release()
-    if has_frame:
-        return frame
+    if not capture.isOpened():
+        capture.release()
+        return None
+    probe = probe_media(video_path)
+    video_reader = {
+        'capture': capture,
+        'lock': threading.Lock(),
+        'keyframes': probe_keyframes(video_path),
+        'frame_total': probe['frame_total'] if probe and probe['frame_total'] else int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        'position': 0,
+        'frames': OrderedDict()
+    }
+    evicted_video_readers = []
+    with THREAD_LOCK:
+        if reader_key in VIDEO_READERS:
+            evicted_video_readers.append(video_reader)
+            video_reader = VIDEO_READERS[reader_key]
+        else:
+            VIDEO_READERS[reader_key] = video_reader
+        while len(VIDEO_READERS) > VIDEO_READERS_MAX:
+            evicted_video_readers.append(VIDEO_READERS.popitem(last=False)[1])
+    for evicted_video_reader in evicted_video_readers:
+        release_video_reader(evicted_video_reader)
+    return video_reader
+
+
+def release_video_reader(video_reader: VideoReader) -> None:
+    with video_reader['lock']:
+        video_reader['capture'].release()
+        video_reader['frames'].clear()
+        video_reader['position'] = -1
+
+
+def clear_video_readers() -> None:
+    with THREAD_LOCK:
+        video_readers = list(VIDEO_READERS.values())
+        VIDEO_READERS.clear()
+    for video_reader in video_readers:
+        release_video_reader(video_reader)
+
+
+def can_read_forward(video_reader: VideoReader, frame_index: int) -> bool:
+    position = video_reader['position']
+    if position < 0 or frame_index < position:
+        return False
+    if video_reader['keyframes'] is None:
+        return frame_index - position <= VIDEO_READER_GRAB_MAX
+    return bisect_right(video_reader['keyframes'], frame_index) == bisect_right(video_reader['keyframes'], position)
+
+
+def read_video_frame(video_reader: VideoReader, frame_index: int) -> Optional[Frame]:
+    with video_reader['lock']:
+        frames = video_reader['frames']
+        if frame_index in frames:
+            frames.move_to_end(frame_index)
+            return frames[frame_index].copy()
+        capture = video_reader['capture']
+        if not capture.isOpened():
+            return None
+        if not can_read_forward(video_reader, frame_index):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            video_reader['position'] = frame_index
+        while video_reader['position'] < frame_index:
+            if not capture.grab():
+                video_reader['position'] = -1
+                return None
+            video_reader['position'] += 1
+        has_frame, frame = capture.read()
+        if not has_frame:
+            video_reader['position'] = -1
+            return None
+        video_reader['position'] += 1
+        frames[frame_index] = frame
+        while len(frames) > VIDEO_READER_FRAMES_MAX:
+            frames.popitem(last=False)
+        return frame.copy()
+
+
+def get_video_frame(video_path: str, frame_number: int = 0) -> Optional[Frame]:
+    video_reader = get_video_reader(video_path)
+    if video_reader:
+        return read_video_frame(video_reader, max(0, min(video_reader['frame_total'], frame_number) - 1))
     return None
 
 
+def get_video_frames(video_path: str, start_frame_number: int, end_frame_number: int) -> Iterator[Frame]:
+    video_reader = get_video_reader(video_path)
+    if video_reader:
+        for frame_number in range(max(1, start_frame_number), min(video_reader['frame_total'], end_frame_number) + 1):
+            frame = read_video_frame(video_reader, frame_number - 1)
+            if frame is None:
+                return
+            yield frame
+
+
 def get_video_frame_total(video_path: str) -> int:
-    capture = cv2.VideoCapture(video_path)
-    video_frame_total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
-    capture.release()
-    return video_frame_total
+    probe = probe_media(video_path)
+    if probe and probe['frame_total']:
+        return probe['frame_total']
+    video_reader = get_video_reader(video_path)
+    if video_reader:
+        return video_reader['frame_total']
+    return 0
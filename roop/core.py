@@ -8,70 +8,162 @@ if any(arg.startswith('--execution-provider') for arg in sys.argv):
 # reduce tensorflow log level
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 import warnings
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import platform
 import signal
+import threading
 import shutil
 import argparse
+import uuid
+import cv2
 import onnxruntime
 import tensorflow
+import roop.autotune
+import roop.autotune_profile
 import roop.globals
+import roop.inference
+import roop.memory
 import roop.metadata
+import roop.metrics
+import roop.profiler
+from tqdm import tqdm
 from roop.predictor import predict_image, predict_video
+from roop.face_analyser import get_one_face, get_many_faces
+from roop.face_reference import get_face_reference, set_face_reference
+from roop.typing import Face, Frame
+from roop.capturer import get_video_frame, get_video_frame_total
+from roop.probe import probe_keyframes
+from roop.live import create_live_state, get_live_geometry, get_live_summary, open_live_reader, open_live_writer, process_live_frames, read_live_frames, write_live_frames
+from roop.smart_render import SMART_RENDER_ENCODERS, can_smart_render, copy_span, encode_span, extract_span_frames, get_scan_interval, get_span_codec_tag, get_span_directory_path, get_span_path, plan_spans, scan_face_frames
+from roop.segments import SEGMENT_ENCODERS, can_create_segments, concat_segments, create_segment, get_playlist_path, get_segment_directory_path, get_segment_path, write_playlist
 
 # UI will be imported conditionally based on headless mode
 ui = None
+import roop.processors.frame.core
 from roop.processors.frame.core import get_frame_processors_modules
-from roop.utilities import has_image_extension, is_image, is_video, detect_fps, create_video, extract_frames, get_temp_frame_paths, restore_audio, create_temp, move_temp, clean_temp, normalize_output_path
+from roop.utilities import is_bulk_target, get_bulk_target_paths, get_temp_root_path, has_temp_space, has_image_extension, is_image, is_video, detect_fps, create_video, extract_frames, get_temp_frame_paths, get_temp_output_path, has_frame_range, get_frame_range, filter_frame_paths, restore_audio, create_temp, move_temp, clean_temp, normalize_output_path, open_video_writer
 
 warnings.filterwarnings('ignore', category=FutureWarning, module='insightface')
 warnings.filterwarnings('ignore', category=UserWarning, module='torchvision')
 
 
-def parse_args() -> None:
-    signal.signal(signal.SIGINT, lambda signal_number, frame: destroy())
+def parse_args(argv: Optional[List[str]] = None) -> None:
+    job_globals = roop.globals.get_job_globals()
     program = argparse.ArgumentParser(formatter_class=lambda prog: argparse.HelpFormatter(prog, max_help_position=100))
-    program.add_argument('-s', '--source', help='select an source image', dest='source_path')
-    program.add_argument('-t', '--target', help='select an target image or video', dest='target_path')
+    program.add_argument('-s', '--source', help='select an source image, or several to write one output each', dest='source_path', nargs='+')
+    program.add_argument('-t', '--target', help='select an target image, video, image directory or image list', dest='target_path')
     program.add_argument('-o', '--output', help='select output file or directory', dest='output_path')
     program.add_argument('--frame-processor', help='frame processors (choices: face_swapper, face_enhancer, ...)', dest='frame_processor', default=['face_swapper'], nargs='+')
     program.add_argument('--keep-fps', help='keep target fps', dest='keep_fps', action='store_true')
     program.add_argument('--keep-frames', help='keep temporary frames', dest='keep_frames', action='store_true')
+    program.add_argument('--temp-directory', help='directory for the temporary frames of each job, such as a ram disk', dest='temp_directory')
     program.add_argument('--skip-audio', help='skip target audio', dest='skip_audio', action='store_true')
     program.add_argument('--many-faces', help='process every face', dest='many_faces', action='store_true')
     program.add_argument('--reference-face-position', help='position of the reference face', dest='reference_face_position', type=int, default=0)
     program.add_argument('--reference-frame-number', help='number of the reference frame', dest='reference_frame_number', type=int, default=0)
     program.add_argument('--similar-face-distance', help='face distance used for recognition', dest='similar_face_distance', type=float, default=0.85)
+    program.add_argument('--face-map', help='swap each face matching a reference image with its own source image', dest='face_map', type=parse_face_map_entry, nargs='+', default=[], metavar='REFERENCE=SOURCE')
     program.add_argument('--temp-frame-format', help='image format used for frame extraction', dest='temp_frame_format', default='png', choices=['jpg', 'png'])
     program.add_argument('--temp-frame-quality', help='image quality used for frame extraction', dest='temp_frame_quality', type=int, default=0, choices=range(101), metavar='[0-100]')
     program.add_argument('--output-video-encoder', help='encoder used for the output video', dest='output_video_encoder', default='libx264', choices=['libx264', 'libx265', 'libvpx-vp9', 'h264_nvenc', 'hevc_nvenc'])
     program.add_argument('--output-video-quality', help='quality used for the output video', dest='output_video_quality', type=int, default=35, choices=range(101), metavar='[0-100]')
+    program.add_argument('--smart-render', help='stream copy the spans of a video without faces instead of processing them', dest='smart_render', action='store_true')
+    program.add_argument('--start', help='process the target from this second on and copy the frames before it', dest='start_time', type=float)
+    program.add_argument('--end', help='process the target up to this second and copy the frames after it', dest='end_time', type=float)
+    program.add_argument('--live', help='read the target and write the output as ffmpeg streams, processing frames as they arrive', dest='live', action='store_true')
+    program.add_argument('--live-latency', help='milliseconds a live frame may take from capture to output before it is dropped', dest='live_latency', type=float, default=500)
+    program.add_argument('--live-resolution', help='scale live frames to this size, needed for inputs that cannot be probed', dest='live_resolution', type=parse_resolution, metavar='WIDTHxHEIGHT')
+    program.add_argument('--segment-duration', help='emit hls segments of this many seconds while processing', dest='segment_duration', type=float)
     program.add_argument('--max-memory', help='maximum amount of RAM in GB', dest='max_memory', type=int)
-    program.add_argument('--execution-provider', help='available execution provider (choices: cpu, ...)', dest='execution_provider', default=['cpu'], choices=suggest_execution_providers(), nargs='+')
-    program.add_argument('--execution-threads', help='number of execution threads', dest='execution_threads', type=int, default=suggest_execution_threads())
+    program.add_argument('--execution-provider', help='available execution provider (choices: cpu, ...)', dest='execution_provider', choices=suggest_execution_providers(), nargs='+')
+    program.add_argument('--execution-threads', help='maximum number of execution threads, fewer run while memory is short', dest='execution_threads', type=int)
+    program.add_argument('--execution-batch-size', help='number of frames handed to an execution thread at once', dest='execution_batch_size', type=int)
+    program.add_argument('--autotune', help='calibrate execution provider, threads and batch size on the target and keep them for this machine', dest='autotune', action='store_true')
+    program.add_argument('--inference-server', help='host the models for other roop processes of this machine instead of processing a target', dest='serve_inference', action='store_true')
+    program.add_argument('--inference-port', help='port of the inference server', dest='inference_port', type=int, default=7870)
+    program.add_argument('--inference-url', help='run the models on the inference server at this url, such as http://127.0.0.1:7870', dest='inference_url')
+    program.add_argument('--inference-batch-size', help='largest micro-batch the inference server runs at once', dest='inference_batch_size', type=int, default=16)
+    program.add_argument('--inference-max-wait', help='milliseconds the inference server waits to fill a micro-batch', dest='inference_max_wait', type=float, default=5)
+    program.add_argument('--metrics-port', help='serve prometheus metrics on this port', dest='metrics_port', type=int)
+    program.add_argument('--metrics-host', help='address the metrics server listens on', dest='metrics_host', default='127.0.0.1')
+    program.add_argument('--metrics-path', help='write metrics snapshots as json to this file', dest='metrics_path')
+    program.add_argument('--metrics-interval', help='seconds between metrics snapshots', dest='metrics_interval', type=float, default=10)
+    program.add_argument('--profile', help='write a chrome trace of the job to this file', dest='profile_path')
+    program.add_argument('--profile-sample-rate', help='fraction of jobs to profile', dest='profile_sample_rate', type=float, default=1.0)
     program.add_argument('-v', '--version', action='version', version=f'{roop.metadata.name} {roop.metadata.version}')
 
-    args = program.parse_args()
-
-    roop.globals.source_path = args.source_path
-    roop.globals.target_path = args.target_path
-    roop.globals.output_path = normalize_output_path(roop.globals.source_path, roop.globals.target_path, args.output_path)
-    roop.globals.headless = roop.globals.source_path is not None and roop.globals.target_path is not None and roop.globals.output_path is not None
-    roop.globals.frame_processors = args.frame_processor
-    roop.globals.keep_fps = args.keep_fps
-    roop.globals.keep_frames = args.keep_frames
-    roop.globals.skip_audio = args.skip_audio
-    roop.globals.many_faces = args.many_faces
-    roop.globals.reference_face_position = args.reference_face_position
-    roop.globals.reference_frame_number = args.reference_frame_number
-    roop.globals.similar_face_distance = args.similar_face_distance
-    roop.globals.temp_frame_format = args.temp_frame_format
-    roop.globals.temp_frame_quality = args.temp_frame_quality
-    roop.globals.output_video_encoder = args.output_video_encoder
-    roop.globals.output_video_quality = args.output_video_quality
-    roop.globals.max_memory = args.max_memory
-    roop.globals.execution_providers = decode_execution_providers(args.execution_provider)
-    roop.globals.execution_threads = args.execution_threads
+    args = program.parse_args(argv)
+    if args.start_time is not None and args.end_time is not None and args.end_time <= args.start_time:
+        program.error('argument --end: must be later than --start')
+
+    job_globals.face_map = args.face_map
+    job_globals.source_paths = args.source_path or [source_path for _, source_path in args.face_map[:1]]
+    job_globals.source_path = job_globals.source_paths[0] if job_globals.source_paths else None
+    job_globals.target_path = args.target_path
+    job_globals.output_path = args.output_path if len(job_globals.source_paths) > 1 else normalize_output_path(job_globals.source_path, job_globals.target_path, args.output_path)
+    job_globals.headless = job_globals.source_path is not None and job_globals.target_path is not None and job_globals.output_path is not None
+    job_globals.frame_processors = args.frame_processor
+    job_globals.keep_fps = args.keep_fps
+    job_globals.keep_frames = args.keep_frames
+    job_globals.temp_directory = args.temp_directory
+    job_globals.job_id = uuid.uuid4().hex[:8]
+    job_globals.skip_audio = args.skip_audio
+    job_globals.many_faces = args.many_faces
+    job_globals.reference_face_position = args.reference_face_position
+    job_globals.reference_frame_number = args.reference_frame_number
+    job_globals.similar_face_distance = args.similar_face_distance
+    job_globals.temp_frame_format = args.temp_frame_format
+    job_globals.temp_frame_quality = args.temp_frame_quality
+    job_globals.output_video_encoder = args.output_video_encoder
+    job_globals.output_video_quality = args.output_video_quality
+    job_globals.smart_render = args.smart_render
+    job_globals.start_time = args.start_time
+    job_globals.end_time = args.end_time
+    job_globals.live = args.live
+    job_globals.live_latency = args.live_latency
+    job_globals.live_resolution = args.live_resolution
+    job_globals.segment_duration = args.segment_duration
+    job_globals.max_memory = args.max_memory
+    autotune_profile = roop.autotune_profile.load_profile() if None in (args.execution_provider, args.execution_threads, args.execution_batch_size) else None
+    # a profile tuned for another provider says nothing about the threads and batch size of this one
+    if autotune_profile and args.execution_provider and decode_execution_providers(args.execution_provider) != autotune_profile['execution_providers']:
+        autotune_profile = None
+    if autotune_profile:
+        job_globals.execution_providers = decode_execution_providers(args.execution_provider or encode_execution_providers(autotune_profile['execution_providers']))
+        job_globals.execution_threads = args.execution_threads or autotune_profile['execution_threads']
+        job_globals.execution_batch_size = args.execution_batch_size or autotune_profile['execution_batch_size']
+    else:
+        job_globals.execution_providers = decode_execution_providers(args.execution_provider or ['cpu'])
+        job_globals.execution_threads = args.execution_threads
+        job_globals.execution_batch_size = args.execution_batch_size
+    job_globals.autotune = args.autotune
+    job_globals.serve_inference = args.serve_inference
+    job_globals.inference_port = args.inference_port
+    job_globals.inference_url = None if args.serve_inference else args.inference_url
+    job_globals.inference_batch_size = args.inference_batch_size
+    job_globals.inference_max_wait = args.inference_max_wait
+    job_globals.metrics_port = args.metrics_port
+    job_globals.metrics_host = args.metrics_host
+    job_globals.metrics_path = args.metrics_path
+    job_globals.metrics_interval = args.metrics_interval
+    job_globals.profile_path = args.profile_path
+    job_globals.profile_sample_rate = args.profile_sample_rate
+
+
+def parse_face_map_entry(face_map_entry: str) -> Tuple[str, str]:
+    reference_path, separator, source_path = face_map_entry.partition('=')
+    if not separator or not reference_path or not source_path:
+        raise argparse.ArgumentTypeError(f'expected REFERENCE=SOURCE, got {face_map_entry}')
+    return reference_path, source_path
+
+
+def parse_resolution(resolution: str) -> Tuple[int, int]:
+    width, separator, height = resolution.lower().partition('x')
+    if not separator or not width.isdigit() or not height.isdigit() or not int(width) or not int(height):
+        raise argparse.ArgumentTypeError(f'expected WIDTHxHEIGHT, got {resolution}')
+    return int(width), int(height)
 
 
 def encode_execution_providers(execution_providers: List[str]) -> List[str]:
@@ -87,13 +179,8 @@ def suggest_execution_providers() -> List[str]:
     return encode_execution_providers(onnxruntime.get_available_providers())
 
 
-def suggest_execution_threads() -> int:
-    if 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
-        return 8
-    return 1
-
-
 def limit_resources() -> None:
+    job_globals = roop.globals.get_job_globals()
     # prevent tensorflow memory leak
     gpus = tensorflow.config.experimental.list_physical_devices('GPU')
     for gpu in gpus:
@@ -101,10 +188,10 @@ def limit_resources() -> None:
             tensorflow.config.experimental.VirtualDeviceConfiguration(memory_limit=13312)
         ])
     # limit memory usage
-    if roop.globals.max_memory:
-        memory = roop.globals.max_memory * 1024 ** 3
+    if job_globals.max_memory:
+        memory = job_globals.max_memory * 1024 ** 3
         if platform.system().lower() == 'darwin':
-            memory = roop.globals.max_memory * 1024 ** 6
+            memory = job_globals.max_memory * 1024 ** 6
         if platform.system().lower() == 'windows':
             import ctypes
             kernel32 = ctypes.windll.kernel32  # type: ignore[attr-defined]
@@ -114,112 +201,538 @@ def limit_resources() -> None:
             resource.setrlimit(resource.RLIMIT_DATA, (memory, memory))
 
 
+def start_metrics() -> None:
+    job_globals = roop.globals.get_job_globals()
+    if job_globals.metrics_port:
+        roop.metrics.start_metrics_server(job_globals.metrics_port, job_globals.metrics_host)
+    if job_globals.metrics_path:
+        roop.metrics.start_metrics_writer(job_globals.metrics_path, job_globals.metrics_interval)
+
+
+def stop_metrics() -> None:
+    if roop.globals.get_job_globals().metrics_path:
+        roop.metrics.stop_metrics_writer(roop.globals.get_job_globals().metrics_path)
+
+
+def start_profiling() -> None:
+    job_globals = roop.globals.get_job_globals()
+    if job_globals.profile_path and roop.profiler.enable_profiling(job_globals.profile_sample_rate):
+        update_status(f'Profiling to {job_globals.profile_path}...')
+
+
+def stop_profiling() -> None:
+    if roop.globals.get_job_globals().profile_path and roop.profiler.is_profiling():
+        roop.profiler.write_trace(roop.globals.get_job_globals().profile_path)
+        roop.profiler.disable_profiling()
+
+
 def pre_check() -> bool:
+    job_globals = roop.globals.get_job_globals()
     if sys.version_info < (3, 9):
         update_status('Python version is not supported - please upgrade to 3.9 or higher.')
         return False
     if not shutil.which('ffmpeg'):
         update_status('ffmpeg is not installed.')
         return False
+    if job_globals.inference_url and not roop.inference.is_inference_server_reachable(job_globals.inference_url):
+        update_status(f'Inference server at {job_globals.inference_url} is not reachable.')
+        return False
+    return True
+
+
+def warm_up() -> bool:
+    if not pre_check():
+        return False
+    for frame_processor in get_frame_processors_modules(roop.globals.get_job_globals().frame_processors):
+        if not frame_processor.pre_check():
+            return False
+    for frame_processor in get_frame_processors_modules(roop.globals.get_job_globals().frame_processors):
+        frame_processor.pre_load()
     return True
 
 
 def update_status(message: str, scope: str = 'ROOP.CORE') -> None:
     print(f'[{scope}] {message}')
-    if not roop.globals.headless and ui is not None:
+    if not roop.globals.get_job_globals().headless and ui is not None:
         ui.update_status(message)
 
 
 def start() -> None:
-    for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+    job_globals = roop.globals.get_job_globals()
+    if job_globals.live:
+        start_live()
+        return
+    for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
         if not frame_processor.pre_start():
             return
+    # process one target for many sources
+    if len(job_globals.source_paths) > 1 and job_globals.face_map:
+        update_status('Face map cannot be combined with several source images.')
+        return
+    if len(job_globals.source_paths) > 1:
+        start_fan_out()
+        return
+    # process images to directory
+    if is_bulk_target(job_globals.target_path):
+        start_bulk()
+        return
     # process image to image
-    if has_image_extension(roop.globals.target_path):
+    if has_image_extension(job_globals.target_path):
         # NSFW check disabled for headless environments
-        # if predict_image(roop.globals.target_path):
+        # if predict_image(job_globals.target_path):
         #     destroy()
-        shutil.copy2(roop.globals.target_path, roop.globals.output_path)
+        shutil.copy2(job_globals.target_path, job_globals.output_path)
         # process frame
-        for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+        for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
             update_status('Progressing...', frame_processor.NAME)
-            frame_processor.process_image(roop.globals.source_path, roop.globals.output_path, roop.globals.output_path)
+            with roop.profiler.span(frame_processor.NAME, 'processor'):
+                frame_processor.process_image(job_globals.source_path, job_globals.output_path, job_globals.output_path)
             frame_processor.post_process()
         # validate image
-        if is_image(roop.globals.target_path):
+        if is_image(job_globals.target_path):
             update_status('Processing to image succeed!')
         else:
             update_status('Processing to image failed!')
         return
     # process image to videos
     # NSFW check disabled for headless environments
-    # if predict_video(roop.globals.target_path):
+    # if predict_video(job_globals.target_path):
     #     destroy()
+    if not check_temp_space():
+        return
     update_status('Creating temporary resources...')
-    create_temp(roop.globals.target_path)
+    create_temp(job_globals.target_path)
+    if (job_globals.smart_render or has_frame_range()) and not job_globals.segment_duration and start_smart_render():
+        finalize_video()
+        return
     # extract frames
-    if roop.globals.keep_fps:
-        fps = detect_fps(roop.globals.target_path)
-        update_status(f'Extracting frames with {fps} FPS...')
-        extract_frames(roop.globals.target_path, fps)
-    else:
-        update_status('Extracting frames with 30 FPS...')
-        extract_frames(roop.globals.target_path)
+    with roop.metrics.measure('extract'):
+        if job_globals.keep_fps:
+            fps = detect_fps(job_globals.target_path)
+            update_status(f'Extracting frames with {fps} FPS...')
+            extract_frames(job_globals.target_path, fps)
+        else:
+            update_status('Extracting frames with 30 FPS...')
+            extract_frames(job_globals.target_path)
     # process frame
-    temp_frame_paths = get_temp_frame_paths(roop.globals.target_path)
+    temp_frame_paths = get_temp_frame_paths(job_globals.target_path)
+    if temp_frame_paths and job_globals.segment_duration and can_create_segments():
+        start_segments(sorted(temp_frame_paths, key=lambda temp_frame_path: int(os.path.splitext(os.path.basename(temp_frame_path))[0])))
+        update_status('Cleaning temporary resources...')
+        clean_temp(job_globals.target_path)
+        if is_video(job_globals.output_path):
+            update_status('Processing to video succeed!')
+        else:
+            update_status('Processing to video failed!')
+        return
+    if job_globals.segment_duration and not can_create_segments():
+        update_status(f'Segments need one of the encoders {", ".join(SEGMENT_ENCODERS)}, writing a single video...')
+    if temp_frame_paths and has_frame_range():
+        temp_frame_paths = filter_frame_paths(temp_frame_paths, get_frame_range(detect_fps(job_globals.target_path) if job_globals.keep_fps else 30, len(temp_frame_paths)))
+        update_status(f'Processing {len(temp_frame_paths)} frames of the range...')
     if temp_frame_paths:
-        for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+        for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
             update_status('Progressing...', frame_processor.NAME)
-            frame_processor.process_video(roop.globals.source_path, temp_frame_paths)
+            with roop.profiler.span(frame_processor.NAME, 'processor'):
+                frame_processor.process_video(job_globals.source_path, temp_frame_paths)
             frame_processor.post_process()
     else:
         update_status('Frames not found...')
         return
     # create video
-    if roop.globals.keep_fps:
-        fps = detect_fps(roop.globals.target_path)
-        update_status(f'Creating video with {fps} FPS...')
-        create_video(roop.globals.target_path, fps)
-    else:
-        update_status('Creating video with 30 FPS...')
-        create_video(roop.globals.target_path)
+    with roop.metrics.measure('encode'):
+        if job_globals.keep_fps:
+            fps = detect_fps(job_globals.target_path)
+            update_status(f'Creating video with {fps} FPS...')
+            create_video(job_globals.target_path, fps)
+        else:
+            update_status('Creating video with 30 FPS...')
+            create_video(job_globals.target_path)
+    finalize_video()
+
+
+def finalize_video() -> None:
+    job_globals = roop.globals.get_job_globals()
     # handle audio
-    if roop.globals.skip_audio:
-        move_temp(roop.globals.target_path, roop.globals.output_path)
+    if job_globals.skip_audio:
+        move_temp(job_globals.target_path, job_globals.output_path)
         update_status('Skipping audio...')
     else:
-        if roop.globals.keep_fps:
+        if job_globals.keep_fps:
             update_status('Restoring audio...')
         else:
             update_status('Restoring audio might cause issues as fps are not kept...')
-        restore_audio(roop.globals.target_path, roop.globals.output_path)
+        restore_audio(job_globals.target_path, job_globals.output_path)
     # clean temp
     update_status('Cleaning temporary resources...')
-    clean_temp(roop.globals.target_path)
+    clean_temp(job_globals.target_path)
     # validate video
-    if is_video(roop.globals.target_path):
+    if is_video(job_globals.target_path):
         update_status('Processing to video succeed!')
     else:
         update_status('Processing to video failed!')
 
 
+def start_smart_render() -> bool:
+    job_globals = roop.globals.get_job_globals()
+    if not can_smart_render(job_globals.target_path):
+        update_status(f'Copying spans needs --keep-fps, an unrotated 8-bit yuv420p target with a known color matrix and an encoder of its codec ({", ".join(encoder for encoders in SMART_RENDER_ENCODERS.values() for encoder in encoders)}), encoding every frame...')
+        return False
+    fps = detect_fps(job_globals.target_path)
+    frame_total = get_video_frame_total(job_globals.target_path)
+    if not frame_total:
+        return False
+    frame_range = get_frame_range(fps, frame_total)
+    scan_interval = get_scan_interval(fps)
+    face_frames = None
+    if job_globals.smart_render:
+        update_status(f'Scanning every {scan_interval} frames for faces...')
+        with roop.metrics.measure('scan'):
+            face_frames = scan_face_frames(job_globals.target_path, scan_interval, frame_range)
+        if face_frames is None:
+            return False
+    spans = plan_spans(face_frames, scan_interval, probe_keyframes(job_globals.target_path), frame_total, frame_range)
+    face_frame_total = sum(end - start for start, end, has_face in spans if has_face)
+    if face_frame_total == frame_total:
+        update_status('Every span needs processing, encoding every frame...')
+        return False
+    update_status(f'Processing {face_frame_total} of {frame_total} frames, copying {len([span for span in spans if not span[2]])} spans...')
+    if face_frame_total:
+        if not job_globals.many_faces and not job_globals.face_map and not get_face_reference():
+            reference_frame = get_video_frame(job_globals.target_path, frame_range[0] + job_globals.reference_frame_number + 1)
+            set_face_reference(get_one_face(reference_frame, job_globals.reference_face_position))
+        with roop.metrics.measure('extract'):
+            for start, end, has_face in spans:
+                if has_face:
+                    extract_span_frames(job_globals.target_path, fps, start, end)
+        temp_frame_paths = filter_frame_paths(get_temp_frame_paths(job_globals.target_path), frame_range)
+        for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
+            update_status('Progressing...', frame_processor.NAME)
+            with roop.profiler.span(frame_processor.NAME, 'processor'):
+                frame_processor.process_video(job_globals.source_path, temp_frame_paths)
+            frame_processor.post_process()
+    span_directory_path = get_span_directory_path(job_globals.target_path)
+    os.makedirs(span_directory_path, exist_ok=True)
+    span_paths: List[str] = []
+    update_status(f'Splicing {len(spans)} spans with {fps} FPS...')
+    with roop.metrics.measure('encode'):
+        for start, end, has_face in spans:
+            span_path = get_span_path(span_directory_path, len(span_paths))
+            if has_face:
+                done = encode_span(job_globals.target_path, span_path, fps, start, end)
+            else:
+                done = copy_span(job_globals.target_path, span_path, fps, start, end)
+            if not done:
+                update_status('Splicing spans failed, processing every frame...')
+                return False
+            span_paths.append(span_path)
+        if not concat_segments(span_paths, get_temp_output_path(job_globals.target_path), get_span_codec_tag(job_globals.target_path)):
+            update_status('Joining spans failed, processing every frame...')
+            return False
+    return True
+
+
+def check_temp_space() -> bool:
+    job_globals = roop.globals.get_job_globals()
+    fps = detect_fps(job_globals.target_path) if job_globals.keep_fps else 30
+    if has_temp_space(job_globals.target_path, fps):
+        return True
+    update_status(f'Not enough free space in {get_temp_root_path(job_globals.target_path)} for the temporary frames.')
+    return False
+
+
+def start_autotune() -> None:
+    job_globals = roop.globals.get_job_globals()
+    if not job_globals.source_path or not job_globals.target_path:
+        update_status('Select a source and a target to autotune on.', 'ROOP.AUTOTUNE')
+        return
+    for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
+        if not frame_processor.pre_start():
+            return
+
+    def report(result: Dict[str, Any]) -> None:
+        if 'error' in result:
+            update_status(f"{', '.join(encode_execution_providers(result['execution_providers']))} failed: {result['error']}", 'ROOP.AUTOTUNE')
+        else:
+            update_status(f"{', '.join(encode_execution_providers(result['execution_providers']))} with {result['execution_threads']} threads and batch size {result['execution_batch_size'] or 'auto'}: {result['frames_per_second']:.2f} frames/s", 'ROOP.AUTOTUNE')
+
+    update_status(f'Calibrating {", ".join(job_globals.frame_processors)} on {job_globals.target_path}...', 'ROOP.AUTOTUNE')
+    profile = roop.autotune.calibrate(job_globals.source_path, job_globals.target_path, job_globals.frame_processors, report)
+    if profile:
+        update_status(f'Saved the best configuration to {roop.autotune_profile.save_profile(profile)}', 'ROOP.AUTOTUNE')
+        report(profile)
+    else:
+        update_status('No frames to calibrate on.', 'ROOP.AUTOTUNE')
+
+
+def start_inference_server() -> None:
+    job_globals = roop.globals.get_job_globals()
+    job_globals.keep_models = True
+    for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
+        frame_processor.pre_load()
+    update_status(f'Serving {", ".join(job_globals.frame_processors)} on http://{roop.inference.INFERENCE_HOST}:{job_globals.inference_port}...')
+    roop.inference.start_inference_server(job_globals.inference_port)
+
+
+def start_bulk() -> None:
+    job_globals = roop.globals.get_job_globals()
+    target_paths = get_bulk_target_paths(job_globals.target_path)
+    frame_processors = get_frame_processors_modules(job_globals.frame_processors)
+    source_face = get_one_face(cv2.imread(job_globals.source_path))
+    os.makedirs(job_globals.output_path, exist_ok=True)
+
+    def process_images(source_path: str, image_paths: List[str], update: Callable[[], None]) -> None:
+        for image_path in image_paths:
+            with roop.profiler.span(os.path.basename(image_path), 'image'):
+                with roop.metrics.measure('decode'):
+                    temp_frame = cv2.imread(image_path)
+                if temp_frame is not None:
+                    many_faces = get_many_faces(temp_frame)
+                    reference_face = None if job_globals.many_faces or not many_faces else many_faces[min(job_globals.reference_face_position, len(many_faces) - 1)]
+                    for frame_processor in frame_processors:
+                        temp_frame = frame_processor.process_faces(source_face, reference_face, many_faces, temp_frame)
+                    with roop.metrics.measure('write'):
+                        cv2.imwrite(os.path.join(job_globals.output_path, os.path.basename(image_path)), temp_frame)
+                else:
+                    update_status(f'Skipping unreadable image {image_path}...')
+            update()
+
+    update_status(f'Processing {len(target_paths)} images to {job_globals.output_path}...')
+    with roop.profiler.span('bulk', 'processor'):
+        roop.processors.frame.core.process_video(job_globals.source_path, target_paths, process_images)
+    for frame_processor in frame_processors:
+        frame_processor.post_process()
+    update_status('Processing to images succeed!')
+
+
+def get_fan_out_output_paths() -> List[str]:
+    job_globals = roop.globals.get_job_globals()
+    os.makedirs(job_globals.output_path, exist_ok=True)
+    return [normalize_output_path(source_path, job_globals.target_path, job_globals.output_path) for source_path in job_globals.source_paths]
+
+
+def process_fan_out_frame(source_faces: List[Face], reference_face: Optional[Face], many_faces: Optional[List[Face]], temp_frame: Frame) -> List[Frame]:
+    results = []
+    for source_face in source_faces:
+        result = temp_frame.copy()
+        for frame_processor in get_frame_processors_modules(roop.globals.get_job_globals().frame_processors):
+            result = frame_processor.process_faces(source_face, reference_face, many_faces, result)
+        results.append(result)
+    return results
+
+
+def start_fan_out() -> None:
+    job_globals = roop.globals.get_job_globals()
+    output_paths = []
+    source_faces = []
+    for source_path, output_path in zip(job_globals.source_paths, get_fan_out_output_paths()):
+        source_face = get_one_face(cv2.imread(source_path))
+        if source_face:
+            output_paths.append(output_path)
+            source_faces.append(source_face)
+        else:
+            update_status(f'No face in source path {source_path} detected, skipping...')
+    if not source_faces:
+        return
+    frame_processors = get_frame_processors_modules(job_globals.frame_processors)
+    if has_image_extension(job_globals.target_path):
+        target_frame = cv2.imread(job_globals.target_path)
+        many_faces = get_many_faces(target_frame)
+        reference_face = None if job_globals.many_faces or not many_faces else many_faces[min(job_globals.reference_face_position, len(many_faces) - 1)]
+        for output_path, result in zip(output_paths, process_fan_out_frame(source_faces, reference_face, many_faces, target_frame)):
+            cv2.imwrite(output_path, result)
+    else:
+        if not check_temp_space():
+            return
+        update_status('Creating temporary resources...')
+        create_temp(job_globals.target_path)
+        fps = detect_fps(job_globals.target_path) if job_globals.keep_fps else 30
+        update_status(f'Extracting frames with {fps} FPS...')
+        with roop.metrics.measure('extract'):
+            extract_frames(job_globals.target_path, fps)
+        temp_frame_paths = sorted(get_temp_frame_paths(job_globals.target_path), key=lambda temp_frame_path: int(os.path.splitext(os.path.basename(temp_frame_path))[0]))
+        if not temp_frame_paths:
+            update_status('Frames not found...')
+            return
+        reference_face = None
+        if not job_globals.many_faces:
+            reference_face = get_one_face(cv2.imread(temp_frame_paths[job_globals.reference_frame_number]), job_globals.reference_face_position)
+        height, width = cv2.imread(temp_frame_paths[0]).shape[:2]
+        audio_path = None if job_globals.skip_audio else job_globals.target_path
+        video_writers = [open_video_writer(output_path, width, height, fps, audio_path) for output_path in output_paths]
+        update_status(f'Progressing {len(output_paths)} sources...')
+
+        def process_temp_frame(temp_frame_path: str) -> List[Frame]:
+            with roop.memory.worker_slot(), roop.profiler.span(os.path.basename(temp_frame_path), 'frame'):
+                with roop.metrics.measure('decode'):
+                    temp_frame = cv2.imread(temp_frame_path)
+                return process_fan_out_frame(source_faces, reference_face, get_many_faces(temp_frame), temp_frame)
+
+        with tqdm(total=len(temp_frame_paths), desc='Processing', unit='frame', dynamic_ncols=True) as progress:
+            window = roop.memory.start_workers(height * width * 3 * (len(output_paths) + 1), job_globals.execution_threads) * 2
+            with ThreadPoolExecutor(max_workers=roop.memory.get_worker_maximum()) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, process_temp_frame, temp_frame_path) for temp_frame_path in temp_frame_paths[:window]]
+                for index in range(len(temp_frame_paths)):
+                    if index + window < len(temp_frame_paths):
+                        futures.append(executor.submit(contextvars.copy_context().run, process_temp_frame, temp_frame_paths[index + window]))
+                    with roop.metrics.measure('encode'):
+                        for video_writer, result in zip(video_writers, futures[index].result()):
+                            video_writer.stdin.write(result.tobytes())
+                    futures[index] = None
+                    progress.update(1)
+        for video_writer in video_writers:
+            video_writer.stdin.close()
+            video_writer.wait()
+        update_status('Cleaning temporary resources...')
+        clean_temp(job_globals.target_path)
+    for frame_processor in frame_processors:
+        frame_processor.post_process()
+    for output_path in output_paths:
+        if is_image(output_path) or is_video(output_path):
+            update_status(f'Processing to {output_path} succeed!')
+        else:
+            update_status(f'Processing to {output_path} failed!')
+
+
+def start_live() -> None:
+    job_globals = roop.globals.get_job_globals()
+    frame_processors = get_frame_processors_modules(job_globals.frame_processors)
+    source_face = get_one_face(cv2.imread(job_globals.source_path)) if is_image(job_globals.source_path) else None
+    if not source_face and not job_globals.face_map and 'face_swapper' in job_globals.frame_processors:
+        update_status('No face in source path detected.', 'ROOP.LIVE')
+        return
+    live_geometry = get_live_geometry(job_globals.target_path)
+    if not live_geometry:
+        update_status('Live input cannot be probed, pass --live-resolution.', 'ROOP.LIVE')
+        return
+    width, height, fps = live_geometry
+
+    def process_live_frame(frame: Frame) -> Frame:
+        many_faces = get_many_faces(frame)
+        reference_face = None
+        if not job_globals.many_faces and not job_globals.face_map:
+            reference_face = get_face_reference()
+            if not reference_face and many_faces:
+                reference_face = many_faces[min(job_globals.reference_face_position, len(many_faces) - 1)]
+                set_face_reference(reference_face)
+        for frame_processor in frame_processors:
+            frame = frame_processor.process_faces(source_face, reference_face, many_faces, frame)
+        return frame
+
+    def report(state: Dict[str, Any]) -> None:
+        summary = get_live_summary(state)
+        update_status(f"{width}x{height} at {fps:g} FPS: latency p50 {summary['latency_p50']:.0f} ms, p95 {summary['latency_p95']:.0f} ms, {summary['processed']:.0f} processed, {summary['drop_rate']:.1%} dropped, {summary['reused']:.0f} reused", 'ROOP.LIVE')
+
+    update_status(f'Streaming {job_globals.target_path} to {job_globals.output_path} at {width}x{height} and {fps:g} FPS within {job_globals.live_latency:g} ms...', 'ROOP.LIVE')
+    state = create_live_state()
+    reader = open_live_reader(job_globals.target_path, width, height)
+    writer = open_live_writer(job_globals.output_path, width, height, fps)
+    roop.memory.start_workers(width * height * 3, job_globals.execution_threads)
+    worker_maximum = roop.memory.get_worker_maximum()
+    with ThreadPoolExecutor(max_workers=worker_maximum) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, process_live_frames, state, process_live_frame) for _ in range(worker_maximum)]
+        threading.Thread(target=read_live_frames, args=(reader, state, width, height), name='roop-live-reader', daemon=True).start()
+        try:
+            write_live_frames(writer, state, fps, report)
+        finally:
+            reader.terminate()
+            writer.stdin.close()
+            writer.wait()
+        for future in futures:
+            future.result()
+    for frame_processor in frame_processors:
+        frame_processor.post_process()
+    report(state)
+    update_status('Live stream ended.', 'ROOP.LIVE')
+
+
+def start_segments(temp_frame_paths: List[str]) -> None:
+    job_globals = roop.globals.get_job_globals()
+    fps = detect_fps(job_globals.target_path) if job_globals.keep_fps else 30
+    frame_processors = get_frame_processors_modules(job_globals.frame_processors)
+    segment_directory_path = get_segment_directory_path(job_globals.output_path)
+    playlist_path = get_playlist_path(segment_directory_path)
+    segment_frame_total = max(1, round(job_globals.segment_duration * fps))
+    segment_paths: List[str] = []
+    segment_durations: List[float] = []
+    segments_failed = False
+    frame_range = get_frame_range(fps, len(temp_frame_paths))
+    os.makedirs(segment_directory_path, exist_ok=True)
+    if not job_globals.many_faces and not get_face_reference():
+        reference_frame = cv2.imread(temp_frame_paths[min(len(temp_frame_paths) - 1, frame_range[0] + job_globals.reference_frame_number)])
+        set_face_reference(get_one_face(reference_frame, job_globals.reference_face_position))
+    update_status(f'Writing segments to {playlist_path}...')
+    for start_index in range(0, len(temp_frame_paths), segment_frame_total):
+        segment_frame_paths = temp_frame_paths[start_index:start_index + segment_frame_total]
+        range_frame_paths = filter_frame_paths(segment_frame_paths, frame_range)
+        if range_frame_paths:
+            for frame_processor in frame_processors:
+                update_status(f'Progressing segment {len(segment_paths)}...', frame_processor.NAME)
+                with roop.profiler.span(frame_processor.NAME, 'processor', segment=len(segment_paths)):
+                    frame_processor.process_video(job_globals.source_path, range_frame_paths)
+        if segments_failed:
+            continue
+        segment_path = get_segment_path(segment_directory_path, len(segment_paths))
+        with roop.metrics.measure('encode'):
+            segment_created = create_segment(job_globals.target_path, segment_path, fps, start_index + 1, len(segment_frame_paths))
+        if not segment_created:
+            update_status(f'Creating segment {len(segment_paths)} failed, continuing without segments...')
+            segments_failed = True
+            if os.path.exists(playlist_path):
+                os.remove(playlist_path)
+            continue
+        segment_paths.append(segment_path)
+        segment_durations.append(len(segment_frame_paths) / fps)
+        write_playlist(playlist_path, segment_durations, False)
+    for frame_processor in frame_processors:
+        frame_processor.post_process()
+    if not segments_failed:
+        write_playlist(playlist_path, segment_durations, True)
+        update_status('Joining segments...')
+        if concat_segments(segment_paths, job_globals.output_path):
+            return
+        update_status('Joining segments failed...')
+    update_status('Creating video...')
+    with roop.metrics.measure('encode'):
+        create_video(job_globals.target_path, fps)
+    if job_globals.skip_audio:
+        move_temp(job_globals.target_path, job_globals.output_path)
+    else:
+        restore_audio(job_globals.target_path, job_globals.output_path)
+
+
 def destroy() -> None:
-    if roop.globals.target_path:
-        clean_temp(roop.globals.target_path)
+    if roop.globals.get_job_globals().target_path:
+        clean_temp(roop.globals.get_job_globals().target_path)
+    stop_metrics()
+    stop_profiling()
     sys.exit()
 
 
 def run() -> None:
     global ui
+    job_globals = roop.globals.get_job_globals()
+    signal.signal(signal.SIGINT, lambda signal_number, frame: destroy())
     parse_args()
     if not pre_check():
         return
-    for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+    for frame_processor in get_frame_processors_modules(job_globals.frame_processors):
         if not frame_processor.pre_check():
             return
     limit_resources()
-    if roop.globals.headless:
+    if job_globals.serve_inference:
+        start_metrics()
+        start_inference_server()
+        return
+    if job_globals.autotune:
+        start_autotune()
+        return
+    start_metrics()
+    start_profiling()
+    if job_globals.headless:
         start()
+        stop_metrics()
+        stop_profiling()
     else:
         import roop.ui as ui
         window = ui.init(start, destroy)
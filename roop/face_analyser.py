@@ -1,10 +1,18 @@
 import threading
-from typing import Any, Optional, List
+from typing import Any, Optional, List, Tuple
 import insightface
 import numpy
 
+try:
+    from scipy.optimize import linear_sum_assignment
+except (ImportError, ModuleNotFoundError):
+    linear_sum_assignment = None
+
 import roop.globals
-from roop.typing import Frame, Face
+import roop.inference
+import roop.metrics
+import roop.profiler
+from roop.typing import Frame, Face, FaceIndex
 
 FACE_ANALYSER = None
 THREAD_LOCK = threading.Lock()
@@ -15,8 +23,9 @@ def get_face_analyser() -> Any:
 
     with THREAD_LOCK:
         if FACE_ANALYSER is None:
-            FACE_ANALYSER = insightface.app.FaceAnalysis(name='buffalo_l', providers=roop.globals.execution_providers)
-            FACE_ANALYSER.prepare(ctx_id=0)
+            with roop.profiler.span('load buffalo_l', 'model'):
+                FACE_ANALYSER = insightface.app.FaceAnalysis(name='buffalo_l', providers=roop.globals.get_job_globals().execution_providers)
+                FACE_ANALYSER.prepare(ctx_id=0)
     return FACE_ANALYSER
 
 
@@ -38,17 +47,57 @@ def get_one_face(frame: Frame, position: int = 0) -> Optional[Face]:
 
 def get_many_faces(frame: Frame) -> Optional[List[Face]]:
     try:
-        return get_face_analyser().get(frame)
+        with roop.metrics.measure('detect'):
+            many_faces = roop.inference.request_faces(frame) if roop.globals.get_job_globals().inference_url else get_face_analyser().get(frame)
+        roop.metrics.observe_faces(len(many_faces))
+        return many_faces
     except ValueError:
         return None
 
 
 def find_similar_face(frame: Frame, reference_face: Face) -> Optional[Face]:
-    many_faces = get_many_faces(frame)
-    if many_faces:
-        for face in many_faces:
-            if hasattr(face, 'normed_embedding') and hasattr(reference_face, 'normed_embedding'):
-                distance = numpy.sum(numpy.square(face.normed_embedding - reference_face.normed_embedding))
-                if distance < roop.globals.similar_face_distance:
-                    return face
+    return get_similar_face(get_many_faces(frame), reference_face)
+
+
+def get_similar_face(many_faces: Optional[List[Face]], reference_face: Face) -> Optional[Face]:
+    if many_faces and getattr(reference_face, 'normed_embedding', None) is not None:
+        distances = get_face_distances(many_faces, reference_face.normed_embedding[numpy.newaxis])[:, 0]
+        index = int(numpy.argmin(distances))
+        if distances[index] < roop.globals.get_job_globals().similar_face_distance:
+            return many_faces[index]
     return None
+
+
+def get_face_distances(many_faces: List[Face], embeddings: numpy.ndarray[Any, Any]) -> numpy.ndarray[Any, Any]:
+    face_embeddings = numpy.array([face.normed_embedding if getattr(face, 'normed_embedding', None) is not None else numpy.full(embeddings.shape[1], numpy.nan) for face in many_faces], dtype=numpy.float32)
+    distances = numpy.sum(numpy.square(face_embeddings), axis=1)[:, numpy.newaxis] + numpy.sum(numpy.square(embeddings), axis=1)[numpy.newaxis] - 2 * face_embeddings @ embeddings.T
+    return numpy.nan_to_num(distances, nan=numpy.inf)
+
+
+def create_face_index(reference_faces: List[Face], source_faces: List[Face]) -> FaceIndex:
+    return {
+        'embeddings': numpy.array([reference_face.normed_embedding for reference_face in reference_faces], dtype=numpy.float32),
+        'source_faces': source_faces
+    }
+
+
+def assign_faces(distances: numpy.ndarray[Any, Any]) -> List[Tuple[int, int]]:
+    if linear_sum_assignment is not None:
+        face_positions, reference_positions = linear_sum_assignment(numpy.minimum(distances, numpy.finfo(numpy.float32).max))
+        return list(zip(face_positions.tolist(), reference_positions.tolist()))
+    assignments = []
+    used_faces = set()
+    used_references = set()
+    for face_position, reference_position in zip(*numpy.unravel_index(numpy.argsort(distances, axis=None), distances.shape)):
+        if face_position not in used_faces and reference_position not in used_references:
+            assignments.append((int(face_position), int(reference_position)))
+            used_faces.add(face_position)
+            used_references.add(reference_position)
+    return assignments
+
+
+def match_faces(many_faces: Optional[List[Face]], face_index: FaceIndex) -> List[Tuple[Face, Face]]:
+    if not many_faces or not face_index['source_faces']:
+        return []
+    distances = get_face_distances(many_faces, face_index['embeddings'])
+    return [(many_faces[face_position], face_index['source_faces'][reference_position]) for face_position, reference_position in assign_faces(distances) if distances[face_position, reference_position] < roop.globals.get_job_globals().similar_face_distance]
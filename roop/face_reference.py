@@ -1,21 +1,16 @@
 from typing import Optional
 
+import roop.globals
 from roop.typing import Face
 
-FACE_REFERENCE = None
-
 
 def get_face_reference() -> Optional[Face]:
-    return FACE_REFERENCE
+    return roop.globals.get_job_globals().face_reference
 
 
 def set_face_reference(face: Face) -> None:
-    global FACE_REFERENCE
-
-    FACE_REFERENCE = face
+    roop.globals.get_job_globals().face_reference = face
 
 
 def clear_face_reference() -> None:
-    global FACE_REFERENCE
-
-    FACE_REFERENCE = None
+    roop.globals.get_job_globals().face_reference = None
@@ -1,22 +1,77 @@
-from typing import List, Optional
+import copy
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import ModuleType, SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 source_path: Optional[str] = None
+source_paths: List[str] = []
 target_path: Optional[str] = None
 output_path: Optional[str] = None
 headless: Optional[bool] = None
 frame_processors: List[str] = []
 keep_fps: Optional[bool] = None
 keep_frames: Optional[bool] = None
+temp_directory: Optional[str] = None
+job_id: Optional[str] = None
 skip_audio: Optional[bool] = None
 many_faces: Optional[bool] = None
 reference_face_position: Optional[int] = None
 reference_frame_number: Optional[int] = None
 similar_face_distance: Optional[float] = None
+face_map: List[Tuple[str, str]] = []
 temp_frame_format: Optional[str] = None
 temp_frame_quality: Optional[int] = None
 output_video_encoder: Optional[str] = None
 output_video_quality: Optional[int] = None
+smart_render: Optional[bool] = None
+start_time: Optional[float] = None
+end_time: Optional[float] = None
+live: Optional[bool] = None
+live_latency: Optional[float] = None
+live_resolution: Optional[Tuple[int, int]] = None
+segment_duration: Optional[float] = None
 max_memory: Optional[int] = None
 execution_providers: List[str] = []
 execution_threads: Optional[int] = None
+execution_batch_size: Optional[int] = None
+concurrent_jobs: int = 1
+autotune: Optional[bool] = None
+serve_inference: Optional[bool] = None
+inference_port: Optional[int] = None
+inference_url: Optional[str] = None
+inference_batch_size: Optional[int] = None
+inference_max_wait: Optional[float] = None
+keep_models: bool = False
+metrics_port: Optional[int] = None
+metrics_host: Optional[str] = None
+metrics_path: Optional[str] = None
+metrics_interval: Optional[float] = None
+profile_path: Optional[str] = None
+profile_sample_rate: Optional[float] = None
+face_reference: Optional[Any] = None
 log_level: str = 'error'
+worker_state: Optional[Dict[str, Any]] = None
+JOB_GLOBALS: ContextVar[Optional[SimpleNamespace]] = ContextVar('job_globals', default=None)
+
+
+def get_process_globals() -> Dict[str, Any]:
+    return {name: copy.copy(value) for name, value in vars(sys.modules[__name__]).items() if name.islower() and not name.startswith('_') and not callable(value) and not isinstance(value, ModuleType)}
+
+
+def get_job_globals() -> Any:
+    job_globals = JOB_GLOBALS.get()
+    if job_globals is None:
+        return sys.modules[__name__]
+    return job_globals
+
+
+@contextmanager
+def job_scope() -> Iterator[SimpleNamespace]:
+    job_globals = SimpleNamespace(**get_process_globals())
+    token = JOB_GLOBALS.set(job_globals)
+    try:
+        yield job_globals
+    finally:
+        JOB_GLOBALS.reset(token)
@@ -0,0 +1,314 @@
+import http.client
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+import cv2
+import numpy
+import onnx
+import onnxruntime
+from insightface.utils.face_align import estimate_norm
+
+import roop.face_analyser
+import roop.globals
+import roop.metrics
+from roop.processors.frame.core import get_frame_processors_modules
+from roop.typing import Face, Frame
+
+INFERENCE_NAME = 'ROOP.INFERENCE'
+INFERENCE_HOST = '127.0.0.1'
+INFERENCE_TIMEOUT = 300
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+SWAP_SIZE = 128
+SWAP_CROP_PADDING = 8
+ONNX_TYPES = {'tensor(float)': numpy.float32, 'tensor(float16)': numpy.float16, 'tensor(int64)': numpy.int64}
+INFERENCE_QUEUES: Dict[str, 'Queue[Dict[str, Any]]'] = {}
+INFERENCE_MODELS: Dict[str, bool] = {}
+INFERENCE_STATE = {'active': 0}
+INFERENCE_LOCK = threading.Lock()
+INFERENCE_SERVER: Optional[ThreadingHTTPServer] = None
+CONNECTIONS = threading.local()
+
+
+def encode_arrays(arrays: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    named_arrays: Dict[str, Any] = {name: numpy.asarray(value) for name, value in arrays.items()}
+    numpy.savez(buffer, **named_arrays)
+    return buffer.getvalue()
+
+
+def decode_arrays(body: bytes) -> Dict[str, numpy.ndarray[Any, Any]]:
+    with numpy.load(io.BytesIO(body), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def encode_faces(many_faces: Optional[List[Face]]) -> Dict[str, Any]:
+    arrays = {'face_total': len(many_faces or [])}
+    for index, face in enumerate(many_faces or []):
+        for name, value in face.items():
+            if value is not None:
+                arrays[f'{index}.{name}'] = value
+    return arrays
+
+
+def decode_faces(arrays: Dict[str, numpy.ndarray[Any, Any]]) -> List[Face]:
+    many_faces = [Face() for _ in range(int(arrays['face_total']))]
+    for key, value in arrays.items():
+        index, separator, name = key.partition('.')
+        if separator:
+            many_faces[int(index)][name] = value.item() if value.ndim == 0 else value
+    return many_faces
+
+
+def get_connection() -> http.client.HTTPConnection:
+    inference_url = urlparse(roop.globals.get_job_globals().inference_url)
+    connection = getattr(CONNECTIONS, 'connection', None)
+    if connection is None or getattr(CONNECTIONS, 'netloc', None) != inference_url.netloc:
+        connection = http.client.HTTPConnection(inference_url.hostname, inference_url.port or 80, timeout=INFERENCE_TIMEOUT)
+        CONNECTIONS.connection = connection
+        CONNECTIONS.netloc = inference_url.netloc
+    return connection
+
+
+def request_inference(operation: str, arrays: Dict[str, Any]) -> Dict[str, numpy.ndarray[Any, Any]]:
+    from roop.core import update_status
+
+    body = encode_arrays(arrays)
+    for attempt in range(2):
+        connection = get_connection()
+        try:
+            connection.request('POST', '/' + operation, body, {'Content-Type': 'application/octet-stream'})
+            response = connection.getresponse()
+            response_body = response.read()
+            break
+        except (http.client.HTTPException, OSError) as exception:
+            connection.close()
+            CONNECTIONS.connection = None
+            if attempt:
+                update_status(f'Inference server at {roop.globals.get_job_globals().inference_url} failed to {operation}: {exception}', INFERENCE_NAME)
+                raise RuntimeError(f'Inference server failed to {operation}') from exception
+    if response.status != 200:
+        update_status(f'Inference server failed to {operation}: {response_body.decode(errors="replace")}', INFERENCE_NAME)
+        raise RuntimeError(f'Inference server failed to {operation}')
+    return decode_arrays(response_body)
+
+
+def is_inference_server_reachable(inference_url: str) -> bool:
+    inference_url_parsed = urlparse(inference_url)
+    connection = http.client.HTTPConnection(inference_url_parsed.hostname, inference_url_parsed.port or 80, timeout=10)
+    try:
+        connection.request('GET', '/')
+        return connection.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+def request_faces(frame: Frame) -> List[Face]:
+    return decode_faces(request_inference('detect', {'frame': frame}))
+
+
+def request_swap(source_face: Face, target_face: Face, temp_frame: Frame) -> Frame:
+    matrix = cv2.invertAffineTransform(estimate_norm(target_face.kps, SWAP_SIZE))
+    corners = cv2.transform(numpy.array([[[0, 0], [SWAP_SIZE, 0], [0, SWAP_SIZE], [SWAP_SIZE, SWAP_SIZE]]], dtype=numpy.float32), matrix)[0]
+    start_x, start_y = numpy.maximum(numpy.floor(corners.min(axis=0)).astype(int) - SWAP_CROP_PADDING, 0)
+    end_x, end_y = numpy.ceil(corners.max(axis=0)).astype(int) + SWAP_CROP_PADDING
+    temp_crop = temp_frame[start_y:end_y, start_x:end_x]
+    if not temp_crop.size:
+        return temp_frame
+    response = request_inference('swap', {
+        'crop': temp_crop,
+        'kps': target_face.kps - numpy.array([start_x, start_y], dtype=target_face.kps.dtype),
+        'embedding': source_face.embedding
+    })
+    temp_frame = temp_frame.copy()
+    temp_frame[start_y:end_y, start_x:end_x] = response['crop']
+    return temp_frame
+
+
+def request_enhance(temp_face: Frame) -> Frame:
+    return request_inference('enhance', {'crop': temp_face})['crop']
+
+
+def get_batch_size(input_feed: Dict[str, numpy.ndarray[Any, Any]]) -> int:
+    return len(next(iter(input_feed.values())))
+
+
+def get_batch_key(request: Dict[str, Any]) -> Any:
+    return tuple(request['output_names'] or []), tuple((name, value.shape[1:], value.dtype.str) for name, value in sorted(request['input_feed'].items()))
+
+
+def run_batch(session: Any, requests: List[Dict[str, Any]]) -> None:
+    try:
+        input_feed = {name: numpy.concatenate([request['input_feed'][name] for request in requests]) for name in requests[0]['input_feed']}
+        outputs = session.run(requests[0]['output_names'], input_feed)
+        offset = 0
+        for request in requests:
+            batch_size = get_batch_size(request['input_feed'])
+            request['outputs'] = [output[offset:offset + batch_size] for output in outputs]
+            offset += batch_size
+    except Exception as exception:
+        for request in requests:
+            request['error'] = exception
+    for request in requests:
+        request['done'].set()
+
+
+def collect_batch(queue: 'Queue[Dict[str, Any]]') -> List[Dict[str, Any]]:
+    requests = [queue.get()]
+    deadline = time.monotonic() + roop.globals.get_job_globals().inference_max_wait / 1000
+    while len(requests) < roop.globals.get_job_globals().inference_batch_size:
+        try:
+            requests.append(queue.get_nowait())
+            continue
+        except Empty:
+            pass
+        # only wait while other requests are in flight that may still reach this model
+        timeout = deadline - time.monotonic()
+        if timeout <= 0 or INFERENCE_STATE['active'] <= len(requests):
+            break
+        try:
+            requests.append(queue.get(timeout=timeout))
+        except Empty:
+            break
+    return requests
+
+
+def dispatch_batches(model_name: str, session: Any) -> None:
+    queue = INFERENCE_QUEUES[model_name]
+    while True:
+        requests = collect_batch(queue)
+        roop.metrics.observe('inference_batch_size', len(requests), BATCH_BUCKETS, model=model_name)
+        roop.metrics.set_gauge('queue_depth', queue.qsize(), queue=f'inference_{model_name}')
+        batches: Dict[Any, List[Dict[str, Any]]] = {}
+        for request in requests:
+            batches.setdefault(get_batch_key(request), []).append(request)
+        for batch_requests in batches.values():
+            run_batch(session, batch_requests)
+
+
+def run_batched(model_name: str, output_names: Optional[List[str]], input_feed: Dict[str, numpy.ndarray[Any, Any]], run_options: Any = None) -> List[numpy.ndarray[Any, Any]]:
+    done = threading.Event()
+    request: Dict[str, Any] = {'output_names': output_names, 'input_feed': input_feed, 'outputs': None, 'error': None, 'done': done}
+    INFERENCE_QUEUES[model_name].put(request)
+    done.wait()
+    error: Optional[Exception] = request['error']
+    if error:
+        raise error
+    outputs: List[numpy.ndarray[Any, Any]] = request['outputs']
+    return outputs
+
+
+def is_batchable(session: Any) -> bool:
+    return all(not isinstance(node.shape[0], int) for node in [*session.get_inputs(), *session.get_outputs()])
+
+
+def create_batch_session(session: Any, model_path: str) -> Optional[Any]:
+    if not all(node.shape and node.shape[0] == 1 for node in [*session.get_inputs(), *session.get_outputs()]):
+        return None
+    if not all(isinstance(dimension, int) for node in session.get_inputs() for dimension in node.shape):
+        return None
+    model = onnx.load(model_path)
+    node_names = {node.name for node in [*session.get_inputs(), *session.get_outputs()]}
+    for value_info in [*model.graph.input, *model.graph.output]:
+        if value_info.name in node_names:
+            value_info.type.tensor_type.shape.dim[0].dim_param = 'batch'
+    try:
+        batch_session = onnxruntime.InferenceSession(model.SerializeToString(), providers=session.get_providers())
+        outputs = batch_session.run(None, {node.name: numpy.zeros([2, *node.shape[1:]], dtype=ONNX_TYPES.get(node.type, numpy.float32)) for node in batch_session.get_inputs()})
+    except Exception:
+        return None
+    if not all(len(output) == 2 for output in outputs):
+        return None
+    return batch_session
+
+
+def share_model(model_name: str, model: Any) -> None:
+    session = model.session
+    if not is_batchable(session):
+        session = create_batch_session(session, model.model_file)
+    INFERENCE_MODELS[model_name] = session is not None
+    if session is None:
+        return
+    INFERENCE_QUEUES[model_name] = Queue()
+    threading.Thread(target=dispatch_batches, args=(model_name, session), name=f'roop-inference-{model_name}', daemon=True).start()
+    model.session = SimpleNamespace(
+        run=lambda output_names, input_feed, run_options=None: run_batched(model_name, output_names, input_feed, run_options),
+        get_inputs=session.get_inputs,
+        get_outputs=session.get_outputs,
+        get_providers=session.get_providers
+    )
+
+
+def serve_detect(arrays: Dict[str, numpy.ndarray[Any, Any]]) -> Dict[str, Any]:
+    return encode_faces(roop.face_analyser.get_many_faces(arrays['frame']))
+
+
+def serve_swap(arrays: Dict[str, numpy.ndarray[Any, Any]]) -> Dict[str, Any]:
+    face_swapper = get_frame_processors_modules(['face_swapper'])[0]
+    return {'crop': face_swapper.swap_face(Face(embedding=arrays['embedding']), Face(kps=arrays['kps']), arrays['crop'])}
+
+
+def serve_enhance(arrays: Dict[str, numpy.ndarray[Any, Any]]) -> Dict[str, Any]:
+    face_enhancer = get_frame_processors_modules(['face_enhancer'])[0]
+    return {'crop': face_enhancer.enhance_crop(arrays['crop'])}
+
+
+INFERENCE_OPERATIONS: Dict[str, Callable[[Dict[str, numpy.ndarray[Any, Any]]], Dict[str, Any]]] = {
+    'detect': serve_detect,
+    'swap': serve_swap,
+    'enhance': serve_enhance
+}
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def send_body(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.send_body(200, json.dumps({'models': INFERENCE_MODELS, 'active': INFERENCE_STATE['active']}).encode(), 'application/json')
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        operation = INFERENCE_OPERATIONS.get(self.path.strip('/'))
+        if operation is None:
+            self.send_body(404, b'unknown operation', 'text/plain')
+            return
+        with INFERENCE_LOCK:
+            INFERENCE_STATE['active'] += 1
+        try:
+            response_body = encode_arrays(operation(decode_arrays(body)))
+        except Exception as exception:
+            self.send_body(500, str(exception).encode(), 'text/plain')
+            return
+        finally:
+            with INFERENCE_LOCK:
+                INFERENCE_STATE['active'] -= 1
+        roop.metrics.increment('inference_requests_total', operation=self.path.strip('/'))
+        self.send_body(200, response_body, 'application/octet-stream')
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_inference_server(port: int, host: str = INFERENCE_HOST) -> None:
+    global INFERENCE_SERVER
+
+    for model_name, model in roop.face_analyser.get_face_analyser().models.items():
+        share_model(model_name, model)
+    if 'face_swapper' in roop.globals.get_job_globals().frame_processors:
+        share_model('inswapper', get_frame_processors_modules(['face_swapper'])[0].get_face_swapper())
+    INFERENCE_SERVER = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    INFERENCE_SERVER.serve_forever()
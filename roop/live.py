@@ -0,0 +1,198 @@
+import bisect
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import numpy
+
+import roop.globals
+import roop.metrics
+from roop.probe import probe_media, run_ffprobe
+from roop.typing import Frame
+from roop.utilities import get_video_encoder_args
+
+LIVE_PIPES = ['-', 'pipe:', 'pipe:0', 'pipe:1']
+LIVE_OUTPUT_FORMATS = {'rtmp': 'flv', 'rtmps': 'flv', 'udp': 'mpegts', 'tcp': 'mpegts', 'srt': 'mpegts', 'rtp': 'rtp_mpegts', 'pipe': 'mpegts'}
+LIVE_REPORT_INTERVAL = 5.0
+LIVE_LATENCY_WINDOW = 300
+LiveState = Dict[str, Any]
+
+
+def get_live_geometry(input_url: str) -> Optional[Tuple[int, int, float]]:
+    job_globals = roop.globals.get_job_globals()
+    probe = None
+    if input_url not in LIVE_PIPES:
+        probe = probe_media(input_url) if os.path.isfile(input_url) else run_ffprobe(input_url)
+    fps = probe['fps'] if probe and probe['fps'] else 30
+    if job_globals.live_resolution:
+        return job_globals.live_resolution[0], job_globals.live_resolution[1], fps
+    if probe and probe['width'] and probe['height']:
+        return probe['width'], probe['height'], fps
+    return None
+
+
+def get_live_output_format(output_url: str) -> Optional[str]:
+    if output_url in LIVE_PIPES:
+        return 'mpegts'
+    return LIVE_OUTPUT_FORMATS.get(urlparse(output_url).scheme)
+
+
+def open_live_reader(input_url: str, width: int, height: int) -> subprocess.Popen:  # type: ignore[type-arg]
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.get_job_globals().log_level, '-fflags', 'nobuffer', '-flags', 'low_delay']
+    if os.path.isfile(input_url):
+        commands.append('-re')
+    commands.extend(['-i', input_url, '-map', '0:v:0', '-vf', f'scale={width}:{height}', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'])
+    return subprocess.Popen(commands, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
+def open_live_writer(output_url: str, width: int, height: int, fps: float) -> subprocess.Popen:  # type: ignore[type-arg]
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.get_job_globals().log_level, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+    commands.extend(get_video_encoder_args())
+    if roop.globals.get_job_globals().output_video_encoder in ['libx264', 'libx265']:
+        commands.extend(['-tune', 'zerolatency'])
+    commands.extend(['-g', str(max(1, round(fps))), '-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1'])
+    output_format = get_live_output_format(output_url)
+    if output_format:
+        commands.extend(['-f', output_format])
+    commands.extend(['-y', output_url])
+    return subprocess.Popen(commands, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
+def create_live_state() -> LiveState:
+    return {
+        'condition': threading.Condition(),
+        'frame': None,
+        'captured_at': 0.0,
+        'sequence': 0,
+        'busy': 0,
+        'ended': False,
+        'results': [],
+        'written_sequence': 0,
+        'error': None,
+        'latencies': deque(maxlen=LIVE_LATENCY_WINDOW),
+        'counts': {'captured': 0, 'processed': 0, 'dropped': 0, 'reused': 0}
+    }
+
+
+def count_live_frame(state: LiveState, outcome: str) -> None:
+    state['counts'][outcome] += 1
+    roop.metrics.increment('live_frames_total', outcome=outcome)
+
+
+def read_live_frames(reader: subprocess.Popen, state: LiveState, width: int, height: int) -> None:  # type: ignore[type-arg]
+    frame_size = width * height * 3
+    while not state['ended']:
+        frame_bytes = reader.stdout.read(frame_size)
+        if len(frame_bytes) < frame_size:
+            break
+        frame = numpy.frombuffer(frame_bytes, dtype=numpy.uint8).reshape(height, width, 3).copy()
+        with state['condition']:
+            count_live_frame(state, 'captured')
+            # only the newest frame waits, so a slow chain skips frames instead of falling behind
+            if state['frame'] is not None:
+                count_live_frame(state, 'dropped')
+            state['frame'] = frame
+            state['captured_at'] = time.perf_counter()
+            state['sequence'] += 1
+            state['condition'].notify_all()
+    with state['condition']:
+        state['ended'] = True
+        state['condition'].notify_all()
+
+
+def process_live_frames(state: LiveState, process_frame: Callable[[Frame], Frame]) -> None:
+    latency_budget = roop.globals.get_job_globals().live_latency / 1000
+    while True:
+        with state['condition']:
+            while state['frame'] is None and not state['ended']:
+                state['condition'].wait()
+            if state['frame'] is None:
+                return
+            frame, captured_at, sequence = state['frame'], state['captured_at'], state['sequence']
+            state['frame'] = None
+            state['busy'] += 1
+        try:
+            result = process_frame(frame) if time.perf_counter() - captured_at < latency_budget else None
+        except Exception as exception:
+            with state['condition']:
+                state['busy'] -= 1
+                state['error'] = exception
+                state['ended'] = True
+                state['condition'].notify_all()
+            raise
+        with state['condition']:
+            state['busy'] -= 1
+            if result is None or sequence < state['written_sequence']:
+                count_live_frame(state, 'dropped')
+                continue
+            bisect.insort(state['results'], (sequence, captured_at, result))
+            state['condition'].notify_all()
+
+
+def pick_live_result(state: LiveState) -> Optional[Frame]:
+    latency_budget = roop.globals.get_job_globals().live_latency / 1000
+    with state['condition']:
+        while state['results']:
+            sequence, captured_at, result = state['results'].pop(0)
+            latency = time.perf_counter() - captured_at
+            if latency > latency_budget:
+                count_live_frame(state, 'dropped')
+                continue
+            state['written_sequence'] = sequence
+            state['latencies'].append(latency)
+            count_live_frame(state, 'processed')
+            roop.metrics.observe('live_latency_seconds', latency)
+            return result
+    return None
+
+
+def is_live_finished(state: LiveState) -> bool:
+    with state['condition']:
+        return state['error'] is not None or state['ended'] and state['frame'] is None and not state['busy']
+
+
+def write_live_frames(writer: subprocess.Popen, state: LiveState, fps: float, report: Callable[[LiveState], None]) -> None:  # type: ignore[type-arg]
+    frame_interval = 1 / fps
+    last_result = None
+    started_at = 0.0
+    written_total = 0
+    reported_at = time.perf_counter()
+    while True:
+        # results are written as soon as they are ready, the last one is repeated when the stream falls behind the wall clock
+        due_at = started_at + (written_total + 1) * frame_interval if last_result is not None else time.perf_counter() + frame_interval
+        with state['condition']:
+            if not state['results']:
+                state['condition'].wait(max(0.0, due_at - time.perf_counter()))
+        finished = is_live_finished(state)
+        result = pick_live_result(state)
+        if result is not None:
+            if last_result is None:
+                started_at = time.perf_counter()
+            last_result = result
+        elif finished:
+            break
+        elif last_result is not None and time.perf_counter() >= due_at:
+            count_live_frame(state, 'reused')
+        else:
+            continue
+        with roop.metrics.measure('encode'):
+            writer.stdin.write(last_result.tobytes())
+        written_total += 1
+        if time.perf_counter() - reported_at >= LIVE_REPORT_INTERVAL:
+            report(state)
+            reported_at = time.perf_counter()
+
+
+def get_live_summary(state: LiveState) -> Dict[str, float]:
+    with state['condition']:
+        latencies = sorted(state['latencies'])
+        counts = dict(state['counts'])
+    return {
+        'latency_p50': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'latency_p95': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        'drop_rate': counts['dropped'] / counts['captured'] if counts['captured'] else 0.0,
+        **counts
+    }
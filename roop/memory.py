@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import psutil
+
+import roop.globals
+import roop.metrics
+
+MEMORY_HIGH_WATERMARK = 0.9
+MEMORY_LOW_WATERMARK = 0.7
+MEMORY_SAMPLE_INTERVAL = 1.0
+MEMORY_GROW_INTERVAL = 5.0
+FRAME_WORKING_COPIES = 6
+WORKER_MAXIMUM = 16
+BATCHES_PER_WORKER = 4
+WORKER_OVERHEAD = 256 * 1024 ** 2
+MODEL_FOOTPRINTS: Dict[str, int] = {
+    'face_swapper': 1024 ** 3,
+    'face_enhancer': 800 * 1024 ** 2
+}
+WORKER_STATE_LOCK = threading.Lock()
+WorkerState = Dict[str, Any]
+
+
+def get_process_budget() -> int:
+    job_globals = roop.globals.get_job_globals()
+    if job_globals.max_memory:
+        return job_globals.max_memory * 1024 ** 3 * job_globals.concurrent_jobs
+    return psutil.virtual_memory().available + get_memory_usage()
+
+
+def get_memory_budget() -> int:
+    return get_process_budget() // roop.globals.get_job_globals().concurrent_jobs
+
+
+def get_memory_usage() -> int:
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def get_memory_pressure() -> float:
+    if roop.globals.get_job_globals().max_memory:
+        return get_memory_usage() / get_process_budget()
+    return psutil.virtual_memory().percent / 100
+
+
+def get_model_footprint(frame_processors: List[str]) -> int:
+    return sum(MODEL_FOOTPRINTS.get(frame_processor, 0) for frame_processor in frame_processors)
+
+
+def get_worker_footprint(frame_bytes: int) -> int:
+    return frame_bytes * FRAME_WORKING_COPIES + WORKER_OVERHEAD
+
+
+def suggest_worker_maximum() -> int:
+    if roop.globals.get_job_globals().execution_providers == ['CPUExecutionProvider']:
+        return os.cpu_count() or 1
+    return WORKER_MAXIMUM
+
+
+def suggest_worker_total(frame_bytes: int, maximum: int) -> int:
+    job_globals = roop.globals.get_job_globals()
+    # the loaded models and the memory of the other jobs are shared by every job of the process
+    footprint = max(get_memory_usage(), get_model_footprint(job_globals.frame_processors)) // job_globals.concurrent_jobs
+    headroom = get_memory_budget() * MEMORY_HIGH_WATERMARK - footprint
+    return max(1, min(maximum, int(headroom // get_worker_footprint(frame_bytes))))
+
+
+def suggest_batch_size(frame_total: int, worker_maximum: int) -> int:
+    return max(1, frame_total // (worker_maximum * BATCHES_PER_WORKER))
+
+
+def create_worker_state(limit: int, maximum: int) -> WorkerState:
+    return {
+        'condition': threading.Condition(),
+        'limit': limit,
+        'maximum': maximum,
+        'active': 0,
+        'pressure': 0.0,
+        'sampled_at': 0.0,
+        'resized_at': time.monotonic()
+    }
+
+
+def get_worker_state() -> WorkerState:
+    job_globals = roop.globals.get_job_globals()
+    with WORKER_STATE_LOCK:
+        if job_globals.worker_state is None:
+            job_globals.worker_state = create_worker_state(1, 1)
+        return job_globals.worker_state
+
+
+def start_workers(frame_bytes: int, maximum: Optional[int]) -> int:
+    worker_total = suggest_worker_total(frame_bytes, maximum or suggest_worker_maximum())
+    with WORKER_STATE_LOCK:
+        roop.globals.get_job_globals().worker_state = create_worker_state(worker_total, maximum or suggest_worker_maximum())
+    roop.metrics.set_gauge('worker_limit', worker_total)
+    return worker_total
+
+
+def get_worker_limit() -> int:
+    return get_worker_state()['limit']
+
+
+def get_worker_maximum() -> int:
+    return get_worker_state()['maximum']
+
+
+def adjust_workers(worker_state: WorkerState) -> None:
+    now = time.monotonic()
+    if now - worker_state['sampled_at'] < MEMORY_SAMPLE_INTERVAL:
+        return
+    worker_state['sampled_at'] = now
+    worker_state['pressure'] = get_memory_pressure()
+    if worker_state['pressure'] > MEMORY_HIGH_WATERMARK and worker_state['limit'] > 1:
+        worker_state['limit'] -= 1
+        worker_state['resized_at'] = now
+    elif worker_state['pressure'] < MEMORY_LOW_WATERMARK and worker_state['limit'] < worker_state['maximum'] and now - worker_state['resized_at'] >= MEMORY_GROW_INTERVAL:
+        worker_state['limit'] += 1
+        worker_state['resized_at'] = now
+        worker_state['condition'].notify()
+    roop.metrics.set_gauge('worker_limit', worker_state['limit'])
+    roop.metrics.set_gauge('memory_pressure', worker_state['pressure'])
+
+
+@contextmanager
+def worker_slot() -> Iterator[None]:
+    worker_state = get_worker_state()
+    with worker_state['condition']:
+        adjust_workers(worker_state)
+        while worker_state['active'] >= worker_state['limit']:
+            worker_state['condition'].wait(MEMORY_SAMPLE_INTERVAL)
+            adjust_workers(worker_state)
+        worker_state['active'] += 1
+    try:
+        yield
+    finally:
+        with worker_state['condition']:
+            worker_state['active'] -= 1
+            worker_state['condition'].notify()
@@ -0,0 +1,192 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import roop.profiler
+
+METRICS_PREFIX = 'roop'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+FACE_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+STAGES = ('scan', 'extract', 'decode', 'detect', 'swap', 'enhance', 'write', 'encode')
+Labels = Tuple[Tuple[str, str], ...]
+
+COUNTERS: Dict[Tuple[str, Labels], float] = {}
+GAUGES: Dict[Tuple[str, Labels], float] = {}
+HISTOGRAMS: Dict[Tuple[str, Labels], Dict[str, Any]] = {}
+METRICS_LOCK = threading.Lock()
+METRICS_SERVER: Optional[ThreadingHTTPServer] = None
+METRICS_WRITER: Optional[threading.Thread] = None
+METRICS_WRITER_STOP = threading.Event()
+METRICS_WRITER_LOCK = threading.Lock()
+STARTED_AT = time.time()
+
+
+def to_labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    key = (name, to_labels(labels))
+    with METRICS_LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    with METRICS_LOCK:
+        GAUGES[(name, to_labels(labels))] = value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+    key = (name, to_labels(labels))
+    bucket_index = bisect.bisect_left(buckets, value)
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = HISTOGRAMS[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        histogram['counts'][bucket_index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    observe('stage_seconds', seconds, stage=stage)
+
+
+def observe_faces(face_total: int) -> None:
+    observe('faces_per_frame', face_total, FACE_BUCKETS)
+
+
+@contextmanager
+def measure(stage: str) -> Iterator[None]:
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        end_time = time.perf_counter()
+        observe_stage(stage, end_time - start_time)
+        if roop.profiler.is_profiling():
+            roop.profiler.add_span(stage, 'stage', start_time, end_time)
+
+
+def reset_metrics() -> None:
+    with METRICS_LOCK:
+        COUNTERS.clear()
+        GAUGES.clear()
+        HISTOGRAMS.clear()
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    with METRICS_LOCK:
+        counters = dict(COUNTERS)
+        gauges = dict(GAUGES)
+        histograms = {key: {**histogram, 'counts': list(histogram['counts'])} for key, histogram in HISTOGRAMS.items()}
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f'{METRICS_PREFIX}_{name}{format_labels(labels)} {value:g}')
+    for (name, labels), value in sorted(gauges.items()):
+        lines.append(f'{METRICS_PREFIX}_{name}{format_labels(labels)} {value:g}')
+    for (name, labels), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+            cumulative += count
+            lines.append(f'{METRICS_PREFIX}_{name}_bucket{format_labels(labels, ("le", str(bound)))} {cumulative}')
+        lines.append(f'{METRICS_PREFIX}_{name}_sum{format_labels(labels)} {histogram["sum"]:g}')
+        lines.append(f'{METRICS_PREFIX}_{name}_count{format_labels(labels)} {histogram["count"]}')
+    lines.append(f'{METRICS_PREFIX}_uptime_seconds {time.time() - STARTED_AT:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot() -> Dict[str, Any]:
+    with METRICS_LOCK:
+        return {
+            'timestamp': time.time(),
+            'uptime': time.time() - STARTED_AT,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in COUNTERS.items()],
+            'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in GAUGES.items()],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'buckets': list(histogram['buckets']),
+                    'counts': list(histogram['counts']),
+                    'sum': histogram['sum'],
+                    'count': histogram['count'],
+                    'mean': histogram['sum'] / histogram['count'] if histogram['count'] else 0
+                } for (name, labels), histogram in HISTOGRAMS.items()
+            ]
+        }
+
+
+def write_snapshot(metrics_path: str) -> None:
+    metrics_directory_path = os.path.dirname(os.path.abspath(metrics_path))
+    os.makedirs(metrics_directory_path, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=metrics_directory_path, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as metrics_file:
+        json.dump(snapshot(), metrics_file, indent=2)
+    os.replace(temp_path, metrics_path)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] == '/metrics.json':
+            body = json.dumps(snapshot()).encode()
+            content_type = 'application/json'
+        else:
+            body = render_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> None:
+    global METRICS_SERVER
+
+    if METRICS_SERVER is None:
+        METRICS_SERVER = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        threading.Thread(target=METRICS_SERVER.serve_forever, name='roop-metrics-server', daemon=True).start()
+
+
+def start_metrics_writer(metrics_path: str, interval: float) -> None:
+    global METRICS_WRITER
+
+    def write_periodically() -> None:
+        while not METRICS_WRITER_STOP.wait(interval):
+            write_snapshot(metrics_path)
+
+    with METRICS_WRITER_LOCK:
+        if METRICS_WRITER is None:
+            METRICS_WRITER_STOP.clear()
+            METRICS_WRITER = threading.Thread(target=write_periodically, name='roop-metrics-writer', daemon=True)
+            METRICS_WRITER.start()
+
+
+def stop_metrics_writer(metrics_path: Optional[str]) -> None:
+    global METRICS_WRITER
+
+    with METRICS_WRITER_LOCK:
+        METRICS_WRITER_STOP.set()
+        # the old writer must see the stop before a new one clears it
+        if METRICS_WRITER is not None:
+            METRICS_WRITER.join()
+        METRICS_WRITER = None
+    if metrics_path:
+        write_snapshot(metrics_path)
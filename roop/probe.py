@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import roop.profiler
+from roop.typing import MediaProbe
+
+PROBE_CACHE: Dict[str, MediaProbe] = {}
+KEYFRAME_CACHE: Dict[str, List[int]] = {}
+PROBE_CACHE_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '../cache/probe'))
+PROBE_VERSION = 2
+IMAGE_FORMAT_NAMES = ('image2', 'png_pipe', 'jpeg_pipe', 'webp_pipe', 'bmp_pipe', 'tiff_pipe')
+THREAD_LOCK = threading.Lock()
+
+
+def probe_media(media_path: str) -> Optional[MediaProbe]:
+    if not media_path or not os.path.isfile(media_path):
+        return None
+    probe_key = get_probe_key(media_path)
+    with THREAD_LOCK:
+        if probe_key in PROBE_CACHE:
+            return PROBE_CACHE[probe_key]
+    probe = read_probe_cache(probe_key)
+    if probe is None:
+        probe = run_ffprobe(media_path)
+        if probe is None:
+            return None
+        write_probe_cache(probe_key, probe)
+    with THREAD_LOCK:
+        PROBE_CACHE[probe_key] = probe
+    return probe
+
+
+def probe_keyframes(media_path: str) -> Optional[List[int]]:
+    probe = probe_media(media_path)
+    if not probe or not probe['is_video'] or not probe['fps']:
+        return None
+    probe_key = get_probe_key(media_path) + '-keyframes'
+    with THREAD_LOCK:
+        if probe_key in KEYFRAME_CACHE:
+            return KEYFRAME_CACHE[probe_key]
+    keyframe_probe = read_probe_cache(probe_key)
+    if keyframe_probe is None:
+        keyframes = run_ffprobe_keyframes(media_path, probe['fps'])
+        if keyframes is None:
+            return None
+        keyframe_probe = {'keyframes': keyframes}
+        write_probe_cache(probe_key, keyframe_probe)
+    with THREAD_LOCK:
+        KEYFRAME_CACHE[probe_key] = keyframe_probe['keyframes']
+    return keyframe_probe['keyframes']
+
+
+def has_ffprobe() -> bool:
+    return shutil.which('ffprobe') is not None
+
+
+def get_probe_key(media_path: str) -> str:
+    stat = os.stat(media_path)
+    identity = f'{PROBE_VERSION}:{os.path.abspath(media_path)}:{stat.st_mtime_ns}:{stat.st_size}'
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def get_probe_cache_path(probe_key: str) -> str:
+    return os.path.join(PROBE_CACHE_DIRECTORY, probe_key[:2], probe_key + '.json')
+
+
+def read_probe_cache(probe_key: str) -> Optional[MediaProbe]:
+    probe_cache_path = get_probe_cache_path(probe_key)
+    try:
+        with open(probe_cache_path) as probe_cache_file:
+            return json.load(probe_cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_probe_cache(probe_key: str, probe: MediaProbe) -> None:
+    probe_cache_path = get_probe_cache_path(probe_key)
+    try:
+        os.makedirs(os.path.dirname(probe_cache_path), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(probe_cache_path), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as probe_cache_file:
+            json.dump(probe, probe_cache_file)
+        os.replace(temp_path, probe_cache_path)
+    except OSError:
+        pass
+
+
+def clear_probe_cache() -> None:
+    with THREAD_LOCK:
+        PROBE_CACHE.clear()
+        KEYFRAME_CACHE.clear()
+
+
+def run_ffprobe(media_path: str) -> Optional[MediaProbe]:
+    command = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', media_path]
+    try:
+        with roop.profiler.span('ffprobe', 'subprocess', path=media_path):
+            output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+        return parse_ffprobe(media_path, json.loads(output))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def run_ffprobe_keyframes(media_path: str, fps: float) -> Optional[List[int]]:
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', media_path]
+    try:
+        with roop.profiler.span('ffprobe keyframes', 'subprocess', path=media_path):
+            output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    timestamps = []
+    keyframe_timestamps = []
+    for line in output.decode().splitlines():
+        pts_time, _, flags = line.partition(',')
+        try:
+            timestamp = float(pts_time)
+        except ValueError:
+            continue
+        timestamps.append(timestamp)
+        if 'K' in flags:
+            keyframe_timestamps.append(timestamp)
+    if not timestamps:
+        return None
+    start_time = min(timestamps)
+    return sorted({int(round((keyframe_timestamp - start_time) * fps)) for keyframe_timestamp in keyframe_timestamps})
+
+
+def parse_ffprobe(media_path: str, data: Dict[str, Any]) -> MediaProbe:
+    format_info = data.get('format', {})
+    streams = data.get('streams', [])
+    video_streams = [stream for stream in streams if stream.get('codec_type') == 'video' and not stream.get('disposition', {}).get('attached_pic')]
+    audio_streams = [stream for stream in streams if stream.get('codec_type') == 'audio']
+    video_stream = video_streams[0] if video_streams else {}
+    format_name = format_info.get('format_name', '')
+    duration = parse_float(format_info.get('duration')) or parse_float(video_stream.get('duration'))
+    fps = parse_rate(video_stream.get('r_frame_rate')) or parse_rate(video_stream.get('avg_frame_rate'))
+    frame_total = parse_int(video_stream.get('nb_frames'))
+    if not frame_total and duration and fps:
+        frame_total = int(round(duration * fps))
+    return {
+        'path': os.path.abspath(media_path),
+        'size': parse_int(format_info.get('size')) or os.path.getsize(media_path),
+        'format_name': format_name,
+        'is_image': bool(video_stream) and format_name in IMAGE_FORMAT_NAMES,
+        'is_video': bool(video_stream) and format_name not in IMAGE_FORMAT_NAMES,
+        'duration': duration,
+        'fps': fps,
+        'frame_total': frame_total,
+        'width': parse_int(video_stream.get('width')),
+        'height': parse_int(video_stream.get('height')),
+        'rotation': detect_rotation(video_stream),
+        'video_codec': video_stream.get('codec_name'),
+        'video_profile': video_stream.get('profile'),
+        'video_level': parse_int(video_stream.get('level')),
+        'pix_fmt': video_stream.get('pix_fmt'),
+        'color_range': video_stream.get('color_range'),
+        'color_space': video_stream.get('color_space'),
+        'color_transfer': video_stream.get('color_transfer'),
+        'color_primaries': video_stream.get('color_primaries'),
+        'bit_rate': parse_int(format_info.get('bit_rate')),
+        'audio_streams': [
+            {
+                'index': parse_int(audio_stream.get('index')),
+                'codec': audio_stream.get('codec_name'),
+                'channels': parse_int(audio_stream.get('channels')),
+                'sample_rate': parse_int(audio_stream.get('sample_rate')),
+                'duration': parse_float(audio_stream.get('duration'))
+            } for audio_stream in audio_streams
+        ]
+    }
+
+
+def detect_rotation(video_stream: Dict[str, Any]) -> int:
+    rotation = parse_float(video_stream.get('tags', {}).get('rotate'))
+    for side_data in video_stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            rotation = -parse_float(side_data.get('rotation'))
+    return int(rotation) % 360
+
+
+def parse_rate(rate: Optional[str]) -> float:
+    try:
+        numerator, denominator = map(int, str(rate).split('/'))
+        return numerator / denominator
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+
+def parse_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_audio_streams(media_path: str) -> List[Dict[str, Any]]:
+    probe = probe_media(media_path)
+    if probe:
+        return probe['audio_streams']
+    return []
@@ -1,19 +1,30 @@
 import os
 import sys
+import contextvars
+import time
 import importlib
+import threading
 import psutil
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from queue import Queue
 from types import ModuleType
-from typing import Any, List, Callable
+from typing import Any, Dict, List, Callable
+import cv2
 from tqdm import tqdm
 
 import roop
+import roop.memory
+import roop.metrics
 
-FRAME_PROCESSORS_MODULES: List[ModuleType] = []
+FRAME_PROCESSORS_MODULES: Dict[str, ModuleType] = {}
+MEMORY_USAGE_INTERVAL = 1.0
+MEMORY_USAGE = {'sampled_at': 0.0, 'value': 0.0}
+PROGRESS_LOCK = threading.Lock()
 FRAME_PROCESSORS_INTERFACE = [
     'pre_check',
+    'pre_load',
     'pre_start',
+    'process_faces',
     'process_frame',
     'process_frames',
     'process_image',
@@ -36,25 +47,40 @@ def load_frame_processor_module(frame_processor: str) -> Any:
 
 
 def get_frame_processors_modules(frame_processors: List[str]) -> List[ModuleType]:
-    global FRAME_PROCESSORS_MODULES
+    for frame_processor in frame_processors:
+        if frame_processor not in FRAME_PROCESSORS_MODULES:
+            FRAME_PROCESSORS_MODULES[frame_processor] = load_frame_processor_module(frame_processor)
+    return [FRAME_PROCESSORS_MODULES[frame_processor] for frame_processor in frame_processors]
 
-    if not FRAME_PROCESSORS_MODULES:
-        for frame_processor in frame_processors:
-            frame_processor_module = load_frame_processor_module(frame_processor)
-            FRAME_PROCESSORS_MODULES.append(frame_processor_module)
-    return FRAME_PROCESSORS_MODULES
+
+def get_frame_bytes(temp_frame_paths: List[str]) -> int:
+    for temp_frame_path in temp_frame_paths[:1]:
+        temp_frame = cv2.imread(temp_frame_path)
+        if temp_frame is not None:
+            return temp_frame.nbytes
+    return 0
+
+
+def process_frames_in_slot(source_path: str, temp_frame_paths: List[str], process_frames: Callable[[str, List[str], Any], None], update: Callable[[], None]) -> None:
+    with roop.memory.worker_slot():
+        process_frames(source_path, temp_frame_paths, update)
 
 
 def multi_process_frame(source_path: str, temp_frame_paths: List[str], process_frames: Callable[[str, List[str], Any], None], update: Callable[[], None]) -> None:
-    with ThreadPoolExecutor(max_workers=roop.globals.execution_threads) as executor:
+    job_globals = roop.globals.get_job_globals()
+    roop.memory.start_workers(get_frame_bytes(temp_frame_paths), job_globals.execution_threads)
+    worker_maximum = roop.memory.get_worker_maximum()
+    with ThreadPoolExecutor(max_workers=worker_maximum) as executor:
         futures = []
         queue = create_queue(temp_frame_paths)
-        queue_per_future = max(len(temp_frame_paths) // roop.globals.execution_threads, 1)
+        queue_per_future = job_globals.execution_batch_size or roop.memory.suggest_batch_size(len(temp_frame_paths), worker_maximum)
         while not queue.empty():
-            future = executor.submit(process_frames, source_path, pick_queue(queue, queue_per_future), update)
+            future = executor.submit(contextvars.copy_context().run, process_frames_in_slot, source_path, pick_queue(queue, queue_per_future), process_frames, update)
             futures.append(future)
-        for future in as_completed(futures):
+        roop.metrics.set_gauge('queue_depth', len(futures), queue='frame_batches')
+        for index, future in enumerate(as_completed(futures), start=1):
             future.result()
+            roop.metrics.set_gauge('queue_depth', len(futures) - index, queue='frame_batches')
 
 
 def create_queue(temp_frame_paths: List[str]) -> Queue[str]:
@@ -75,17 +101,30 @@ def pick_queue(queue: Queue[str], queue_per_future: int) -> List[str]:
 def process_video(source_path: str, frame_paths: list[str], process_frames: Callable[[str, List[str], Any], None]) -> None:
     progress_bar_format = '{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]'
     total = len(frame_paths)
+    roop.metrics.set_gauge('queue_depth', total, queue='frames')
     with tqdm(total=total, desc='Processing', unit='frame', dynamic_ncols=True, bar_format=progress_bar_format) as progress:
         multi_process_frame(source_path, frame_paths, process_frames, lambda: update_progress(progress))
 
 
+def get_memory_usage() -> float:
+    now = time.monotonic()
+    if now - MEMORY_USAGE['sampled_at'] >= MEMORY_USAGE_INTERVAL:
+        MEMORY_USAGE['value'] = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024 / 1024
+        MEMORY_USAGE['sampled_at'] = now
+        roop.metrics.set_gauge('memory_rss_bytes', MEMORY_USAGE['value'] * 1024 * 1024 * 1024)
+        return MEMORY_USAGE['value']
+    return -1
+
+
 def update_progress(progress: Any = None) -> None:
-    process = psutil.Process(os.getpid())
-    memory_usage = process.memory_info().rss / 1024 / 1024 / 1024
-    progress.set_postfix({
-        'memory_usage': '{:.2f}'.format(memory_usage).zfill(5) + 'GB',
-        'execution_providers': roop.globals.execution_providers,
-        'execution_threads': roop.globals.execution_threads
-    })
-    progress.refresh()
-    progress.update(1)
+    roop.metrics.increment('frames_total')
+    with PROGRESS_LOCK:
+        memory_usage = get_memory_usage()
+        if memory_usage >= 0:
+            progress.set_postfix({
+                'memory_usage': '{:.2f}'.format(memory_usage).zfill(5) + 'GB',
+                'execution_providers': roop.globals.get_job_globals().execution_providers,
+                'execution_threads': f'{roop.memory.get_worker_limit()}/{roop.memory.get_worker_maximum()}'
+            }, refresh=False)
+        progress.update(1)
+        roop.metrics.set_gauge('queue_depth', progress.total - progress.n, queue='frames')
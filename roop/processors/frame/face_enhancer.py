@@ -1,5 +1,7 @@
-from typing import Any, List, Callable
+import os
+from typing import Any, List, Callable, Optional
 import cv2
+import numpy
 import threading
 
 try:
@@ -10,11 +12,14 @@ except (ImportError, ModuleNotFoundError):
     GFPGAN_AVAILABLE = False
 
 import roop.globals
+import roop.inference
+import roop.metrics
+import roop.profiler
 import roop.processors.frame.core
 from roop.core import update_status
 from roop.face_analyser import get_many_faces
 from roop.typing import Frame, Face
-from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video
+from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video, is_bulk_target
 
 FACE_ENHANCER = None
 THREAD_SEMAPHORE = threading.Semaphore()
@@ -31,14 +36,15 @@ def get_face_enhancer() -> Any:
         if FACE_ENHANCER is None:
             model_path = resolve_relative_path('../models/GFPGANv1.4.pth')
             # todo: set models path -> https://github.com/TencentARC/GFPGAN/issues/399
-            FACE_ENHANCER = GFPGANer(model_path=model_path, upscale=1, device=get_device())
+            with roop.profiler.span('load GFPGANv1.4', 'model'):
+                FACE_ENHANCER = GFPGANer(model_path=model_path, upscale=1, device=get_device())
     return FACE_ENHANCER
 
 
 def get_device() -> str:
-    if 'CUDAExecutionProvider' in roop.globals.execution_providers:
+    if 'CUDAExecutionProvider' in roop.globals.get_job_globals().execution_providers:
         return 'cuda'
-    if 'CoreMLExecutionProvider' in roop.globals.execution_providers:
+    if 'CoreMLExecutionProvider' in roop.globals.get_job_globals().execution_providers:
         return 'mps'
     return 'cpu'
 
@@ -58,15 +64,25 @@ def pre_check() -> bool:
     return True
 
 
+def pre_load() -> None:
+    if FACE_ENHANCER is None:
+        get_many_faces(numpy.zeros((128, 128, 3), dtype=numpy.uint8))
+        enhancer = get_face_enhancer()
+        if enhancer:
+            enhancer.enhance(numpy.zeros((512, 512, 3), dtype=numpy.uint8), has_aligned=True, paste_back=False)
+
+
 def pre_start() -> bool:
-    if not is_image(roop.globals.target_path) and not is_video(roop.globals.target_path):
-        update_status('Select an image or video for target path.', NAME)
+    job_globals = roop.globals.get_job_globals()
+    if not is_image(job_globals.target_path) and not is_video(job_globals.target_path) and not is_bulk_target(job_globals.target_path):
+        update_status('Select an image, video or image directory for target path.', NAME)
         return False
     return True
 
 
 def post_process() -> None:
-    clear_face_enhancer()
+    if not roop.globals.get_job_globals().keep_models:
+        clear_face_enhancer()
 
 
 def enhance_face(target_face: Face, temp_frame: Frame) -> Frame:
@@ -81,30 +97,44 @@ def enhance_face(target_face: Face, temp_frame: Frame) -> Frame:
     end_y = max(0, end_y + padding_y)
     temp_face = temp_frame[start_y:end_y, start_x:end_x]
     if temp_face.size:
-        with THREAD_SEMAPHORE:
-            enhancer = get_face_enhancer()
-            if enhancer:
-                _, _, temp_face = enhancer.enhance(
-                    temp_face,
-                    paste_back=True
-                )
+        with roop.metrics.measure('enhance'):
+            temp_face = enhance_crop(temp_face)
         temp_frame[start_y:end_y, start_x:end_x] = temp_face
     return temp_frame
 
 
-def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
-    many_faces = get_many_faces(temp_frame)
+def enhance_crop(temp_face: Frame) -> Frame:
+    if roop.globals.get_job_globals().inference_url:
+        return roop.inference.request_enhance(temp_face)
+    with THREAD_SEMAPHORE:
+        enhancer = get_face_enhancer()
+        if enhancer:
+            _, _, temp_face = enhancer.enhance(
+                temp_face,
+                paste_back=True
+            )
+    return temp_face
+
+
+def process_faces(source_face: Face, reference_face: Face, many_faces: Optional[List[Face]], temp_frame: Frame) -> Frame:
     if many_faces:
         for target_face in many_faces:
             temp_frame = enhance_face(target_face, temp_frame)
     return temp_frame
 
 
+def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
+    return process_faces(source_face, reference_face, get_many_faces(temp_frame), temp_frame)
+
+
 def process_frames(source_path: str, temp_frame_paths: List[str], update: Callable[[], None]) -> None:
     for temp_frame_path in temp_frame_paths:
-        temp_frame = cv2.imread(temp_frame_path)
-        result = process_frame(None, None, temp_frame)
-        cv2.imwrite(temp_frame_path, result)
+        with roop.profiler.span(os.path.basename(temp_frame_path), 'frame', processor=NAME):
+            with roop.metrics.measure('decode'):
+                temp_frame = cv2.imread(temp_frame_path)
+            result = process_frame(None, None, temp_frame)
+            with roop.metrics.measure('write'):
+                cv2.imwrite(temp_frame_path, result)
         if update:
             update()
 
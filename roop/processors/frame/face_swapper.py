@@ -1,18 +1,28 @@
-from typing import Any, List, Callable
+import os
+from typing import Any, Dict, List, Callable, Optional, Tuple
 import cv2
 import insightface
+import numpy
 import threading
+from insightface.utils.face_align import arcface_dst
 
 import roop.globals
+import roop.inference
+import roop.metrics
+import roop.profiler
 import roop.processors.frame.core
 from roop.core import update_status
-from roop.face_analyser import get_one_face, get_many_faces, find_similar_face
+from roop.face_analyser import get_one_face, get_many_faces, get_similar_face, create_face_index, match_faces
 from roop.face_reference import get_face_reference, set_face_reference, clear_face_reference
-from roop.typing import Face, Frame
-from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video
+from roop.typing import Face, FaceIndex, Frame
+from roop.utilities import conditional_download, resolve_relative_path, is_image, is_video, is_bulk_target
 
 FACE_SWAPPER = None
+SOURCE_FACES: Dict[str, Optional[Face]] = {}
+SOURCE_FACES_MAX = 8
+FACE_INDEXES: Dict[Tuple[Tuple[str, str], ...], FaceIndex] = {}
 THREAD_LOCK = threading.Lock()
+SOURCE_FACE_LOCK = threading.Lock()
 NAME = 'ROOP.FACE-SWAPPER'
 
 
@@ -22,7 +32,8 @@ def get_face_swapper() -> Any:
     with THREAD_LOCK:
         if FACE_SWAPPER is None:
             model_path = resolve_relative_path('../models/inswapper_128.onnx')
-            FACE_SWAPPER = insightface.model_zoo.get_model(model_path, providers=roop.globals.execution_providers)
+            with roop.profiler.span('load inswapper_128', 'model'):
+                FACE_SWAPPER = insightface.model_zoo.get_model(model_path, providers=roop.globals.get_job_globals().execution_providers)
     return FACE_SWAPPER
 
 
@@ -32,69 +43,140 @@ def clear_face_swapper() -> None:
     FACE_SWAPPER = None
 
 
+def get_source_face(source_path: str) -> Optional[Face]:
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return None
+    source_key = f'{os.path.abspath(source_path)}:{stat.st_mtime_ns}:{stat.st_size}'
+    with SOURCE_FACE_LOCK:
+        if source_key not in SOURCE_FACES:
+            SOURCE_FACES[source_key] = get_one_face(cv2.imread(source_path))
+            while len(SOURCE_FACES) > SOURCE_FACES_MAX:
+                SOURCE_FACES.pop(next(iter(SOURCE_FACES)))
+        return SOURCE_FACES[source_key]
+
+
+def clear_source_faces() -> None:
+    with SOURCE_FACE_LOCK:
+        SOURCE_FACES.clear()
+        FACE_INDEXES.clear()
+
+
+def get_face_index(face_map: List[Tuple[str, str]]) -> FaceIndex:
+    face_map_key = tuple(face_map)
+    with SOURCE_FACE_LOCK:
+        if face_map_key in FACE_INDEXES:
+            return FACE_INDEXES[face_map_key]
+    reference_faces = []
+    source_faces = []
+    for reference_path, source_path in face_map:
+        reference_face = get_source_face(reference_path)
+        source_face = get_source_face(source_path)
+        if reference_face and source_face:
+            reference_faces.append(reference_face)
+            source_faces.append(source_face)
+    with SOURCE_FACE_LOCK:
+        FACE_INDEXES[face_map_key] = create_face_index(reference_faces, source_faces)
+        return FACE_INDEXES[face_map_key]
+
+
 def pre_check() -> bool:
     download_directory_path = resolve_relative_path('../models')
     conditional_download(download_directory_path, ['https://huggingface.co/CountFloyd/deepfake/resolve/main/inswapper_128.onnx'])
     return True
 
 
+def pre_load() -> None:
+    if FACE_SWAPPER is None:
+        warm_up_frame = numpy.zeros((128, 128, 3), dtype=numpy.uint8)
+        get_many_faces(warm_up_frame)
+        warm_up_face = Face(bbox=numpy.array([0, 0, 112, 112]), kps=arcface_dst, embedding=numpy.ones(512, dtype=numpy.float32))
+        swap_face(warm_up_face, warm_up_face, warm_up_frame)
+
+
 def pre_start() -> bool:
-    if not is_image(roop.globals.source_path):
+    job_globals = roop.globals.get_job_globals()
+    for reference_path, source_path in job_globals.face_map:
+        if not is_image(reference_path) or not get_source_face(reference_path):
+            update_status(f'No face in face map reference {reference_path} detected.', NAME)
+            return False
+        if not is_image(source_path) or not get_source_face(source_path):
+            update_status(f'No face in face map source {source_path} detected.', NAME)
+            return False
+    if not is_image(job_globals.source_path):
         update_status('Select an image for source path.', NAME)
         return False
-    elif not get_one_face(cv2.imread(roop.globals.source_path)):
+    elif not get_source_face(job_globals.source_path):
         update_status('No face in source path detected.', NAME)
         return False
-    if not is_image(roop.globals.target_path) and not is_video(roop.globals.target_path):
-        update_status('Select an image or video for target path.', NAME)
+    if not is_image(job_globals.target_path) and not is_video(job_globals.target_path) and not is_bulk_target(job_globals.target_path):
+        update_status('Select an image, video or image directory for target path.', NAME)
         return False
     return True
 
 
 def post_process() -> None:
-    clear_face_swapper()
+    if not roop.globals.get_job_globals().keep_models:
+        clear_face_swapper()
+        clear_source_faces()
     clear_face_reference()
 
 
 def swap_face(source_face: Face, target_face: Face, temp_frame: Frame) -> Frame:
-    return get_face_swapper().get(temp_frame, target_face, source_face, paste_back=True)
-
-
-def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
-    if roop.globals.many_faces:
-        many_faces = get_many_faces(temp_frame)
+    with roop.metrics.measure('swap'):
+        if roop.globals.get_job_globals().inference_url:
+            return roop.inference.request_swap(source_face, target_face, temp_frame)
+        return get_face_swapper().get(temp_frame, target_face, source_face, paste_back=True)
+
+
+def process_faces(source_face: Face, reference_face: Face, many_faces: Optional[List[Face]], temp_frame: Frame) -> Frame:
+    job_globals = roop.globals.get_job_globals()
+    if job_globals.face_map:
+        for target_face, mapped_source_face in match_faces(many_faces, get_face_index(job_globals.face_map)):
+            temp_frame = swap_face(mapped_source_face, target_face, temp_frame)
+    elif job_globals.many_faces:
         if many_faces:
             for target_face in many_faces:
                 temp_frame = swap_face(source_face, target_face, temp_frame)
     else:
-        target_face = find_similar_face(temp_frame, reference_face)
+        target_face = get_similar_face(many_faces, reference_face)
         if target_face:
             temp_frame = swap_face(source_face, target_face, temp_frame)
     return temp_frame
 
 
+def process_frame(source_face: Face, reference_face: Face, temp_frame: Frame) -> Frame:
+    return process_faces(source_face, reference_face, get_many_faces(temp_frame), temp_frame)
+
+
 def process_frames(source_path: str, temp_frame_paths: List[str], update: Callable[[], None]) -> None:
-    source_face = get_one_face(cv2.imread(source_path))
-    reference_face = None if roop.globals.many_faces else get_face_reference()
+    source_face = get_source_face(source_path)
+    reference_face = None if roop.globals.get_job_globals().many_faces or roop.globals.get_job_globals().face_map else get_face_reference()
     for temp_frame_path in temp_frame_paths:
-        temp_frame = cv2.imread(temp_frame_path)
-        result = process_frame(source_face, reference_face, temp_frame)
-        cv2.imwrite(temp_frame_path, result)
+        with roop.profiler.span(os.path.basename(temp_frame_path), 'frame', processor=NAME):
+            with roop.metrics.measure('decode'):
+                temp_frame = cv2.imread(temp_frame_path)
+            result = process_frame(source_face, reference_face, temp_frame)
+            with roop.metrics.measure('write'):
+                cv2.imwrite(temp_frame_path, result)
         if update:
             update()
 
 
 def process_image(source_path: str, target_path: str, output_path: str) -> None:
-    source_face = get_one_face(cv2.imread(source_path))
+    job_globals = roop.globals.get_job_globals()
+    source_face = get_source_face(source_path)
     target_frame = cv2.imread(target_path)
-    reference_face = None if roop.globals.many_faces else get_one_face(target_frame, roop.globals.reference_face_position)
+    reference_face = None if job_globals.many_faces or job_globals.face_map else get_one_face(target_frame, job_globals.reference_face_position)
     result = process_frame(source_face, reference_face, target_frame)
     cv2.imwrite(output_path, result)
 
 
 def process_video(source_path: str, temp_frame_paths: List[str]) -> None:
-    if not roop.globals.many_faces and not get_face_reference():
-        reference_frame = cv2.imread(temp_frame_paths[roop.globals.reference_frame_number])
-        reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
+    job_globals = roop.globals.get_job_globals()
+    if not job_globals.many_faces and not job_globals.face_map and not get_face_reference():
+        reference_frame = cv2.imread(temp_frame_paths[job_globals.reference_frame_number])
+        reference_face = get_one_face(reference_frame, job_globals.reference_face_position)
         set_face_reference(reference_face)
     roop.processors.frame.core.process_video(source_path, temp_frame_paths, process_frames)
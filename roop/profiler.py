@@ -0,0 +1,83 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+TRACE_EVENTS: List[Dict[str, Any]] = []
+TRACE_THREADS: Dict[int, str] = {}
+PROFILING = {'enabled': False}
+TRACE_LOCK = threading.Lock()
+
+
+def enable_profiling(sample_rate: float = 1.0) -> bool:
+    PROFILING['enabled'] = random.random() < sample_rate
+    return PROFILING['enabled']
+
+
+def disable_profiling() -> None:
+    PROFILING['enabled'] = False
+
+
+def is_profiling() -> bool:
+    return PROFILING['enabled']
+
+
+def clear_trace() -> None:
+    with TRACE_LOCK:
+        TRACE_EVENTS.clear()
+        TRACE_THREADS.clear()
+
+
+def add_span(name: str, category: str, start_time: float, end_time: float, **args: Any) -> None:
+    thread_id = threading.get_ident()
+    if thread_id not in TRACE_THREADS:
+        with TRACE_LOCK:
+            TRACE_THREADS[thread_id] = threading.current_thread().name
+    TRACE_EVENTS.append({
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start_time * 1000000,
+        'dur': (end_time - start_time) * 1000000,
+        'pid': os.getpid(),
+        'tid': thread_id,
+        'args': args
+    })
+
+
+@contextmanager
+def span(name: str, category: str = 'stage', **args: Any) -> Iterator[None]:
+    if not PROFILING['enabled']:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, category, start_time, time.perf_counter(), **args)
+
+
+def get_trace() -> Dict[str, Any]:
+    with TRACE_LOCK:
+        trace_threads = dict(TRACE_THREADS)
+    thread_events = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id, 'args': {'name': thread_name}}
+        for thread_id, thread_name in trace_threads.items()
+    ]
+    return {
+        'traceEvents': thread_events + list(TRACE_EVENTS),
+        'displayTimeUnit': 'ms'
+    }
+
+
+def write_trace(trace_path: str) -> None:
+    trace_directory_path = os.path.dirname(os.path.abspath(trace_path))
+    os.makedirs(trace_directory_path, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=trace_directory_path, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as trace_file:
+        json.dump(get_trace(), trace_file)
+    os.replace(temp_path, trace_path)
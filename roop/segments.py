@@ -0,0 +1,66 @@
+import math
+import os
+from typing import List, Optional
+
+import roop.globals
+from roop.utilities import get_temp_directory_path, get_video_encoder_args, run_ffmpeg
+
+SEGMENT_PLAYLIST_FILE = 'playlist.m3u8'
+SEGMENT_LIST_FILE = 'segments.txt'
+SEGMENT_ENCODERS = ['libx264', 'libx265', 'h264_nvenc', 'hevc_nvenc']
+
+
+def get_segment_directory_path(output_path: str) -> str:
+    output_name, _ = os.path.splitext(output_path)
+    return output_name + '-segments'
+
+
+def get_segment_path(segment_directory_path: str, segment_number: int) -> str:
+    return os.path.join(segment_directory_path, f'segment_{segment_number:05d}.ts')
+
+
+def get_playlist_path(segment_directory_path: str) -> str:
+    return os.path.join(segment_directory_path, SEGMENT_PLAYLIST_FILE)
+
+
+def can_create_segments() -> bool:
+    return roop.globals.get_job_globals().output_video_encoder in SEGMENT_ENCODERS
+
+
+def create_segment(target_path: str, segment_path: str, fps: float, start_number: int, frame_total: int) -> bool:
+    temp_directory_path = get_temp_directory_path(target_path)
+    start_time = (start_number - 1) / fps
+    commands = ['-hwaccel', 'auto', '-r', str(fps), '-start_number', str(start_number), '-i', os.path.join(temp_directory_path, '%04d.' + roop.globals.get_job_globals().temp_frame_format)]
+    if not roop.globals.get_job_globals().skip_audio:
+        commands.extend(['-ss', str(start_time), '-t', str(frame_total / fps), '-i', target_path, '-map', '1:a:0?', '-c:a', 'aac'])
+    commands.extend(['-map', '0:v:0', '-frames:v', str(frame_total)])
+    commands.extend(get_video_encoder_args())
+    commands.extend(['-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1', '-output_ts_offset', str(start_time), '-muxdelay', '0', '-f', 'mpegts', '-y', segment_path])
+    return run_ffmpeg(commands)
+
+
+def write_playlist(playlist_path: str, segment_durations: List[float], finished: bool) -> None:
+    target_duration = math.ceil(max(segment_durations, default=roop.globals.get_job_globals().segment_duration or 1))
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{target_duration}', '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT']
+    for segment_number, segment_duration in enumerate(segment_durations):
+        lines.append(f'#EXTINF:{segment_duration:.6f},')
+        lines.append(os.path.basename(get_segment_path('', segment_number)))
+    if finished:
+        lines.append('#EXT-X-ENDLIST')
+    temp_playlist_path = playlist_path + '.tmp'
+    with open(temp_playlist_path, 'w') as playlist_file:
+        playlist_file.write('\n'.join(lines) + '\n')
+    os.replace(temp_playlist_path, playlist_path)
+
+
+def concat_segments(segment_paths: List[str], output_path: str, codec_tag: Optional[str] = None) -> bool:
+    segment_list_path = os.path.join(os.path.dirname(segment_paths[0]), SEGMENT_LIST_FILE)
+    with open(segment_list_path, 'w') as segment_list_file:
+        for segment_path in segment_paths:
+            segment_list_file.write(f"file '{os.path.basename(segment_path)}'\n")
+    commands = ['-f', 'concat', '-safe', '0', '-i', segment_list_path, '-c', 'copy']
+    if codec_tag:
+        commands.extend(['-tag:v', codec_tag])
+    done = run_ffmpeg(commands + ['-y', output_path])
+    os.remove(segment_list_path)
+    return done
@@ -0,0 +1,122 @@
+import os
+from typing import List, Optional, Tuple
+
+import roop.globals
+from roop.capturer import get_video_reader, read_video_frame
+from roop.face_analyser import get_many_faces
+from roop.probe import probe_keyframes, probe_media
+from roop.typing import MediaProbe
+from roop.utilities import get_temp_directory_path, get_video_encoder_args, run_ffmpeg
+
+SMART_RENDER_ENCODERS = {
+    'h264': ['libx264', 'h264_nvenc'],
+    'hevc': ['libx265', 'hevc_nvenc']
+}
+SMART_RENDER_PROFILES = {
+    'h264': {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high'},
+    'hevc': {'Main': 'main'}
+}
+SMART_RENDER_LEVEL_SCALES = {'h264': 10, 'hevc': 30}
+SMART_RENDER_COLOR_MATRICES = {'bt709': 'bt709', 'smpte170m': 'smpte170m', 'bt470bg': 'bt470', 'smpte240m': 'smpte240m', 'fcc': 'fcc', 'bt2020nc': 'bt2020'}
+SMART_RENDER_CODEC_TAGS = {'h264': 'avc3', 'hevc': 'hev1'}
+SMART_RENDER_UNKNOWN_TAGS = [None, 'unknown', 'reserved', 'unspecified']
+SMART_RENDER_SCAN_SECONDS = 0.5
+SMART_RENDER_SPAN_DIRECTORY = 'spans'
+
+Span = Tuple[int, int, bool]
+
+
+def can_smart_render(target_path: str) -> bool:
+    probe = probe_media(target_path)
+    if not probe or not probe['is_video'] or not roop.globals.get_job_globals().keep_fps or probe['rotation']:
+        return False
+    if probe['pix_fmt'] != 'yuv420p' or roop.globals.get_job_globals().output_video_encoder not in SMART_RENDER_ENCODERS.get(probe['video_codec'], []):
+        return False
+    # encoded spans must match the copied ones, so their profile and color matrix have to be reproducible
+    if probe['video_profile'] not in SMART_RENDER_PROFILES[probe['video_codec']]:
+        return False
+    if probe['color_space'] not in SMART_RENDER_UNKNOWN_TAGS and probe['color_space'] not in SMART_RENDER_COLOR_MATRICES:
+        return False
+    return bool(probe_keyframes(target_path))
+
+
+def get_scan_interval(fps: float) -> int:
+    return max(1, round(fps * SMART_RENDER_SCAN_SECONDS))
+
+
+def scan_face_frames(target_path: str, scan_interval: int, frame_range: Tuple[int, int]) -> Optional[List[int]]:
+    video_reader = get_video_reader(target_path)
+    if not video_reader:
+        return None
+    face_frames = []
+    for frame_index in range(frame_range[0], min(frame_range[1], video_reader['frame_total']), scan_interval):
+        frame = read_video_frame(video_reader, frame_index)
+        if frame is None:
+            break
+        if get_many_faces(frame):
+            face_frames.append(frame_index)
+    return face_frames
+
+
+def plan_spans(face_frames: Optional[List[int]], scan_interval: int, keyframes: List[int], frame_total: int, frame_range: Tuple[int, int]) -> List[Span]:
+    boundaries = sorted({0, *[keyframe for keyframe in keyframes if 0 < keyframe < frame_total], frame_total})
+    face_ranges = [(max(0, face_frame - scan_interval), face_frame + scan_interval) for face_frame in face_frames] if face_frames is not None else [frame_range]
+    spans: List[Span] = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        has_face = start < frame_range[1] and frame_range[0] < end and any(face_start < end and start <= face_end for face_start, face_end in face_ranges)
+        if spans and spans[-1][2] == has_face:
+            spans[-1] = (spans[-1][0], end, has_face)
+        else:
+            spans.append((start, end, has_face))
+    return spans
+
+
+def get_span_directory_path(target_path: str) -> str:
+    return os.path.join(get_temp_directory_path(target_path), SMART_RENDER_SPAN_DIRECTORY)
+
+
+def get_span_path(span_directory_path: str, span_number: int) -> str:
+    return os.path.join(span_directory_path, f'span_{span_number:05d}.ts')
+
+
+def extract_span_frames(target_path: str, fps: float, start: int, end: int) -> bool:
+    temp_directory_path = get_temp_directory_path(target_path)
+    temp_frame_quality = roop.globals.get_job_globals().temp_frame_quality * 31 // 100
+    return run_ffmpeg(['-hwaccel', 'auto', '-ss', str(start / fps), '-i', target_path, '-frames:v', str(end - start), '-q:v', str(temp_frame_quality), '-pix_fmt', 'rgb24', '-start_number', str(start + 1), os.path.join(temp_directory_path, '%04d.' + roop.globals.get_job_globals().temp_frame_format)])
+
+
+def get_span_encoder_args(probe: MediaProbe) -> List[str]:
+    video_codec = probe['video_codec']
+    commands = get_video_encoder_args()
+    commands.extend(['-profile:v', SMART_RENDER_PROFILES[video_codec][probe['video_profile']]])
+    if probe['video_level'] > 0:
+        level = f'{probe["video_level"] / SMART_RENDER_LEVEL_SCALES[video_codec]:g}'
+        if roop.globals.get_job_globals().output_video_encoder == 'libx265':
+            commands.extend(['-x265-params', f'level-idc={level}'])
+        else:
+            commands.extend(['-level', level])
+    # frames were decoded with the target's matrix and range, so they are encoded back with them instead of converting to bt709
+    color_matrix = SMART_RENDER_COLOR_MATRICES.get(probe['color_space'], 'bt601')
+    color_range = 'pc' if probe['color_range'] == 'pc' else 'tv'
+    commands.extend(['-pix_fmt', 'yuv420p', '-vf', f'scale=out_color_matrix={color_matrix}:out_range={color_range}'])
+    for option, name in [('-color_primaries', 'color_primaries'), ('-color_trc', 'color_transfer'), ('-colorspace', 'color_space'), ('-color_range', 'color_range')]:
+        if probe[name] not in SMART_RENDER_UNKNOWN_TAGS:
+            commands.extend([option, probe[name]])
+    return commands
+
+
+def get_span_codec_tag(target_path: str) -> str:
+    return SMART_RENDER_CODEC_TAGS[probe_media(target_path)['video_codec']]
+
+
+def encode_span(target_path: str, span_path: str, fps: float, start: int, end: int) -> bool:
+    temp_directory_path = get_temp_directory_path(target_path)
+    commands = ['-hwaccel', 'auto', '-r', str(fps), '-start_number', str(start + 1), '-i', os.path.join(temp_directory_path, '%04d.' + roop.globals.get_job_globals().temp_frame_format), '-frames:v', str(end - start)]
+    commands.extend(get_span_encoder_args(probe_media(target_path)))
+    commands.extend(['-an', '-f', 'mpegts', '-y', span_path])
+    return run_ffmpeg(commands)
+
+
+def copy_span(target_path: str, span_path: str, fps: float, start: int, end: int) -> bool:
+    start_time = (start + 0.5) / fps if start else 0.0
+    return run_ffmpeg(['-ss', str(start_time), '-i', target_path, '-map', '0:v:0', '-frames:v', str(end - start), '-c', 'copy', '-an', '-f', 'mpegts', '-y', span_path])
@@ -1,7 +1,10 @@
-from typing import Any
+from typing import Any, Dict
 
 from insightface.app.common import Face
 import numpy
 
 Face = Face
 Frame = numpy.ndarray[Any, Any]
+MediaProbe = Dict[str, Any]
+FaceIndex = Dict[str, Any]
+VideoReader = Dict[str, Any]
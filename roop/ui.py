@@ -1,19 +1,23 @@
 import os
 import sys
+import threading
 import webbrowser
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import customtkinter as ctk
 from tkinterdnd2 import TkinterDnD, DND_ALL
-from typing import Any, Callable, Tuple, Optional
+from typing import Any, Callable, List, Tuple, Optional
 import cv2
 from PIL import Image, ImageOps
 
 import roop.globals
 import roop.metadata
-from roop.face_analyser import get_one_face
+from roop.face_analyser import get_one_face, get_many_faces
 from roop.capturer import get_video_frame, get_video_frame_total
 from roop.face_reference import get_face_reference, set_face_reference, clear_face_reference
 from roop.predictor import predict_frame, clear_predictor
 from roop.processors.frame.core import get_frame_processors_modules
+from roop.typing import Face, Frame
 from roop.utilities import is_image, is_video, resolve_relative_path
 
 ROOT = None
@@ -23,6 +27,14 @@ ROOT_WIDTH = 600
 PREVIEW = None
 PREVIEW_MAX_HEIGHT = 700
 PREVIEW_MAX_WIDTH = 1200
+PREVIEW_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+PREVIEW_FRAMES: 'OrderedDict[Tuple[Any, ...], Frame]' = OrderedDict()
+PREVIEW_FRAMES_MAX = 16
+PREVIEW_POLL_INTERVAL = 20
+PREVIEW_LOCK = threading.Lock()
+PREVIEW_REQUEST = 0
+PREVIEW_STEP = 0
+SOURCE_FACE: Tuple[Optional[str], Optional[Face]] = (None, None)
 
 RECENT_DIRECTORY_SOURCE = None
 RECENT_DIRECTORY_TARGET = None
@@ -149,6 +161,7 @@ def select_source_path(source_path: Optional[str] = None) -> None:
 
     if PREVIEW:
         PREVIEW.withdraw()
+    clear_preview_frames()
     if source_path is None:
         source_path = ctk.filedialog.askopenfilename(title='select an source image', initialdir=RECENT_DIRECTORY_SOURCE)
     if is_image(source_path):
@@ -166,6 +179,7 @@ def select_target_path(target_path: Optional[str] = None) -> None:
 
     if PREVIEW:
         PREVIEW.withdraw()
+    clear_preview_frames()
     clear_face_reference()
     if target_path is None:
         target_path = ctk.filedialog.askopenfilename(title='select an target image or video', initialdir=RECENT_DIRECTORY_TARGET)
@@ -207,17 +221,12 @@ def render_image_preview(image_path: str, size: Tuple[int, int]) -> ctk.CTkImage
 
 
 def render_video_preview(video_path: str, size: Tuple[int, int], frame_number: int = 0) -> ctk.CTkImage:
-    capture = cv2.VideoCapture(video_path)
-    if frame_number:
-        capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-    has_frame, frame = capture.read()
-    if has_frame:
+    frame = get_video_frame(video_path, frame_number)
+    if frame is not None:
         image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
         if size:
             image = ImageOps.fit(image, size, Image.LANCZOS)
         return ctk.CTkImage(image, size=image.size)
-    capture.release()
-    cv2.destroyAllWindows()
 
 
 def toggle_preview() -> None:
@@ -225,6 +234,7 @@ def toggle_preview() -> None:
         PREVIEW.unbind('<Right>')
         PREVIEW.unbind('<Left>')
         PREVIEW.withdraw()
+        cancel_preview()
         clear_predictor()
     elif roop.globals.source_path and roop.globals.target_path:
         init_preview()
@@ -233,7 +243,10 @@ def toggle_preview() -> None:
 
 
 def init_preview() -> None:
+    global PREVIEW_STEP
+
     PREVIEW.title('Preview [ ↕ Reference face ]')
+    PREVIEW_STEP = 0
     if is_image(roop.globals.target_path):
         preview_slider.pack_forget()
     if is_video(roop.globals.target_path):
@@ -242,36 +255,154 @@ def init_preview() -> None:
             PREVIEW.title('Preview [ ↕ Reference face ] [ ↔ Frame number ]')
             PREVIEW.bind('<Right>', lambda event: update_frame(int(video_frame_total / 20)))
             PREVIEW.bind('<Left>', lambda event: update_frame(int(video_frame_total / -20)))
+            PREVIEW_STEP = int(video_frame_total / 20)
         preview_slider.configure(to=video_frame_total)
         preview_slider.pack(fill='x')
         preview_slider.set(roop.globals.reference_frame_number)
 
 
+def get_file_key(file_path: str) -> str:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return file_path
+    return f'{file_path}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def get_source_face() -> Optional[Face]:
+    global SOURCE_FACE
+
+    source_key = get_file_key(roop.globals.source_path)
+    with PREVIEW_LOCK:
+        if SOURCE_FACE[0] == source_key:
+            return SOURCE_FACE[1]
+    source_face = get_one_face(cv2.imread(roop.globals.source_path))
+    with PREVIEW_LOCK:
+        SOURCE_FACE = source_key, source_face
+    return source_face
+
+
+def get_preview_key(frame_number: int) -> Tuple[Any, ...]:
+    return (
+        get_file_key(roop.globals.source_path),
+        get_file_key(roop.globals.target_path),
+        frame_number,
+        tuple(roop.globals.frame_processors),
+        roop.globals.many_faces,
+        roop.globals.reference_face_position,
+        roop.globals.reference_frame_number,
+        roop.globals.similar_face_distance,
+        tuple(roop.globals.face_map)
+    )
+
+
+def get_preview_frame(preview_key: Tuple[Any, ...]) -> Optional[Frame]:
+    with PREVIEW_LOCK:
+        if preview_key in PREVIEW_FRAMES:
+            PREVIEW_FRAMES.move_to_end(preview_key)
+            return PREVIEW_FRAMES[preview_key]
+    return None
+
+
+def set_preview_frame(preview_key: Tuple[Any, ...], temp_frame: Frame) -> None:
+    with PREVIEW_LOCK:
+        PREVIEW_FRAMES[preview_key] = temp_frame
+        while len(PREVIEW_FRAMES) > PREVIEW_FRAMES_MAX:
+            PREVIEW_FRAMES.popitem(last=False)
+
+
+def clear_preview_frames() -> None:
+    global SOURCE_FACE
+
+    cancel_preview()
+    with PREVIEW_LOCK:
+        PREVIEW_FRAMES.clear()
+        SOURCE_FACE = None, None
+
+
+def is_stale_preview(request: int) -> bool:
+    return request != PREVIEW_REQUEST
+
+
+def cancel_preview() -> None:
+    global PREVIEW_REQUEST
+
+    with PREVIEW_LOCK:
+        PREVIEW_REQUEST += 1
+
+
+def render_preview_frame(request: int, frame_number: int) -> Optional[Frame]:
+    preview_key = get_preview_key(frame_number)
+    temp_frame = get_preview_frame(preview_key)
+    if temp_frame is not None or is_stale_preview(request):
+        return temp_frame
+    temp_frame = get_video_frame(roop.globals.target_path, frame_number)
+    if temp_frame is None:
+        return None
+    if predict_frame(temp_frame):
+        sys.exit()
+    source_face = get_source_face()
+    reference_face = get_face_reference()
+    if not reference_face:
+        reference_frame = get_video_frame(roop.globals.target_path, roop.globals.reference_frame_number)
+        reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
+        with PREVIEW_LOCK:
+            if is_stale_preview(request):
+                return None
+            set_face_reference(reference_face)
+    many_faces = get_many_faces(temp_frame)
+    for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
+        if is_stale_preview(request):
+            return None
+        temp_frame = frame_processor.process_faces(source_face, reference_face, many_faces, temp_frame)
+    set_preview_frame(preview_key, temp_frame)
+    return temp_frame
+
+
+def get_prefetch_frame_numbers(frame_number: int) -> List[int]:
+    if not PREVIEW_STEP:
+        return []
+    return [prefetch_frame_number for prefetch_frame_number in (frame_number + PREVIEW_STEP, frame_number - PREVIEW_STEP) if 0 <= prefetch_frame_number <= preview_slider.cget('to')]
+
+
 def update_preview(frame_number: int = 0) -> None:
     if roop.globals.source_path and roop.globals.target_path:
-        temp_frame = get_video_frame(roop.globals.target_path, frame_number)
-        if predict_frame(temp_frame):
-            sys.exit()
-        source_face = get_one_face(cv2.imread(roop.globals.source_path))
-        if not get_face_reference():
-            reference_frame = get_video_frame(roop.globals.target_path, roop.globals.reference_frame_number)
-            reference_face = get_one_face(reference_frame, roop.globals.reference_face_position)
-            set_face_reference(reference_face)
+        frame_number = int(frame_number)
+        cancel_preview()
+        request = PREVIEW_REQUEST
+        temp_frame = get_preview_frame(get_preview_key(frame_number))
+        if temp_frame is not None:
+            show_preview(temp_frame)
         else:
-            reference_face = get_face_reference()
-        for frame_processor in get_frame_processors_modules(roop.globals.frame_processors):
-            temp_frame = frame_processor.process_frame(
-                source_face,
-                reference_face,
-                temp_frame
-            )
-        image = Image.fromarray(cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB))
-        image = ImageOps.contain(image, (PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT), Image.LANCZOS)
-        image = ctk.CTkImage(image, size=image.size)
-        preview_label.configure(image=image)
+            poll_preview(request, PREVIEW_EXECUTOR.submit(render_preview_frame, request, frame_number))
+        for prefetch_frame_number in get_prefetch_frame_numbers(frame_number):
+            PREVIEW_EXECUTOR.submit(render_preview_frame, request, prefetch_frame_number)
+
+
+def poll_preview(request: int, future: Future[Optional[Frame]]) -> None:
+    if is_stale_preview(request):
+        return
+    if not future.done():
+        PREVIEW.after(PREVIEW_POLL_INTERVAL, lambda: poll_preview(request, future))
+        return
+    try:
+        temp_frame = future.result()
+    except RuntimeError as exception:
+        update_status(str(exception))
+        return
+    if temp_frame is not None:
+        show_preview(temp_frame)
+
+
+def show_preview(temp_frame: Frame) -> None:
+    image = Image.fromarray(cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB))
+    image = ImageOps.contain(image, (PREVIEW_MAX_WIDTH, PREVIEW_MAX_HEIGHT), Image.LANCZOS)
+    image = ctk.CTkImage(image, size=image.size)
+    preview_label.configure(image=image)
 
 
 def update_face_reference(steps: int) -> None:
+    cancel_preview()
     clear_face_reference()
     reference_frame_number = int(preview_slider.get())
     roop.globals.reference_face_position += steps
@@ -7,13 +7,20 @@ import ssl
 import subprocess
 import urllib
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+import psutil
 from tqdm import tqdm
 
 import roop.globals
+import roop.profiler
+from roop.probe import probe_media, has_ffprobe
 
 TEMP_DIRECTORY = 'temp'
 TEMP_VIDEO_FILE = 'temp.mp4'
+TEMP_OWNER_FILE = '.owner'
+TEMP_FRAME_RATIOS = {'jpg': 0.2, 'png': 0.6}
+TEMP_SPACE_RESERVE = 256 * 1024 ** 2
 
 # monkey patch ssl for mac
 if platform.system().lower() == 'darwin':
@@ -21,10 +28,11 @@ if platform.system().lower() == 'darwin':
 
 
 def run_ffmpeg(args: List[str]) -> bool:
-    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.log_level]
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.get_job_globals().log_level]
     commands.extend(args)
     try:
-        subprocess.check_output(commands, stderr=subprocess.STDOUT)
+        with roop.profiler.span('ffmpeg', 'subprocess', args=' '.join(args)):
+            subprocess.check_output(commands, stderr=subprocess.STDOUT)
         return True
     except Exception:
         pass
@@ -32,35 +40,47 @@ def run_ffmpeg(args: List[str]) -> bool:
 
 
 def detect_fps(target_path: str) -> float:
-    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=r_frame_rate', '-of', 'default=noprint_wrappers=1:nokey=1', target_path]
-    output = subprocess.check_output(command).decode().strip().split('/')
-    try:
-        numerator, denominator = map(int, output)
-        return numerator / denominator
-    except Exception:
-        pass
+    probe = probe_media(target_path)
+    if probe and probe['fps']:
+        return probe['fps']
     return 30
 
 
 def extract_frames(target_path: str, fps: float = 30) -> bool:
     temp_directory_path = get_temp_directory_path(target_path)
-    temp_frame_quality = roop.globals.temp_frame_quality * 31 // 100
-    return run_ffmpeg(['-hwaccel', 'auto', '-i', target_path, '-q:v', str(temp_frame_quality), '-pix_fmt', 'rgb24', '-vf', 'fps=' + str(fps), os.path.join(temp_directory_path, '%04d.' + roop.globals.temp_frame_format)])
+    temp_frame_quality = roop.globals.get_job_globals().temp_frame_quality * 31 // 100
+    return run_ffmpeg(['-hwaccel', 'auto', '-i', target_path, '-q:v', str(temp_frame_quality), '-pix_fmt', 'rgb24', '-vf', 'fps=' + str(fps), os.path.join(temp_directory_path, '%04d.' + roop.globals.get_job_globals().temp_frame_format)])
+
+
+def get_video_encoder_args() -> List[str]:
+    job_globals = roop.globals.get_job_globals()
+    output_video_quality = (job_globals.output_video_quality + 1) * 51 // 100
+    commands = ['-c:v', job_globals.output_video_encoder]
+    if job_globals.output_video_encoder in ['libx264', 'libx265', 'libvpx']:
+        commands.extend(['-crf', str(output_video_quality)])
+    if job_globals.output_video_encoder in ['h264_nvenc', 'hevc_nvenc']:
+        commands.extend(['-cq', str(output_video_quality)])
+    return commands
 
 
 def create_video(target_path: str, fps: float = 30) -> bool:
     temp_output_path = get_temp_output_path(target_path)
     temp_directory_path = get_temp_directory_path(target_path)
-    output_video_quality = (roop.globals.output_video_quality + 1) * 51 // 100
-    commands = ['-hwaccel', 'auto', '-r', str(fps), '-i', os.path.join(temp_directory_path, '%04d.' + roop.globals.temp_frame_format), '-c:v', roop.globals.output_video_encoder]
-    if roop.globals.output_video_encoder in ['libx264', 'libx265', 'libvpx']:
-        commands.extend(['-crf', str(output_video_quality)])
-    if roop.globals.output_video_encoder in ['h264_nvenc', 'hevc_nvenc']:
-        commands.extend(['-cq', str(output_video_quality)])
+    commands = ['-hwaccel', 'auto', '-r', str(fps), '-i', os.path.join(temp_directory_path, '%04d.' + roop.globals.get_job_globals().temp_frame_format)]
+    commands.extend(get_video_encoder_args())
     commands.extend(['-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1', '-y', temp_output_path])
     return run_ffmpeg(commands)
 
 
+def open_video_writer(output_path: str, width: int, height: int, fps: float, audio_path: Optional[str] = None) -> subprocess.Popen:  # type: ignore[type-arg]
+    commands = ['ffmpeg', '-hide_banner', '-loglevel', roop.globals.get_job_globals().log_level, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+    if audio_path:
+        commands.extend(['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'copy', '-shortest'])
+    commands.extend(get_video_encoder_args())
+    commands.extend(['-pix_fmt', 'yuv420p', '-vf', 'colorspace=bt709:iall=bt601-6-625:fast=1', '-y', output_path])
+    return subprocess.Popen(commands, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
 def restore_audio(target_path: str, output_path: str) -> None:
     temp_output_path = get_temp_output_path(target_path)
     done = run_ffmpeg(['-i', temp_output_path, '-i', target_path, '-c:v', 'copy', '-map', '0:v:0', '-map', '1:a:0', '-y', output_path])
@@ -70,13 +90,37 @@ def restore_audio(target_path: str, output_path: str) -> None:
 
 def get_temp_frame_paths(target_path: str) -> List[str]:
     temp_directory_path = get_temp_directory_path(target_path)
-    return glob.glob((os.path.join(glob.escape(temp_directory_path), '*.' + roop.globals.temp_frame_format)))
+    return glob.glob((os.path.join(glob.escape(temp_directory_path), '*.' + roop.globals.get_job_globals().temp_frame_format)))
+
+
+def has_frame_range() -> bool:
+    return roop.globals.get_job_globals().start_time is not None or roop.globals.get_job_globals().end_time is not None
+
+
+def get_frame_range(fps: float, frame_total: int) -> Tuple[int, int]:
+    job_globals = roop.globals.get_job_globals()
+    start = min(frame_total, max(0, round(job_globals.start_time * fps))) if job_globals.start_time is not None else 0
+    end = min(frame_total, max(start, round(job_globals.end_time * fps))) if job_globals.end_time is not None else frame_total
+    return start, end
+
+
+def filter_frame_paths(temp_frame_paths: List[str], frame_range: Tuple[int, int]) -> List[str]:
+    start, end = frame_range
+    frame_paths = [(int(os.path.splitext(os.path.basename(temp_frame_path))[0]), temp_frame_path) for temp_frame_path in temp_frame_paths]
+    return [temp_frame_path for frame_number, temp_frame_path in sorted(frame_paths) if start < frame_number <= end]
+
+
+def get_temp_root_path(target_path: str) -> str:
+    if roop.globals.get_job_globals().temp_directory:
+        return roop.globals.get_job_globals().temp_directory
+    return os.path.join(os.path.dirname(target_path), TEMP_DIRECTORY)
 
 
 def get_temp_directory_path(target_path: str) -> str:
     target_name, _ = os.path.splitext(os.path.basename(target_path))
-    target_directory_path = os.path.dirname(target_path)
-    return os.path.join(target_directory_path, TEMP_DIRECTORY, target_name)
+    if roop.globals.get_job_globals().job_id:
+        target_name += '-' + roop.globals.get_job_globals().job_id
+    return os.path.join(get_temp_root_path(target_path), target_name)
 
 
 def get_temp_output_path(target_path: str) -> str:
@@ -85,7 +129,7 @@ def get_temp_output_path(target_path: str) -> str:
 
 
 def normalize_output_path(source_path: str, target_path: str, output_path: str) -> Optional[str]:
-    if source_path and target_path and output_path:
+    if source_path and target_path and output_path and not is_bulk_target(target_path):
         source_name, _ = os.path.splitext(os.path.basename(source_path))
         target_name, target_extension = os.path.splitext(os.path.basename(target_path))
         if os.path.isdir(output_path):
@@ -93,9 +137,51 @@ def normalize_output_path(source_path: str, target_path: str, output_path: str)
     return output_path
 
 
+def get_temp_frame_bytes(target_path: str, fps: float) -> int:
+    probe = probe_media(target_path)
+    if not probe or not probe['width'] or not probe['height'] or not probe['duration']:
+        return 0
+    frame_total = probe['duration'] * fps
+    return int(probe['width'] * probe['height'] * 3 * frame_total * TEMP_FRAME_RATIOS.get(roop.globals.get_job_globals().temp_frame_format, 1))
+
+
+def has_temp_space(target_path: str, fps: float) -> bool:
+    temp_root_path = get_temp_root_path(target_path)
+    Path(temp_root_path).mkdir(parents=True, exist_ok=True)
+    return shutil.disk_usage(temp_root_path).free >= get_temp_frame_bytes(target_path, fps) + TEMP_SPACE_RESERVE
+
+
+def get_temp_owner() -> str:
+    process = psutil.Process()
+    return f'{process.pid} {process.create_time()}'
+
+
+def is_temp_owner_alive(temp_owner: str) -> bool:
+    try:
+        pid, create_time = temp_owner.split()
+        return str(psutil.Process(int(pid)).create_time()) == create_time
+    except (ValueError, psutil.Error):
+        return False
+
+
+def clean_stale_temp(temp_root_path: str) -> None:
+    # directories of jobs whose process is gone, such as after a crash
+    for temp_owner_path in glob.glob(os.path.join(glob.escape(temp_root_path), '*', TEMP_OWNER_FILE)):
+        try:
+            with open(temp_owner_path) as temp_owner_file:
+                temp_owner = temp_owner_file.read()
+        except OSError:
+            continue
+        if not is_temp_owner_alive(temp_owner):
+            shutil.rmtree(os.path.dirname(temp_owner_path), ignore_errors=True)
+
+
 def create_temp(target_path: str) -> None:
     temp_directory_path = get_temp_directory_path(target_path)
+    clean_stale_temp(get_temp_root_path(target_path))
     Path(temp_directory_path).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(temp_directory_path, TEMP_OWNER_FILE), 'w') as temp_owner_file:
+        temp_owner_file.write(get_temp_owner())
 
 
 def move_temp(target_path: str, output_path: str) -> None:
@@ -109,10 +195,31 @@ def move_temp(target_path: str, output_path: str) -> None:
 def clean_temp(target_path: str) -> None:
     temp_directory_path = get_temp_directory_path(target_path)
     parent_directory_path = os.path.dirname(temp_directory_path)
-    if not roop.globals.keep_frames and os.path.isdir(temp_directory_path):
+    if not roop.globals.get_job_globals().keep_frames and os.path.isdir(temp_directory_path):
         shutil.rmtree(temp_directory_path)
-    if os.path.exists(parent_directory_path) and not os.listdir(parent_directory_path):
-        os.rmdir(parent_directory_path)
+    elif os.path.isdir(temp_directory_path):
+        from roop.core import update_status
+        temp_owner_path = os.path.join(temp_directory_path, TEMP_OWNER_FILE)
+        # kept frames have no owner, so they are never cleaned as stale
+        if os.path.isfile(temp_owner_path):
+            os.remove(temp_owner_path)
+        update_status(f'Temporary frames kept in {temp_directory_path}')
+    if not roop.globals.get_job_globals().temp_directory and os.path.exists(parent_directory_path) and not os.listdir(parent_directory_path):
+        try:
+            os.rmdir(parent_directory_path)
+        except OSError:
+            pass
+
+
+def is_bulk_target(target_path: str) -> bool:
+    return bool(target_path) and (os.path.isdir(target_path) or target_path.lower().endswith('.txt'))
+
+
+def get_bulk_target_paths(target_path: str) -> List[str]:
+    if os.path.isdir(target_path):
+        return sorted(os.path.join(target_path, name) for name in os.listdir(target_path) if has_image_extension(name))
+    with open(target_path) as target_list_file:
+        return [line.strip() for line in target_list_file if line.strip()]
 
 
 def has_image_extension(image_path: str) -> bool:
@@ -128,6 +235,9 @@ def is_image(image_path: str) -> bool:
 
 def is_video(video_path: str) -> bool:
     if video_path and os.path.isfile(video_path):
+        if has_ffprobe():
+            probe = probe_media(video_path)
+            return bool(probe and probe['is_video'])
         mimetype, _ = mimetypes.guess_type(video_path)
         return bool(mimetype and mimetype.startswith('video/'))
     return False
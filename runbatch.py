@@ -3,12 +3,24 @@
 import os
 import sys
 import glob
+import hashlib
 import subprocess
 import psutil
 import shutil
+import tempfile
 import time
 from pathlib import Path
 
+from check_videos import get_rejected_videos
+from job_queue import POLL_INTERVAL, claim_job, get_job_state, get_partial_directory, hold_lease, publish_output, release_job, reopen_job
+from roop.autotune_profile import load_profile
+
+# Raíz de los frames temporales; puede apuntar a un disco en RAM (tmpfs) o NVMe
+TEMP_ROOT = os.environ.get("ROOP_TEMP_DIRECTORY", os.path.join("inputVideos", "temp"))
+
+# Servidor de inferencia compartido (python run.py --inference-server); sin él cada proceso carga sus modelos
+INFERENCE_URL = os.environ.get("ROOP_INFERENCE_URL")
+
 # Detectar si estamos en Google Colab
 def is_colab():
     """Verificar si se está ejecutando en Google Colab"""
@@ -60,20 +72,25 @@ def download_file_colab(file_path):
         print(f"⚠️ Error en descarga: {e}")
         return False
 
-def get_source_image():
-    """Get the first image from source folder"""
+def get_source_images():
+    """Get all images from source folder"""
     source_folder = "source"
     image_extensions = ["*.jpg", "*.jpeg", "*.png", "*.bmp"]
 
+    images = []
     for ext in image_extensions:
-        images = glob.glob(os.path.join(source_folder, ext))
+        images.extend(glob.glob(os.path.join(source_folder, ext)))
         images.extend(glob.glob(os.path.join(source_folder, ext.upper())))
-        if images:
-            return images[0]
 
-    print("❌ No se encontró imagen de referencia en la carpeta 'source'")
-    print("   Formatos soportados: jpg, jpeg, png, bmp")
-    return None
+    if not images:
+        print("❌ No se encontró imagen de referencia en la carpeta 'source'")
+        print("   Formatos soportados: jpg, jpeg, png, bmp")
+    return sorted(set(images))
+
+def get_source_image():
+    """Get the first image from source folder"""
+    images = get_source_images()
+    return images[0] if images else None
 
 def get_input_videos():
     """Get all videos from inputVideos folder"""
@@ -85,7 +102,13 @@ def get_input_videos():
         videos.extend(glob.glob(os.path.join(input_folder, ext)))
         videos.extend(glob.glob(os.path.join(input_folder, ext.upper())))
 
-    return sorted(videos)
+    # Saltar videos marcados como inválidos por check_videos.py
+    rejected = get_rejected_videos(input_folder)
+    for video in sorted(videos):
+        if Path(video).name in rejected:
+            print(f"🚫 Inválido según check_videos.py: {Path(video).name} - Saltando")
+
+    return sorted(video for video in videos if Path(video).name not in rejected)
 
 def get_memory_usage():
     """Get current memory usage in GB"""
@@ -102,15 +125,17 @@ def get_system_memory_usage():
     except:
         return 0
 
-def clean_temp_frames():
-    """Remove temporary frame folders"""
+def create_temp_directory():
+    """Create a temporary frame folder for one job"""
+    os.makedirs(TEMP_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix="job-", dir=TEMP_ROOT)
+
+def clean_temp_frames(temp_directory):
+    """Remove the temporary frame folder of one job"""
     try:
-        import glob as glob_module
-        temp_folders = glob_module.glob("roop/temp*")
-        for folder in temp_folders:
-            if os.path.isdir(folder):
-                shutil.rmtree(folder)
-                print(f"🧹 Limpiado: {folder}")
+        if os.path.isdir(temp_directory):
+            shutil.rmtree(temp_directory)
+            print(f"🧹 Limpiado: {temp_directory}")
     except:
         pass
 
@@ -139,14 +164,40 @@ def create_output_name(source_image, video_path):
     video_number = extract_video_number(video_path)
     return f"{source_name}_{video_number}.mp4"
 
-def run_face_processing(source_img, input_video, output_video, drive_path=None):
-    """Run the complete face processing pipeline"""
+def sync_output_colab(output_full_path, output_video, drive_path=None):
+    """Guardar una salida en Drive o dejarla lista para descargar"""
+    if drive_path:
+        # Guardar en Google Drive
+        try:
+            if not os.path.exists(drive_path):
+                os.makedirs(drive_path)
+            drive_file = os.path.join(drive_path, output_video)
+            shutil.copy2(output_full_path, drive_file)
+            print(f"☁️ Guardado en Drive: {output_video}")
+        except Exception as e:
+            print(f"⚠️ Error guardando en Drive: {e}")
+            download_file_colab(output_full_path)
+    else:
+        # Descargar o copiar a /content/output
+        download_file_colab(output_full_path)
 
-    print(f"🎬 Procesando: {Path(input_video).name}")
-    print(f"📸 Imagen fuente: {Path(source_img).name}")
-    print(f"💾 Salida: {output_video}")
+def run_face_processing(source_imgs, input_video, output_videos, drive_path=None, lease=None):
+    """Run the complete face processing pipeline, one output per source image; nothing is published once the lease is lost"""
 
-    output_full_path = os.path.join("outputVideos", output_video)
+    print(f"🎬 Procesando: {Path(input_video).name}")
+    print(f"📸 Imágenes fuente: {', '.join(Path(source_img).name for source_img in source_imgs)}")
+    print(f"💾 Salidas: {', '.join(output_videos)}")
+
+    # run.py escribe en una carpeta parcial propia del trabajador y cada salida se publica con un
+    # rename al terminar, así un archivo a medio escribir nunca tiene su nombre final.
+    # Con varias fuentes decodifica y analiza el video una sola vez y escribe source-target.ext
+    partial_directory = get_partial_directory("outputVideos")
+    if len(source_imgs) > 1:
+        output_argument = partial_directory
+        written_paths = [os.path.join(partial_directory, Path(source_img).stem + "-" + Path(input_video).name) for source_img in source_imgs]
+    else:
+        output_argument = os.path.join(partial_directory, output_videos[0])
+        written_paths = [output_argument]
 
     # Verificar proveedores de ejecución disponibles
     try:
@@ -164,24 +215,36 @@ def run_face_processing(source_img, input_video, output_video, drive_path=None):
         execution_provider = "cpu"
         print("⚠️ ONNX Runtime no encontrado, usando CPU")
 
+    # Carpeta temporal propia de este trabajo
+    temp_directory = create_temp_directory()
+
     # Optimized pipeline for T4 GPU (15GB VRAM, 12GB RAM)
     cmd = [
         "python", "run.py",
-        "-s", source_img,
+        "-s", *source_imgs,
         "-t", input_video,
-        "-o", output_full_path,
+        "-o", output_argument,
         "--frame-processor", "face_swapper", "face_enhancer",
-        "--execution-provider", execution_provider,
         "--keep-fps",
         "--many-faces",
         "--max-memory", "11",
-        "--execution-threads", "6" if execution_provider == "cuda" else "1",
         "--output-video-encoder", "h264_nvenc" if execution_provider == "cuda" else "libx264",
         "--output-video-quality", "18",
         "--temp-frame-format", "png",
-        "--temp-frame-quality", "100"
+        "--temp-frame-quality", "100",
+        "--temp-directory", temp_directory
     ]
 
+    # Con un perfil de autotune (python run.py -s ... -t ... --autotune) run.py elige proveedor, hilos y lotes
+    if load_profile():
+        print("🎛️ Usando perfil de autotune de esta máquina")
+    else:
+        cmd += ["--execution-provider", execution_provider]
+
+    if INFERENCE_URL:
+        print(f"🧠 Usando el servidor de inferencia {INFERENCE_URL}")
+        cmd += ["--inference-url", INFERENCE_URL]
+
     print(f"🚀 Comando: {' '.join(cmd)}")
     print("-" * 60)
 
@@ -192,45 +255,54 @@ def run_face_processing(source_img, input_video, output_video, drive_path=None):
         result = subprocess.run(cmd, check=True, capture_output=False)
 
         # Limpieza después del procesamiento
-        clean_temp_frames()
+        clean_temp_frames(temp_directory)
         mem_after = get_system_memory_usage()
         print(f"📊 Memoria después: {mem_after:.1f}GB (diferencia: {mem_after - mem_before:+.1f}GB)")
 
-        # Verificar que el archivo de salida se creó
-        if os.path.exists(output_full_path):
+        # Si otro trabajador tomó el trabajo, sus salidas ganan y las nuestras se descartan
+        if lease is not None and lease.get("lost"):
+            print(f"⚠️ {Path(input_video).name} - el lease se perdió, no se publican las salidas")
+            return 0
+
+        # Verificar que cada archivo de salida se creó
+        completed = 0
+        for written_path, output_video in zip(written_paths, output_videos):
+            output_full_path = os.path.join("outputVideos", output_video)
+            if not os.path.exists(written_path):
+                print(f"❌ El archivo de salida no se creó: {output_full_path}")
+                continue
+            publish_output(written_path, output_full_path)
             file_size = os.path.getsize(output_full_path) / (1024*1024)  # MB
             print(f"✅ Completado: {output_video} ({file_size:.1f} MB)")
+            completed += 1
 
             # Sincronizar en Colab
             if is_colab():
-                if drive_path:
-                    # Guardar en Google Drive
-                    try:
-                        if not os.path.exists(drive_path):
-                            os.makedirs(drive_path)
-                        drive_file = os.path.join(drive_path, output_video)
-                        shutil.copy2(output_full_path, drive_file)
-                        print(f"☁️ Guardado en Drive: {output_video}")
-                    except Exception as e:
-                        print(f"⚠️ Error guardando en Drive: {e}")
-                        download_file_colab(output_full_path)
-                else:
-                    # Descargar o copiar a /content/output
-                    download_file_colab(output_full_path)
+                sync_output_colab(output_full_path, output_video, drive_path)
 
-            return True
-        else:
-            print(f"❌ El archivo de salida no se creó: {output_full_path}")
-            return False
+        return completed
 
     except subprocess.CalledProcessError as e:
         print(f"❌ Error procesando {input_video}: {e}")
-        clean_temp_frames()
-        return False
+        clean_temp_frames(temp_directory)
+        return 0
     except KeyboardInterrupt:
         print(f"\n⚠️ Procesamiento interrumpido por el usuario")
-        clean_temp_frames()
-        return False
+        clean_temp_frames(temp_directory)
+        return 0
+    finally:
+        for written_path in written_paths:
+            if os.path.exists(written_path):
+                os.remove(written_path)
+        try:
+            os.rmdir(partial_directory)
+        except OSError:
+            pass
+
+def get_job_id(input_video, output_videos):
+    """Queue job of one video and the outputs it still has to write"""
+    outputs_hash = hashlib.sha1("\n".join(sorted(output_videos)).encode()).hexdigest()[:8]
+    return f"{Path(input_video).name}-{outputs_hash}"
 
 def main():
     print("🎭 ROOP BATCH PROCESSOR")
@@ -267,9 +339,9 @@ def main():
             os.makedirs(folder)
             print(f"📁 Creada carpeta: {folder}")
 
-    # Obtener imagen de referencia
-    source_image = get_source_image()
-    if not source_image:
+    # Obtener imágenes de referencia (una salida por imagen)
+    source_images = get_source_images()
+    if not source_images:
         return
 
     # Obtener videos de entrada
@@ -279,7 +351,7 @@ def main():
         print("   Formatos soportados: mp4, avi, mov, mkv, wmv")
         return
 
-    print(f"📸 Imagen fuente: {Path(source_image).name}")
+    print(f"📸 Imágenes fuente: {', '.join(Path(source_image).name for source_image in source_images)}")
     print(f"🎬 Videos encontrados: {len(input_videos)}")
 
     # Permitir procesar solo un rango (útil para lotes)
@@ -312,8 +384,8 @@ def main():
 
     # Mostrar lista de videos a procesar
     for i, video in enumerate(input_videos, 1):
-        output_name = create_output_name(source_image, video)
-        print(f"  {i}. {Path(video).name} → {output_name}")
+        output_names = [create_output_name(source_image, video) for source_image in source_images]
+        print(f"  {i}. {Path(video).name} → {', '.join(output_names)}")
 
     # Procesar cada video
     successful = 0
@@ -324,19 +396,57 @@ def main():
     print(f"\n📈 Memoria del sistema disponible: {psutil.virtual_memory().total / (1024**3):.1f}GB")
     print()
 
-    for i, video in enumerate(input_videos, 1):
-        print(f"\n🎯 Procesando video {i}/{len(input_videos)}")
-        output_name = create_output_name(source_image, video)
-
-        # Verificar si ya existe el archivo de salida (auto-skip)
-        output_path = os.path.join("outputVideos", output_name)
-        if os.path.exists(output_path):
-            file_size = os.path.getsize(output_path) / (1024*1024)
-            print(f"⏭️ Ya existe: {output_name} ({file_size:.1f} MB) - Saltando")
-            skipped += 1
+    # Cola compartida: varios procesos o máquinas pueden vaciar la misma carpeta inputVideos.
+    # Los videos en manos de otro trabajador o esperando reintento vuelven al final de la cola
+    queue = list(enumerate(input_videos, 1))
+    blocked = 0
+    while queue:
+        i, video = queue.pop(0)
+        # Verificar qué archivos de salida ya existen (auto-skip)
+        pending_sources = []
+        pending_outputs = []
+        for source_image in source_images:
+            output_name = create_output_name(source_image, video)
+            output_path = os.path.join("outputVideos", output_name)
+            if os.path.exists(output_path):
+                file_size = os.path.getsize(output_path) / (1024*1024)
+                print(f"⏭️ Ya existe: {output_name} ({file_size:.1f} MB) - Saltando")
+                skipped += 1
+            else:
+                pending_sources.append(source_image)
+                pending_outputs.append(output_name)
+        if not pending_sources:
             print("-" * 60)
             continue
 
+        job_id = get_job_id(video, pending_outputs)
+        state, lease = get_job_state(job_id)
+        if state == "done":
+            if all(os.path.exists(os.path.join("outputVideos", output_name)) for output_name in pending_outputs):
+                # Otro trabajador lo terminó mientras mirábamos
+                print(f"⏭️ {Path(video).name} - hecho por otro trabajador")
+                skipped += len(pending_outputs)
+                continue
+            # Terminado antes pero sus salidas se borraron, por ejemplo para regenerarlas
+            reopen_job(lease)
+            state, lease = get_job_state(job_id)
+        if state == "failed":
+            print(f"❌ {Path(video).name} - sin más reintentos ({lease.get('error')})")
+            failed += len(pending_outputs)
+            continue
+        lease = claim_job(job_id) if state == "ready" else None
+        if lease is None:
+            queue.append((i, video))
+            blocked += 1
+            if blocked >= len(queue):
+                # Todo lo que queda lo tiene otro trabajador o espera reintento
+                time.sleep(POLL_INTERVAL)
+                blocked = 0
+            continue
+        blocked = 0
+
+        print(f"\n🎯 Procesando video {i}/{len(input_videos)}")
+
         # Monitorear memoria antes de procesar
         current_mem = get_system_memory_usage()
         total_mem = psutil.virtual_memory().total / (1024**3)
@@ -349,10 +459,22 @@ def main():
             if not wait_for_memory(target_gb=total_mem * 0.5):
                 print("⏱️ Timeout esperando memoria. Continuando de todas formas...")
 
-        if run_face_processing(source_image, video, output_name, drive_path):
-            successful += 1
+        with hold_lease(lease):
+            completed = run_face_processing(pending_sources, video, pending_outputs, drive_path, lease)
+        if lease.get("lost"):
+            # El trabajador que lo tomó se encarga de publicarlo y liberarlo
+            successful += completed
+        elif completed == len(pending_outputs):
+            release_job(lease)
+            successful += completed
         else:
-            failed += 1
+            release_job(lease, f"{len(pending_outputs) - completed} salidas sin crear")
+            successful += completed
+            if get_job_state(job_id)[0] == "failed":
+                failed += len(pending_outputs) - completed
+            else:
+                print(f"🔁 {Path(video).name} se reintentará")
+                queue.append((i, video))
 
         print("-" * 60)
 
@@ -8,14 +8,31 @@ Optimizado para T4 GPU con 15GB VRAM + 12GB RAM
 import os
 import sys
 import glob
+import heapq
+import json
 import subprocess
 import psutil
 import shutil
+import tempfile
 import time
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing import Tuple, Optional
 
+from check_videos import get_rejected_videos
+from job_queue import POLL_INTERVAL, claim_job, get_job_state, get_partial_directory, hold_lease, publish_output, release_job, reopen_job
+from roop.probe import probe_media
+
+# Raíz de los frames temporales; puede apuntar a un disco en RAM (tmpfs) o NVMe
+TEMP_ROOT = os.environ.get("ROOP_TEMP_DIRECTORY", os.path.join("inputVideos", "temp"))
+
+# Servidor de inferencia compartido (python run.py --inference-server); sin él cada proceso carga sus modelos
+INFERENCE_URL = os.environ.get("ROOP_INFERENCE_URL")
+
+# Tiempos medidos de trabajos anteriores, para estimar el coste de los siguientes
+THROUGHPUT_PATH = os.path.join("cache", "batch", "throughput.json")
+THROUGHPUT_SAMPLES_MAX = 50
+
 def get_source_image():
     """Get the first image from source folder"""
     source_folder = "source"
@@ -41,7 +58,82 @@ def get_input_videos():
         videos.extend(glob.glob(os.path.join(input_folder, ext)))
         videos.extend(glob.glob(os.path.join(input_folder, ext.upper())))
 
-    return sorted(videos)
+    # Saltar videos marcados como inválidos por check_videos.py
+    rejected = get_rejected_videos(input_folder)
+    for video in sorted(videos):
+        if Path(video).name in rejected:
+            print(f"🚫 Inválido según check_videos.py: {Path(video).name} - Saltando")
+
+    return sorted(video for video in videos if Path(video).name not in rejected)
+
+def get_video_cost(video_path):
+    """Probe frames and megapixels of a video, the two inputs of its cost"""
+    probe = probe_media(video_path)
+    if not probe or not probe['is_video']:
+        return {"frames": 0, "megapixels": 0}
+    frames = probe['frame_total'] or probe['duration'] * probe['fps']
+    return {"frames": frames, "megapixels": probe['width'] * probe['height'] / 1e6}
+
+def load_throughput(throughput_key):
+    """Load the measured jobs of this provider and worker count"""
+    try:
+        with open(THROUGHPUT_PATH) as f:
+            return json.load(f).get(throughput_key, [])
+    except (OSError, ValueError):
+        return []
+
+def save_throughput(throughput_key, samples):
+    try:
+        with open(THROUGHPUT_PATH) as f:
+            throughput = json.load(f)
+    except (OSError, ValueError):
+        throughput = {}
+    throughput[throughput_key] = samples[-THROUGHPUT_SAMPLES_MAX:]
+    try:
+        os.makedirs(os.path.dirname(THROUGHPUT_PATH), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(THROUGHPUT_PATH), suffix=".tmp")
+        with os.fdopen(file_descriptor, "w") as f:
+            json.dump(throughput, f)
+        os.replace(temp_path, THROUGHPUT_PATH)
+    except OSError:
+        pass
+
+def fit_throughput(samples):
+    """
+    Fit seconds = frames * (per_frame + per_megapixel * megapixels) to measured jobs
+    Returns None until a job has been measured
+    """
+    samples = [sample for sample in samples if sample["frames"] > 0]
+    if not samples:
+        return None
+    if len({round(sample["megapixels"], 2) for sample in samples}) > 1:
+        import numpy
+        features = numpy.array([[sample["frames"], sample["frames"] * sample["megapixels"]] for sample in samples])
+        seconds = numpy.array([sample["seconds"] for sample in samples])
+        per_frame, per_megapixel = numpy.linalg.lstsq(features, seconds, rcond=None)[0]
+        if per_frame >= 0 and per_megapixel >= 0:
+            return float(per_frame), float(per_megapixel)
+    # Con una sola resolución no se separan ambos términos: se reparte el tiempo a partes iguales
+    per_unit = sum(sample["seconds"] for sample in samples) / sum(sample["frames"] * (1 + sample["megapixels"]) for sample in samples)
+    return per_unit, per_unit
+
+def estimate_seconds(cost, model):
+    """Estimated seconds of a job, or its relative cost when nothing has been measured yet"""
+    per_frame, per_megapixel = model or (1, 1)
+    return cost["frames"] * (per_frame + per_megapixel * cost["megapixels"])
+
+def estimate_makespan(busy_seconds, pending_seconds, workers):
+    """Simulate the pool handing pending jobs in order to whichever worker frees up first"""
+    free_at = sorted(busy_seconds + [0] * (workers - len(busy_seconds)))[:workers]
+    heapq.heapify(free_at)
+    for seconds in pending_seconds:
+        heapq.heappush(free_at, heapq.heappop(free_at) + seconds)
+    return max(free_at, default=0)
+
+def format_duration(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes:02d}m"
 
 def get_system_memory_usage():
     """Get total system memory usage in GB"""
@@ -72,28 +164,41 @@ def create_output_name(source_image, video_path):
     video_number = extract_video_number(video_path)
     return f"{source_name}_{video_number}.mp4"
 
-def clean_temp_frames():
-    """Remove temporary frame folders"""
+def create_temp_directory():
+    """Create a temporary frame folder for one job"""
+    os.makedirs(TEMP_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix="job-", dir=TEMP_ROOT)
+
+def clean_temp_frames(temp_directory):
+    """Remove the temporary frame folder of one job, leaving other workers alone"""
     try:
-        import glob as glob_module
-        temp_folders = glob_module.glob("roop/temp*")
-        for folder in temp_folders:
-            if os.path.isdir(folder):
-                shutil.rmtree(folder)
+        if os.path.isdir(temp_directory):
+            shutil.rmtree(temp_directory)
     except:
         pass
 
-def run_face_processing_worker(args: Tuple[str, str, str, str]) -> Tuple[bool, str, str]:
+def run_face_processing_worker(args: Tuple[str, str, str, str]) -> Tuple[bool, str, str, float]:
     """
     Worker function para procesamiento paralelo
-    Returns: (success, output_name, error_message)
+    Returns: (success, output_name, error_message, seconds)
     """
     source_img, input_video, output_video, execution_provider = args
     output_full_path = os.path.join("outputVideos", output_video)
 
     # Verificar si ya existe
     if os.path.exists(output_full_path):
-        return (None, output_video, "skip")
+        return (None, output_video, "skip", 0)
+
+    # Reclamar el trabajo en la cola compartida; otro proceso u otra máquina puede tenerlo ya
+    lease = claim_job(output_video)
+    if lease is None:
+        return (None, output_video, "leased", 0)
+
+    # Carpeta temporal propia de este trabajo y salida parcial que solo se renombra al terminar
+    temp_directory = create_temp_directory()
+    partial_path = os.path.join(get_partial_directory("outputVideos"), output_video)
+    started_at = time.time()
+    status = None
 
     try:
         # Configuración optimizada para T4 (15GB VRAM, 12GB RAM)
@@ -101,7 +206,7 @@ def run_face_processing_worker(args: Tuple[str, str, str, str]) -> Tuple[bool, s
             "python", "run.py",
             "-s", source_img,
             "-t", input_video,
-            "-o", output_full_path,
+            "-o", partial_path,
             "--frame-processor", "face_swapper", "face_enhancer",
             "--execution-provider", execution_provider,
             "--keep-fps",
@@ -111,26 +216,41 @@ def run_face_processing_worker(args: Tuple[str, str, str, str]) -> Tuple[bool, s
             "--output-video-encoder", "h264_nvenc" if execution_provider == "cuda" else "libx264",
             "--output-video-quality", "18",
             "--temp-frame-format", "png",
-            "--temp-frame-quality", "100"
+            "--temp-frame-quality", "100",
+            "--temp-directory", temp_directory
         ]
-
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=3600)
-        clean_temp_frames()
-
-        if os.path.exists(output_full_path):
-            return (True, output_video, "success")
+        if INFERENCE_URL:
+            cmd += ["--inference-url", INFERENCE_URL]
+
+        with hold_lease(lease):
+            result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=3600)
+
+        if lease.get("lost"):
+            status = "lease_lost"
+        elif os.path.exists(partial_path):
+            publish_output(partial_path, output_full_path)
+            release_job(lease)
+            return (True, output_video, "success", time.time() - started_at)
         else:
-            return (False, output_video, "output_not_created")
+            status = "output_not_created"
 
     except subprocess.TimeoutExpired:
-        clean_temp_frames()
-        return (False, output_video, "timeout")
+        status = "timeout"
     except subprocess.CalledProcessError as e:
-        clean_temp_frames()
-        return (False, output_video, f"error: {str(e)[:50]}")
+        status = f"error: {str(e)[:50]}"
     except Exception as e:
-        clean_temp_frames()
-        return (False, output_video, f"exception: {str(e)[:50]}")
+        status = f"exception: {str(e)[:50]}"
+    finally:
+        clean_temp_frames(temp_directory)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        try:
+            os.rmdir(os.path.dirname(partial_path))
+        except OSError:
+            pass
+
+    release_job(lease, status)
+    return (False, output_video, status, time.time() - started_at)
 
 def main():
     print("🎭 ROOP BATCH PROCESSOR - VERSIÓN PARALELA")
@@ -212,7 +332,16 @@ def main():
 
         tasks.append((source_image, video, output_name, execution_provider))
 
-    print(f"📝 Tareas a ejecutar: {len(tasks)}")
+    # Los más largos primero: así ningún trabajador se queda solo al final con un video largo
+    throughput_key = f"{execution_provider}-{parallel_jobs}"
+    throughput_samples = load_throughput(throughput_key)
+    model = fit_throughput(throughput_samples)
+    costs = {task[2]: get_video_cost(task[1]) for task in tasks}
+    tasks.sort(key=lambda task: estimate_seconds(costs[task[2]], model), reverse=True)
+
+    print(f"📝 Tareas a ejecutar: {len(tasks)} (más largas primero)")
+    if model and tasks:
+        print(f"⏳ Tiempo estimado: {format_duration(estimate_makespan([], [estimate_seconds(costs[task[2]], model) for task in tasks], parallel_jobs))}")
     print()
 
     # Ejecutar en paralelo
@@ -223,33 +352,91 @@ def main():
     start_time = time.time()
 
     with ProcessPoolExecutor(max_workers=parallel_jobs) as executor:
-        futures = {executor.submit(run_face_processing_worker, task): task for task in tasks}
+        # Como mucho un trabajo por trabajador en vuelo, así el momento de envío es el de inicio
+        pending = list(tasks)
+        running = {}
+        recheck_at = {}
 
         completed = 0
-        for future in as_completed(futures):
-            completed += 1
-            success, output_name, status = future.result()
-
-            elapsed = time.time() - start_time
-            hours = int(elapsed // 3600)
-            minutes = int((elapsed % 3600) // 60)
-
-            if status == "skip":
-                skipped += 1
-                print(f"[{completed}/{len(tasks)}] ⏭️  {output_name}")
-            elif success:
-                successful += 1
-                file_size = os.path.getsize(os.path.join("outputVideos", output_name)) / (1024*1024)
-                print(f"[{completed}/{len(tasks)}] ✅ {output_name} ({file_size:.1f}MB) - {hours}h {minutes}m")
-            else:
-                failed += 1
-                print(f"[{completed}/{len(tasks)}] ❌ {output_name} - {status}")
-
-            # Mostrar estado de memoria cada 5 videos
-            if completed % 5 == 0:
-                ram_used = get_system_memory_usage()
-                gpu_used = get_gpu_memory_usage()
-                print(f"   💾 RAM: {ram_used:.1f}GB | GPU: {gpu_used:.1f}GB")
+        while pending or running:
+            now = time.time()
+            for task in list(pending):
+                if len(running) >= parallel_jobs:
+                    break
+                if recheck_at.get(task[2], 0) > now:
+                    continue
+                state, lease = get_job_state(task[2])
+                if state == "done" and not os.path.exists(os.path.join("outputVideos", task[2])):
+                    # Terminado antes pero su salida se borró, por ejemplo para regenerarla
+                    reopen_job(lease)
+                    state, lease = get_job_state(task[2])
+                if os.path.exists(os.path.join("outputVideos", task[2])) or state == "done":
+                    # Terminado por otro trabajador de la cola
+                    pending.remove(task)
+                    completed += 1
+                    skipped += 1
+                    print(f"[{completed}/{len(tasks)}] ⏭️  {task[2]} (hecho por otro trabajador)")
+                elif state == "failed":
+                    pending.remove(task)
+                    completed += 1
+                    failed += 1
+                    print(f"[{completed}/{len(tasks)}] ❌ {task[2]} - sin más reintentos ({lease.get('error')})")
+                elif state == "ready":
+                    pending.remove(task)
+                    running[executor.submit(run_face_processing_worker, task)] = (task, now)
+                else:
+                    # En manos de otro trabajador o esperando su reintento
+                    recheck_at[task[2]] = min(lease.get("retry_at") or now + POLL_INTERVAL, now + POLL_INTERVAL)
+
+            if not running:
+                if pending:
+                    time.sleep(POLL_INTERVAL)
+                continue
+
+            done, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, _ = running.pop(future)
+                success, output_name, status, job_seconds = future.result()
+
+                elapsed = time.time() - start_time
+                hours = int(elapsed // 3600)
+                minutes = int((elapsed % 3600) // 60)
+
+                if status in ["leased", "lease_lost"] or (success is False and get_job_state(output_name)[0] in ["waiting", "ready"]):
+                    # Otro trabajador lo reclamó antes, o fallará y se reintenta tras la espera
+                    if status not in ["leased", "lease_lost"]:
+                        print(f"   🔁 {output_name} - {status}, se reintentará")
+                    pending.append(task)
+                    continue
+
+                completed += 1
+                if status == "skip":
+                    skipped += 1
+                    print(f"[{completed}/{len(tasks)}] ⏭️  {output_name}")
+                elif success:
+                    successful += 1
+                    file_size = os.path.getsize(os.path.join("outputVideos", output_name)) / (1024*1024)
+                    print(f"[{completed}/{len(tasks)}] ✅ {output_name} ({file_size:.1f}MB) - {hours}h {minutes}m")
+                    throughput_samples.append({**costs[output_name], "seconds": job_seconds})
+                    save_throughput(throughput_key, throughput_samples)
+                    model = fit_throughput(throughput_samples)
+                else:
+                    failed += 1
+                    print(f"[{completed}/{len(tasks)}] ❌ {output_name} - {status}")
+
+                # ETA: lo que falta de los trabajos en curso más los pendientes repartidos entre los trabajadores
+                if model and completed < len(tasks):
+                    now = time.time()
+                    busy_seconds = [max(0, estimate_seconds(costs[running_task[2]], model) - (now - started)) for running_task, started in running.values()]
+                    pending_seconds = [estimate_seconds(costs[pending_task[2]], model) for pending_task in pending]
+                    remaining = estimate_makespan(busy_seconds, pending_seconds, parallel_jobs)
+                    print(f"   ⏳ ETA: {format_duration(remaining)} (fin ~{time.strftime('%H:%M', time.localtime(now + remaining))})")
+
+                # Mostrar estado de memoria cada 5 videos
+                if completed % 5 == 0:
+                    ram_used = get_system_memory_usage()
+                    gpu_used = get_gpu_memory_usage()
+                    print(f"   💾 RAM: {ram_used:.1f}GB | GPU: {gpu_used:.1f}GB")
 
     elapsed = time.time() - start_time
     hours = int(elapsed // 3600)
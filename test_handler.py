@@ -7,6 +7,11 @@ Simula lo que haría Runpod
 import sys
 import os
 import json
+import re
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
 from pathlib import Path
 
 # Verificar que estamos en el directorio correcto
@@ -21,7 +26,7 @@ print()
 # Test 1: Importar módulos
 print("📋 Test 1: Importando módulos...")
 try:
-    from handler import handler, download_file
+    from handler import handler, download_file, DOWNLOAD_PART_MIN_SIZE
     print("✅ handler.py importado correctamente")
 except ImportError as e:
     print(f"❌ Error importando handler.py: {e}")
@@ -140,6 +145,58 @@ else:
     print("  - source/cara.jpg")
     print("  - inputVideos/video.mp4")
 
+print()
+
+# Test 6: Descargas contra un servidor HTTP local
+print("📋 Test 6: Descargando desde un servidor HTTP local...")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler that answers single byte range requests like S3 does"""
+
+    def send_head(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.range_remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "range_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        outputfile.write(source.read(remaining))
+
+    def log_message(self, format, *args):
+        pass
+
+
+with tempfile.TemporaryDirectory() as serve_dir:
+    payload = os.urandom(DOWNLOAD_PART_MIN_SIZE + 12345)
+    with open(os.path.join(serve_dir, "payload.bin"), "wb") as f:
+        f.write(payload)
+    download_checks = {}
+    for name, request_handler in (("descarga simple", SimpleHTTPRequestHandler), ("descarga por rangos", RangeRequestHandler)):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(request_handler, directory=serve_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        output_file = os.path.join(serve_dir, f"download_{request_handler.__name__}.bin")
+        url = f"http://127.0.0.1:{server.server_address[1]}/payload.bin"
+        ok = download_file(url, output_file, parts=4) and Path(output_file).read_bytes() == payload
+        server.shutdown()
+        download_checks[name] = ok
+        print(f"{'✅' if ok else '❌'} {name.capitalize()}")
+
 print()
 print("=" * 60)
 print("📊 RESUMEN DE DIAGNOSTICO")
@@ -152,6 +209,7 @@ checks = {
     "Carpeta inputVideos": os.path.exists('inputVideos'),
     "Imágenes de prueba": len(test_images) > 0,
     "Videos de prueba": len(test_videos) > 0,
+    "Descargas HTTP": all(download_checks.values()),
 }
 
 for check, status in checks.items():
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests de la cola de trabajos compartida (job_queue.py)
+Ejecutar con: python -m pytest test_job_queue.py
+"""
+
+import os
+import time
+
+import pytest
+
+import job_queue
+
+
+@pytest.fixture(autouse=True)
+def queue_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "QUEUE_DIRECTORY", str(tmp_path / "queue"))
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 60)
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(job_queue, "RETRY_DELAY", 0)
+    return tmp_path
+
+
+def expire(lease):
+    lease["expires_at"] = time.time() - 1
+    job_queue.write_lease(lease, False)
+
+
+def test_new_job_is_ready():
+    assert job_queue.get_job_state("video.mp4") == ("ready", None)
+
+
+def test_only_one_of_two_claimers_wins():
+    first = job_queue.claim_job("video.mp4", "worker-a")
+    second = job_queue.claim_job("video.mp4", "worker-b")
+    assert first["worker"] == "worker-a"
+    assert second is None
+    assert job_queue.get_job_state("video.mp4")[0] == "leased"
+
+
+def test_same_generation_is_written_once():
+    lease = {"job": "video.mp4", "generation": 1, "attempts": 1, "expires_at": time.time() + 60}
+    assert job_queue.write_lease(dict(lease, worker="worker-a"), True)
+    assert not job_queue.write_lease(dict(lease, worker="worker-b"), True)
+    assert job_queue.read_lease("video.mp4", 1)["worker"] == "worker-a"
+
+
+def test_renew_extends_the_lease():
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    lease["expires_at"] = time.time() + 1
+    assert job_queue.renew_lease(lease)
+    assert job_queue.read_lease("video.mp4", 1)["expires_at"] > time.time() + 30
+
+
+def test_expired_lease_is_taken_over():
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    expire(lease)
+    assert job_queue.get_job_state("video.mp4")[0] == "ready"
+    takeover = job_queue.claim_job("video.mp4", "worker-b")
+    assert takeover["generation"] == 2
+    assert takeover["attempts"] == 2
+    assert not job_queue.renew_lease(lease)
+    job_queue.release_job(lease)
+    assert job_queue.get_job_state("video.mp4")[0] == "leased"
+
+
+def test_unreadable_lease_is_held_until_it_is_old():
+    lease_path = job_queue.get_lease_path("video.mp4", 1)
+    os.makedirs(os.path.dirname(lease_path))
+    with open(lease_path, "w") as f:
+        f.write("{")
+    assert job_queue.get_job_state("video.mp4")[0] == "leased"
+    os.utime(lease_path, (time.time() - 120, time.time() - 120))
+    assert job_queue.get_job_state("video.mp4")[0] == "ready"
+
+
+def test_failed_job_waits_for_its_backoff(monkeypatch):
+    monkeypatch.setattr(job_queue, "RETRY_DELAY", 60)
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    job_queue.release_job(lease, "sin salida")
+    state, lease = job_queue.get_job_state("video.mp4")
+    assert state == "waiting"
+    assert lease["error"] == "sin salida"
+    assert job_queue.claim_job("video.mp4", "worker-b") is None
+
+
+def test_job_fails_after_max_attempts():
+    for attempt in range(1, job_queue.MAX_ATTEMPTS + 1):
+        lease = job_queue.claim_job("video.mp4", "worker-a")
+        assert lease["attempts"] == attempt
+        job_queue.release_job(lease, "sin salida")
+    assert job_queue.get_job_state("video.mp4")[0] == "failed"
+    assert job_queue.claim_job("video.mp4", "worker-a") is None
+
+
+def test_released_job_is_done():
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    job_queue.release_job(lease)
+    assert job_queue.get_job_state("video.mp4")[0] == "done"
+    assert job_queue.claim_job("video.mp4", "worker-b") is None
+
+
+def test_done_job_with_missing_output_can_be_reopened():
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    job_queue.release_job(lease)
+    state, lease = job_queue.get_job_state("video.mp4")
+    assert job_queue.reopen_job(lease)
+    assert not job_queue.reopen_job(lease)
+    assert job_queue.get_job_state("video.mp4")[0] == "ready"
+    reclaimed = job_queue.claim_job("video.mp4", "worker-b")
+    assert reclaimed["attempts"] == 1
+    assert job_queue.get_generation("video.mp4") == reclaimed["generation"]
+
+
+def test_hold_lease_marks_a_lost_lease(monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 0.15)
+    lease = job_queue.claim_job("video.mp4", "worker-a")
+    with job_queue.hold_lease(lease):
+        job_queue.write_lease(dict(lease, generation=2, worker="worker-b"), True)
+        time.sleep(0.2)
+    assert lease.get("lost")
+
+
+def test_publish_output_renames_the_partial_file(queue_directory):
+    partial_directory = job_queue.get_partial_directory(str(queue_directory), "worker-a")
+    partial_path = os.path.join(partial_directory, "video.mp4")
+    with open(partial_path, "w") as f:
+        f.write("video")
+    output_path = str(queue_directory / "video.mp4")
+    job_queue.publish_output(partial_path, output_path)
+    assert not os.path.exists(partial_path)
+    assert open(output_path).read() == "video"
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests del plan de tramos de --smart-render (roop/smart_render.py)
+Ejecutar con: python -m pytest test_smart_render.py
+"""
+
+from roop.smart_render import plan_spans
+
+KEYFRAMES = [0, 25, 50, 75]
+FRAME_TOTAL = 100
+FULL_RANGE = (0, FRAME_TOTAL)
+
+
+def test_without_faces_everything_is_copied():
+    assert plan_spans([], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 100, False)]
+
+
+def test_span_with_a_face_is_processed():
+    assert plan_spans([30], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 25, False), (25, 50, True), (50, 100, False)]
+
+
+def test_face_reaching_over_a_keyframe_marks_both_spans():
+    assert plan_spans([48], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 25, False), (25, 75, True), (75, 100, False)]
+
+
+def test_face_one_scan_step_before_a_keyframe_marks_the_next_span():
+    assert plan_spans([45], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 25, False), (25, 75, True), (75, 100, False)]
+
+
+def test_face_one_scan_step_after_a_keyframe_marks_the_previous_span():
+    assert plan_spans([54], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 25, False), (25, 75, True), (75, 100, False)]
+
+
+def test_face_further_from_a_keyframe_leaves_the_neighbour_copied():
+    assert plan_spans([56], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 50, False), (50, 75, True), (75, 100, False)]
+
+
+def test_face_in_the_first_frames_does_not_go_below_zero():
+    assert plan_spans([0], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 25, True), (25, 100, False)]
+
+
+def test_face_in_the_last_span_reaches_the_end():
+    assert plan_spans([99], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 75, False), (75, 100, True)]
+
+
+def test_faces_everywhere_give_a_single_processed_span():
+    assert plan_spans([10, 30, 60, 90], 5, KEYFRAMES, FRAME_TOTAL, FULL_RANGE) == [(0, 100, True)]
+
+
+def test_keyframes_outside_the_video_are_ignored():
+    assert plan_spans([30], 5, [0, 0, 50, 100, 120], FRAME_TOTAL, FULL_RANGE) == [(0, 50, True), (50, 100, False)]
+
+
+def test_without_keyframes_the_whole_video_is_one_span():
+    assert plan_spans([30], 5, [], FRAME_TOTAL, FULL_RANGE) == [(0, 100, True)]
+
+
+def test_without_a_scan_the_frame_range_is_processed():
+    assert plan_spans(None, 5, KEYFRAMES, FRAME_TOTAL, (30, 60)) == [(0, 25, False), (25, 75, True), (75, 100, False)]
+
+
+def test_frame_range_ending_on_a_keyframe_keeps_the_next_span_copied():
+    assert plan_spans(None, 5, KEYFRAMES, FRAME_TOTAL, (25, 50)) == [(0, 25, False), (25, 50, True), (50, 100, False)]
+
+
+def test_faces_outside_the_frame_range_are_copied():
+    assert plan_spans([10, 80], 5, KEYFRAMES, FRAME_TOTAL, (0, 50)) == [(0, 25, True), (25, 100, False)]